@@ -105,6 +105,7 @@ class Manifest(BaseAPISignedData):
         def type_schemas(self):
             return {
                 "file_manifest": FileManifest.SCHEMA_CLS,
+                "sparse_file_manifest": FileManifest.SCHEMA_CLS,
                 "folder_manifest": FolderManifest.SCHEMA_CLS,
                 "workspace_manifest": WorkspaceManifest.SCHEMA_CLS,
                 "user_manifest": UserManifest.SCHEMA_CLS,
@@ -165,7 +166,11 @@ class FolderManifest(VerifyParentMixin, Manifest):
 
 class FileManifest(VerifyParentMixin, Manifest):
     class SCHEMA_CLS(BaseSignedDataSchema):
-        type = fields.CheckedConstant("file_manifest", required=True)
+        # A sparse manifest omits the blocks that are holes, hence its distinct
+        # type rejected by the clients that expect an access for each block
+        type = fields.String(
+            required=True, validate=validate.OneOf(("file_manifest", "sparse_file_manifest"))
+        )
         id = EntryIDField(required=True)
         parent = EntryIDField(required=True)
         # Version 0 means the data is not synchronized (hence author sould be None)
@@ -190,6 +195,12 @@ class FileManifest(VerifyParentMixin, Manifest):
     blocksize: int
     blocks: Tuple[BlockAccess]
 
+    @property
+    def type(self) -> str:
+        if len(self.blocks) < -(-self.size // self.blocksize):
+            return "sparse_file_manifest"
+        return "file_manifest"
+
 
 class WorkspaceManifest(Manifest):
     class SCHEMA_CLS(BaseSignedDataSchema):
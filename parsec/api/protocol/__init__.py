@@ -39,7 +39,11 @@ from parsec.api.protocol.organization import (
     organization_status_serializer,
     organization_update_serializer,
 )
-from parsec.api.protocol.events import events_subscribe_serializer, events_listen_serializer
+from parsec.api.protocol.events import (
+    events_subscribe_serializer,
+    events_listen_serializer,
+    events_listen_batch_serializer,
+)
 from parsec.api.protocol.ping import ping_serializer
 from parsec.api.protocol.user import (
     user_get_serializer,
@@ -70,10 +74,16 @@ from parsec.api.protocol.realm import (
     realm_start_reencryption_maintenance_serializer,
     realm_finish_reencryption_maintenance_serializer,
 )
-from parsec.api.protocol.block import block_create_serializer, block_read_serializer
+from parsec.api.protocol.block import (
+    block_create_serializer,
+    block_create_batch_serializer,
+    block_read_serializer,
+    block_read_batch_serializer,
+)
 from parsec.api.protocol.vlob import (
     vlob_create_serializer,
     vlob_read_serializer,
+    vlob_read_batch_serializer,
     vlob_update_serializer,
     vlob_poll_changes_serializer,
     vlob_list_versions_serializer,
@@ -120,6 +130,7 @@ __all__ = (
     # Events
     "events_subscribe_serializer",
     "events_listen_serializer",
+    "events_listen_batch_serializer",
     # Ping
     "ping_serializer",
     # User
@@ -153,6 +164,7 @@ __all__ = (
     # Vlob
     "vlob_create_serializer",
     "vlob_read_serializer",
+    "vlob_read_batch_serializer",
     "vlob_update_serializer",
     "vlob_poll_changes_serializer",
     "vlob_list_versions_serializer",
@@ -160,7 +172,9 @@ __all__ = (
     "vlob_maintenance_save_reencryption_batch_serializer",
     # Block
     "block_create_serializer",
+    "block_create_batch_serializer",
     "block_read_serializer",
+    "block_read_batch_serializer",
     # List of cmds
     "AUTHENTICATED_CMDS",
     "ANONYMOUS_CMDS",
@@ -1,10 +1,18 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) AGPLv3 2019 Scille SAS
 
-from parsec.serde import fields
+from parsec.serde import BaseSchema, fields, validate
 from parsec.api.protocol.base import BaseReqSchema, BaseRepSchema, CmdSerializer
 
 
-__all__ = ("block_create_serializer", "block_read_serializer")
+__all__ = (
+    "block_create_serializer",
+    "block_create_batch_serializer",
+    "block_read_serializer",
+    "block_read_batch_serializer",
+)
+
+
+_validate_batch_length = validate.Length(min=1, max=1000)
 
 
 class BlockCreateReqSchema(BaseReqSchema):
@@ -20,6 +28,32 @@ class BlockCreateRepSchema(BaseRepSchema):
 block_create_serializer = CmdSerializer(BlockCreateReqSchema, BlockCreateRepSchema)
 
 
+class BlockCreateBatchItemReqSchema(BaseSchema):
+    block_id = fields.UUID(required=True)
+    block = fields.Bytes(required=True)
+
+
+class BlockCreateBatchItemRepSchema(BaseSchema):
+    # Per-block status (`ok`, `already_exists` or `timeout`), the realm related
+    # errors being reported by the status of the whole response
+    status = fields.String(required=True)
+
+
+class BlockCreateBatchReqSchema(BaseReqSchema):
+    realm_id = fields.UUID(required=True)
+    blocks = fields.List(
+        fields.Nested(BlockCreateBatchItemReqSchema), required=True, validate=_validate_batch_length
+    )
+
+
+class BlockCreateBatchRepSchema(BaseRepSchema):
+    # Results are provided in the same order than the requested blocks
+    items = fields.List(fields.Nested(BlockCreateBatchItemRepSchema), required=True)
+
+
+block_create_batch_serializer = CmdSerializer(BlockCreateBatchReqSchema, BlockCreateBatchRepSchema)
+
+
 class BlockReadReqSchema(BaseReqSchema):
     block_id = fields.UUID(required=True)
 
@@ -29,3 +63,22 @@ class BlockReadRepSchema(BaseRepSchema):
 
 
 block_read_serializer = CmdSerializer(BlockReadReqSchema, BlockReadRepSchema)
+
+
+class BlockReadBatchItemRepSchema(BaseSchema):
+    # Same status than the `block_read` command, the block is only
+    # provided when the status is `ok`
+    status = fields.String(required=True)
+    block = fields.Bytes(missing=None)
+
+
+class BlockReadBatchReqSchema(BaseReqSchema):
+    block_ids = fields.List(fields.UUID(), required=True, validate=_validate_batch_length)
+
+
+class BlockReadBatchRepSchema(BaseRepSchema):
+    # Results are provided in the same order than the requested blocks
+    items = fields.List(fields.Nested(BlockReadBatchItemRepSchema), required=True)
+
+
+block_read_batch_serializer = CmdSerializer(BlockReadBatchReqSchema, BlockReadBatchRepSchema)
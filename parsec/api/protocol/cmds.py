@@ -4,6 +4,7 @@
 AUTHENTICATED_CMDS = {
     "events_subscribe",
     "events_listen",
+    "events_listen_batch",
     "ping",
     # Message
     "message_get",
@@ -21,11 +22,14 @@ AUTHENTICATED_CMDS = {
     "human_find",
     # Block
     "block_create",
+    "block_create_batch",
     "block_read",
+    "block_read_batch",
     # Vlob
     "vlob_poll_changes",
     "vlob_create",
     "vlob_read",
+    "vlob_read_batch",
     "vlob_update",
     "vlob_list_versions",
     "vlob_maintenance_get_reencryption_batch",
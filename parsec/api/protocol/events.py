@@ -1,6 +1,6 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) AGPLv3 2019 Scille SAS
 
-from parsec.serde import OneOfSchema, fields, validate
+from parsec.serde import BaseSchema, OneOfSchema, fields, validate
 from parsec.api.protocol.base import BaseReqSchema, BaseRepSchema, CmdSerializer
 from parsec.api.protocol.realm import RealmRoleField
 
@@ -15,21 +15,18 @@ EVENTS = (
 )
 
 
-class EventsPingedRepSchema(BaseRepSchema):
-    status = fields.CheckedConstant("ok", required=True)
+class EventsPingedSchema(BaseSchema):
     event = fields.CheckedConstant("pinged", required=True)
     ping = fields.String(validate=validate.Length(max=64), required=True)
 
 
-class EventsRealmRolesUpdatedRepSchema(BaseRepSchema):
-    status = fields.CheckedConstant("ok", required=True)
+class EventsRealmRolesUpdatedSchema(BaseSchema):
     event = fields.CheckedConstant("realm.roles_updated", required=True)
     realm_id = fields.UUID(required=True)
     role = RealmRoleField(required=True, allow_none=True)
 
 
-class EventsRealmVlobsUpdatedRepSchema(BaseRepSchema):
-    status = fields.CheckedConstant("ok", required=True)
+class EventsRealmVlobsUpdatedSchema(BaseSchema):
     event = fields.CheckedConstant("realm.vlobs_updated", required=True)
     realm_id = fields.UUID(required=True)
     checkpoint = fields.Integer(required=True)
@@ -37,26 +34,47 @@ class EventsRealmVlobsUpdatedRepSchema(BaseRepSchema):
     src_version = fields.Integer(required=True)
 
 
-class EventsRealmMaintenanceStartedRepSchema(BaseRepSchema):
-    status = fields.CheckedConstant("ok", required=True)
+class EventsRealmMaintenanceStartedSchema(BaseSchema):
     event = fields.CheckedConstant("realm.maintenance_started", required=True)
     realm_id = fields.UUID(required=True)
     encryption_revision = fields.Integer(required=True)
 
 
-class EventsRealmMaintenanceFinishedRepSchema(BaseRepSchema):
-    status = fields.CheckedConstant("ok", required=True)
+class EventsRealmMaintenanceFinishedSchema(BaseSchema):
     event = fields.CheckedConstant("realm.maintenance_finished", required=True)
     realm_id = fields.UUID(required=True)
     encryption_revision = fields.Integer(required=True)
 
 
-class EventsMessageReceivedRepSchema(BaseRepSchema):
-    status = fields.CheckedConstant("ok", required=True)
+class EventsMessageReceivedSchema(BaseSchema):
     event = fields.CheckedConstant("message.received", required=True)
     index = fields.Integer(required=True)
 
 
+class EventsPingedRepSchema(BaseRepSchema, EventsPingedSchema):
+    status = fields.CheckedConstant("ok", required=True)
+
+
+class EventsRealmRolesUpdatedRepSchema(BaseRepSchema, EventsRealmRolesUpdatedSchema):
+    status = fields.CheckedConstant("ok", required=True)
+
+
+class EventsRealmVlobsUpdatedRepSchema(BaseRepSchema, EventsRealmVlobsUpdatedSchema):
+    status = fields.CheckedConstant("ok", required=True)
+
+
+class EventsRealmMaintenanceStartedRepSchema(BaseRepSchema, EventsRealmMaintenanceStartedSchema):
+    status = fields.CheckedConstant("ok", required=True)
+
+
+class EventsRealmMaintenanceFinishedRepSchema(BaseRepSchema, EventsRealmMaintenanceFinishedSchema):
+    status = fields.CheckedConstant("ok", required=True)
+
+
+class EventsMessageReceivedRepSchema(BaseRepSchema, EventsMessageReceivedSchema):
+    status = fields.CheckedConstant("ok", required=True)
+
+
 class EventsListenReqSchema(BaseReqSchema):
     wait = fields.Boolean(missing=True)
 
@@ -80,6 +98,43 @@ class EventsListenRepSchema(OneOfSchema):
 events_listen_serializer = CmdSerializer(EventsListenReqSchema, EventsListenRepSchema)
 
 
+EVENTS_LISTEN_BATCH_MAX_EVENTS = 1000
+
+
+class EventSchema(OneOfSchema):
+    type_field = "event"
+    type_field_remove = False
+    type_schemas = {
+        "pinged": EventsPingedSchema(),
+        "realm.roles_updated": EventsRealmRolesUpdatedSchema(),
+        "realm.vlobs_updated": EventsRealmVlobsUpdatedSchema(),
+        "realm.maintenance_started": EventsRealmMaintenanceStartedSchema(),
+        "realm.maintenance_finished": EventsRealmMaintenanceFinishedSchema(),
+        "message.received": EventsMessageReceivedSchema(),
+    }
+
+    def get_obj_type(self, obj):
+        return obj["event"]
+
+
+class EventsListenBatchReqSchema(BaseReqSchema):
+    wait = fields.Boolean(missing=True)
+    max_events = fields.Integer(
+        validate=validate.Range(min=1, max=EVENTS_LISTEN_BATCH_MAX_EVENTS), missing=100
+    )
+
+
+class EventsListenBatchRepSchema(BaseRepSchema):
+    events = fields.List(fields.Nested(EventSchema), required=True)
+    # Some events have been dropped given the client didn't keep up with them
+    overflow = fields.Boolean(required=True)
+
+
+events_listen_batch_serializer = CmdSerializer(
+    EventsListenBatchReqSchema, EventsListenBatchRepSchema
+)
+
+
 class EventsSubscribeReqSchema(BaseReqSchema):
     pass
 
@@ -11,6 +11,12 @@ from parsec.api.protocol.types import OrganizationIDField, DeviceIDField
 from parsec.api.version import ApiVersion, API_VERSION
 
 
+# Requests pipelining is an extension introduced in API 1.3: once negotiated,
+# requests and replies are tagged with a `req_id` field and the backend
+# processes multiple requests concurrently on the connection.
+PIPELINING_API_VERSION = ApiVersion(version=1, revision=3)
+
+
 class HandshakeError(ProtocolError):
     pass
 
@@ -94,6 +100,8 @@ class HandshakeAuthenticatedAnswerSchema(BaseSchema):
     device_id = DeviceIDField(required=True)
     rvk = fields.VerifyKey(required=True)
     answer = fields.Bytes(required=True)
+    # Max number of in-flight requests the client wants to pipeline
+    pipelining = fields.Integer(validate=validate.Range(min=0), missing=0)
 
 
 class HandshakeAnonymousAnswerSchema(BaseSchema):
@@ -132,6 +140,8 @@ class HandshakeResultSchema(BaseSchema):
     handshake = fields.CheckedConstant("result", required=True)
     result = fields.String(required=True)
     help = fields.String(missing=None)
+    # Max number of in-flight requests accepted by the backend
+    pipelining = fields.Integer(validate=validate.Range(min=0), missing=0)
 
 
 handshake_result_serializer = serializer_factory(HandshakeResultSchema)
@@ -152,6 +162,9 @@ class ServerHandshake:
     client_api_version = attr.ib(default=None)
     backend_api_version = attr.ib(default=None)
 
+    # Requests pipelining (0 if disabled)
+    pipelining = attr.ib(default=0)
+
     # State
     state = attr.ib(default="stalled")
 
@@ -181,6 +194,7 @@ class ServerHandshake:
 
         data.pop("handshake")
         self.answer_type = data.pop("type")
+        self.pipelining = data.pop("pipelining", 0)
         self.answer_data = data
         self.state = "answer"
 
@@ -248,7 +262,7 @@ class ServerHandshake:
             {"handshake": "result", "result": "revoked_device", "help": help}
         )
 
-    def build_result_req(self, verify_key=None) -> bytes:
+    def build_result_req(self, verify_key=None, max_pipelining: int = 0) -> bytes:
         if not self.state == "answer":
             raise HandshakeError("Invalid state.")
 
@@ -267,7 +281,12 @@ class ServerHandshake:
                 raise HandshakeFailedChallenge("Invalid answer signature") from exc
 
         self.state = "result"
-        return handshake_result_serializer.dumps({"handshake": "result", "result": "ok"})
+        self.pipelining = min(self.pipelining, max_pipelining)
+        result = {"handshake": "result", "result": "ok"}
+        if self.pipelining:
+            # Only provided if requested, older clients don't know about it
+            result["pipelining"] = self.pipelining
+        return handshake_result_serializer.dumps(result)
 
 
 @attr.s
@@ -282,6 +301,10 @@ class BaseClientHandshake:
     backend_api_version = attr.ib(default=None)
     client_api_version = attr.ib(default=None)
 
+    # Requests pipelining: max number of in-flight requests wanted before
+    # the handshake, then the value accepted by the backend (0 if disabled)
+    pipelining = 0
+
     def load_challenge_req(self, req: bytes):
         self.challenge_data = handshake_challenge_serializer.loads(req)
 
@@ -314,6 +337,8 @@ class BaseClientHandshake:
                     f"Bad `result` handshake: {data['result']} ({data['help']})"
                 )
 
+        self.pipelining = data["pipelining"]
+
 
 @attr.s
 class AuthenticatedClientHandshake(BaseClientHandshake):
@@ -325,21 +350,24 @@ class AuthenticatedClientHandshake(BaseClientHandshake):
     challenge_data = attr.ib(default=None)
     backend_api_version = attr.ib(default=None)
     client_api_version = attr.ib(default=None)
+    pipelining = attr.ib(default=0)
 
     def process_challenge_req(self, req: bytes) -> bytes:
         self.load_challenge_req(req)
         answer = self.user_signkey.sign(self.challenge_data["challenge"])
-        return handshake_answer_serializer.dumps(
-            {
-                "handshake": "answer",
-                "type": "authenticated",
-                "client_api_version": self.client_api_version,
-                "organization_id": self.organization_id,
-                "device_id": self.device_id,
-                "rvk": self.root_verify_key,
-                "answer": answer,
-            }
-        )
+        answer_req = {
+            "handshake": "answer",
+            "type": "authenticated",
+            "client_api_version": self.client_api_version,
+            "organization_id": self.organization_id,
+            "device_id": self.device_id,
+            "rvk": self.root_verify_key,
+            "answer": answer,
+        }
+        # Don't bother backends that don't know about pipelining
+        if self.pipelining and self.backend_api_version >= PIPELINING_API_VERSION:
+            answer_req["pipelining"] = self.pipelining
+        return handshake_answer_serializer.dumps(answer_req)
 
 
 @attr.s
@@ -8,6 +8,7 @@ from parsec.api.protocol.types import DeviceIDField
 __all__ = (
     "vlob_create_serializer",
     "vlob_read_serializer",
+    "vlob_read_batch_serializer",
     "vlob_update_serializer",
     "vlob_poll_changes_serializer",
     "vlob_list_versions_serializer",
@@ -57,6 +58,38 @@ class VlobReadRepSchema(BaseRepSchema):
 vlob_read_serializer = CmdSerializer(VlobReadReqSchema, VlobReadRepSchema)
 
 
+class VlobReadBatchItemReqSchema(BaseSchema):
+    vlob_id = fields.UUID(required=True)
+    version = fields.Integer(validate=lambda n: n is None or _validate_version(n), missing=None)
+    timestamp = fields.DateTime(allow_none=True, missing=None)
+
+
+class VlobReadBatchItemRepSchema(BaseSchema):
+    # Same status than the `vlob_read` command, the other fields are only
+    # provided when the status is `ok`
+    status = fields.String(required=True)
+    reason = fields.String(allow_none=True, missing=None)
+    version = fields.Integer(validate=_validate_version, missing=None)
+    blob = fields.Bytes(missing=None)
+    author = DeviceIDField(missing=None)
+    timestamp = fields.DateTime(missing=None)
+
+
+class VlobReadBatchReqSchema(BaseReqSchema):
+    encryption_revision = fields.Integer(required=True)
+    items = fields.List(
+        fields.Nested(VlobReadBatchItemReqSchema), required=True, validate=validate.Length(max=1000)
+    )
+
+
+class VlobReadBatchRepSchema(BaseRepSchema):
+    # Results are provided in the same order than the requested items
+    items = fields.List(fields.Nested(VlobReadBatchItemRepSchema), required=True)
+
+
+vlob_read_batch_serializer = CmdSerializer(VlobReadBatchReqSchema, VlobReadBatchRepSchema)
+
+
 class VlobUpdateReqSchema(BaseReqSchema):
     encryption_revision = fields.Integer(required=True)
     vlob_id = fields.UUID(required=True)
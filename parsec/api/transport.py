@@ -41,6 +41,11 @@ class Transport:
         self.logger = logger.bind(conn_id=self.conn_id)
         self._ws_events = ws.events()
         self._handshake = None
+        # Replies to pings are sent while receiving, hence concurrent sends
+        # can occur when the transport is shared by pipelined requests
+        self._send_lock = trio.Lock()
+        # Kept between calls so a cancelled `recv` doesn't lose partial messages
+        self._recv_data = bytearray()
 
     # Application handshake interface
     # TODO: Investigate a better place for providing an access to the peer API version
@@ -88,7 +93,8 @@ class Transport:
 
     async def _net_send(self, wsmsg):
         try:
-            await self.stream.send_all(self.ws.send(wsmsg))
+            async with self._send_lock:
+                await self.stream.send_all(self.ws.send(wsmsg))
 
         except BrokenResourceError as exc:
             raise TransportError(*exc.args) from exc
@@ -162,7 +168,6 @@ class Transport:
         Raises:
             TransportError
         """
-        data = bytearray()
         while True:
             if self.keepalive:
                 with trio.move_on_after(self.keepalive) as cancel_scope:
@@ -186,8 +191,10 @@ class Transport:
             elif isinstance(event, BytesMessage):
                 # TODO: check that data doesn't go over MAX_BIN_LEN (1 MB)
                 # Msgpack will refuse to unpack it so we should fail early on if that happens
-                data += event.data
+                self._recv_data += event.data
                 if event.message_finished:
+                    data = self._recv_data
+                    self._recv_data = bytearray()
                     return data
 
             elif isinstance(event, Ping):
@@ -46,6 +46,12 @@ class LoggedClientContext:
     logger = attr.ib(init=False)
     channels = attr.ib(factory=lambda: trio.open_memory_channel(100))
     realms = attr.ib(factory=set)
+    # Set when events have been dropped given the channel was full
+    events_overflow = attr.ib(default=False)
+    # Once the client listens events by batch, `realm.vlobs_updated` events
+    # waiting in the channel are coalesced by (realm_id, src_id)
+    coalesce_events = attr.ib(default=False)
+    pending_vlobs_updated = attr.ib(factory=dict)
 
     def __repr__(self):
         return (
@@ -256,7 +262,9 @@ class BackendApp:
                             user.public_key,
                             device.verify_key,
                         )
-                        result_req = handshake.build_result_req(device.verify_key)
+                        result_req = handshake.build_result_req(
+                            device.verify_key, max_pipelining=self.config.max_pipelined_requests
+                        )
 
             elif handshake.answer_type == "anonymous":
                 organization_id = handshake.answer_data["organization_id"]
@@ -374,10 +382,13 @@ class BackendApp:
                                 cancel_scope.cancel()
 
                         client_ctx.event_bus_ctx.connect("user.revoked", _on_revoked)
-                        await self._handle_client_loop(transport, client_ctx)
+                        try:
+                            await self._run_client_loop(transport, client_ctx)
+                        finally:
+                            self.events.unsubscribe(client_ctx)
 
             else:
-                await self._handle_client_loop(transport, client_ctx)
+                await self._run_client_loop(transport, client_ctx)
 
             await transport.aclose()
 
@@ -393,6 +404,12 @@ class BackendApp:
             await transport.aclose()
             selected_logger.info("Connection dropped: invalid data", reason=str(exc))
 
+    async def _run_client_loop(self, transport, client_ctx):
+        if transport.handshake.pipelining:
+            await self._handle_client_pipelined_loop(transport, client_ctx)
+        else:
+            await self._handle_client_loop(transport, client_ctx)
+
     async def _handle_client_loop(self, transport, client_ctx):
         raw_req = None
         while True:
@@ -400,49 +417,77 @@ class BackendApp:
             # while processing a command
             raw_req = raw_req or await transport.recv()
             req = unpackb(raw_req)
-            if get_log_level() <= LOG_LEVEL_DEBUG:
-                client_ctx.logger.debug("Request", req=_filter_binary_fields(req))
             try:
-                cmd = req.get("cmd", "<missing>")
-                if not isinstance(cmd, str):
-                    raise KeyError()
+                rep = await self._process_req(client_ctx, req)
 
-                if isinstance(client_ctx, AdministrationClientContext):
-                    cmd_func = self.administration_cmds[cmd]
+            except CancelledByNewRequest as exc:
+                # Long command handling such as message_get can be cancelled
+                # when the peer send a new request
+                raw_req = exc.new_raw_req
+                continue
 
-                elif isinstance(client_ctx, LoggedClientContext):
-                    cmd_func = self.logged_cmds[cmd]
+            raw_rep = packb(rep)
+            await transport.send(raw_rep)
+            raw_req = None
 
-                else:
-                    cmd_func = self.anonymous_cmds[cmd]
+    async def _handle_client_pipelined_loop(self, transport, client_ctx):
+        # With pipelining, requests are processed concurrently (up to the limit
+        # negotiated during handshake) and replies are sent as soon as they are
+        # ready, the `req_id` field allowing the client to match them
+        in_flight = trio.Semaphore(transport.handshake.pipelining)
+
+        async def _process_pipelined_req(req_id, req):
+            try:
+                rep = await self._process_req(client_ctx, req)
+                raw_rep = packb({**rep, "req_id": req_id})
+                await transport.send(raw_rep)
+            finally:
+                in_flight.release()
+
+        async with trio.open_service_nursery() as nursery:
+            while True:
+                raw_req = await transport.recv()
+                req = unpackb(raw_req)
+                req_id = req.pop("req_id", None)
+                await in_flight.acquire()
+                nursery.start_soon(_process_pipelined_req, req_id, req)
+
+    async def _process_req(self, client_ctx, req: dict) -> dict:
+        """
+        Raises:
+            CancelledByNewRequest
+        """
+        if get_log_level() <= LOG_LEVEL_DEBUG:
+            client_ctx.logger.debug("Request", req=_filter_binary_fields(req))
+        try:
+            cmd = req.get("cmd", "<missing>")
+            if not isinstance(cmd, str):
+                raise KeyError()
 
-            except KeyError:
-                rep = {"status": "unknown_command", "reason": "Unknown command"}
+            if isinstance(client_ctx, AdministrationClientContext):
+                cmd_func = self.administration_cmds[cmd]
+
+            elif isinstance(client_ctx, LoggedClientContext):
+                cmd_func = self.logged_cmds[cmd]
 
             else:
-                try:
-                    rep = await cmd_func(client_ctx, req)
+                cmd_func = self.anonymous_cmds[cmd]
 
-                except InvalidMessageError as exc:
-                    rep = {
-                        "status": "bad_message",
-                        "errors": exc.errors,
-                        "reason": "Invalid message.",
-                    }
+        except KeyError:
+            rep = {"status": "unknown_command", "reason": "Unknown command"}
 
-                except ProtocolError as exc:
-                    rep = {"status": "bad_message", "reason": str(exc)}
+        else:
+            try:
+                rep = await cmd_func(client_ctx, req)
 
-                except CancelledByNewRequest as exc:
-                    # Long command handling such as message_get can be cancelled
-                    # when the peer send a new request
-                    raw_req = exc.new_raw_req
-                    continue
+            except InvalidMessageError as exc:
+                rep = {"status": "bad_message", "errors": exc.errors, "reason": "Invalid message."}
 
-            if get_log_level() <= LOG_LEVEL_DEBUG:
-                client_ctx.logger.debug("Response", rep=_filter_binary_fields(req))
-            else:
-                client_ctx.logger.info("Request", cmd=cmd, status=rep["status"])
-            raw_rep = packb(rep)
-            await transport.send(raw_rep)
-            raw_req = None
+            except ProtocolError as exc:
+                rep = {"status": "bad_message", "reason": str(exc)}
+
+        if get_log_level() <= LOG_LEVEL_DEBUG:
+            client_ctx.logger.debug("Response", rep=_filter_binary_fields(req))
+        else:
+            client_ctx.logger.info("Request", cmd=cmd, status=rep["status"])
+        return rep
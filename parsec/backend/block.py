@@ -1,9 +1,15 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) AGPLv3 2019 Scille SAS
 
 from uuid import UUID
+from typing import List, Tuple, Optional, Union
 
 from parsec.api.protocol import DeviceID, OrganizationID
-from parsec.api.protocol import block_create_serializer, block_read_serializer
+from parsec.api.protocol import (
+    block_create_serializer,
+    block_create_batch_serializer,
+    block_read_serializer,
+    block_read_batch_serializer,
+)
 from parsec.backend.utils import catch_protocol_errors
 
 
@@ -31,6 +37,21 @@ class BlockInMaintenanceError(BlockError):
     pass
 
 
+def _block_error_to_rep(exc: BlockError) -> dict:
+    if isinstance(exc, BlockAlreadyExistsError):
+        return {"status": "already_exists"}
+    elif isinstance(exc, BlockNotFoundError):
+        return {"status": "not_found"}
+    elif isinstance(exc, BlockTimeoutError):
+        return {"status": "timeout"}
+    elif isinstance(exc, BlockAccessError):
+        return {"status": "not_allowed"}
+    elif isinstance(exc, BlockInMaintenanceError):
+        return {"status": "in_maintenance"}
+    else:
+        raise exc
+
+
 class BaseBlockComponent:
     @catch_protocol_errors
     async def api_block_read(self, client_ctx, msg):
@@ -53,6 +74,23 @@ class BaseBlockComponent:
 
         return block_read_serializer.rep_dump({"status": "ok", "block": block})
 
+    @catch_protocol_errors
+    async def api_block_read_batch(self, client_ctx, msg):
+        msg = block_read_batch_serializer.req_load(msg)
+
+        results = await self.read_batch(
+            client_ctx.organization_id, client_ctx.device_id, msg["block_ids"]
+        )
+
+        items = []
+        for result in results:
+            if isinstance(result, BlockError):
+                items.append(_block_error_to_rep(result))
+            else:
+                items.append({"status": "ok", "block": result})
+
+        return block_read_batch_serializer.rep_dump({"status": "ok", "items": items})
+
     @catch_protocol_errors
     async def api_block_create(self, client_ctx, msg):
         msg = block_create_serializer.req_load(msg)
@@ -77,6 +115,33 @@ class BaseBlockComponent:
 
         return block_create_serializer.rep_dump({"status": "ok"})
 
+    @catch_protocol_errors
+    async def api_block_create_batch(self, client_ctx, msg):
+        msg = block_create_batch_serializer.req_load(msg)
+
+        try:
+            results = await self.create_batch(
+                client_ctx.organization_id,
+                client_ctx.device_id,
+                msg["realm_id"],
+                [(x["block_id"], x["block"]) for x in msg["blocks"]],
+            )
+
+        except BlockNotFoundError:
+            return block_create_batch_serializer.rep_dump({"status": "not_found"})
+
+        except BlockAccessError:
+            return block_create_batch_serializer.rep_dump({"status": "not_allowed"})
+
+        except BlockInMaintenanceError:
+            return block_create_batch_serializer.rep_dump({"status": "in_maintenance"})
+
+        items = [
+            _block_error_to_rep(result) if result is not None else {"status": "ok"}
+            for result in results
+        ]
+        return block_create_batch_serializer.rep_dump({"status": "ok", "items": items})
+
     async def read(
         self, organization_id: OrganizationID, author: DeviceID, block_id: UUID
     ) -> bytes:
@@ -89,6 +154,19 @@ class BaseBlockComponent:
         """
         raise NotImplementedError()
 
+    async def read_batch(
+        self, organization_id: OrganizationID, author: DeviceID, block_ids: List[UUID]
+    ) -> List[Union[bytes, BlockError]]:
+        """
+        Read several blocks at once, the access to each realm being only checked once.
+
+        The results are returned in the same order than the block ids. A block that
+        cannot be read gets the error `read` would have raised instead of its data.
+
+        Raises: Nothing !
+        """
+        raise NotImplementedError()
+
     async def create(
         self,
         organization_id: OrganizationID,
@@ -106,3 +184,24 @@ class BaseBlockComponent:
             BlockInMaintenanceError
         """
         raise NotImplementedError()
+
+    async def create_batch(
+        self,
+        organization_id: OrganizationID,
+        author: DeviceID,
+        realm_id: UUID,
+        blocks: List[Tuple[UUID, bytes]],
+    ) -> List[Optional[BlockError]]:
+        """
+        Create several blocks of the same realm at once, the access to the realm
+        being only checked once.
+
+        The results are returned in the same order than the blocks: None if the
+        block has been created, the error `create` would have raised otherwise.
+
+        Raises:
+            BlockNotFoundError: if cannot found realm
+            BlockAccessError
+            BlockInMaintenanceError
+        """
+        raise NotImplementedError()
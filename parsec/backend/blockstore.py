@@ -1,9 +1,18 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) AGPLv3 2019 Scille SAS
 
+import trio
+from math import inf
 from uuid import UUID
+from collections import deque
+from typing import Any, List, Tuple, Dict, Optional, Union, Callable, Awaitable
 
 from parsec.api.protocol import OrganizationID
 from parsec.backend.config import BaseBlockStoreConfig
+from parsec.backend.block import BlockError, BlockNotFoundError, BlockTimeoutError
+
+
+# Maximum number of blocks of a batch being read or created at the same time
+BLOCK_BATCH_MAX_CONCURRENCY = 8
 
 
 class BaseBlockStoreComponent:
@@ -23,6 +32,203 @@ class BaseBlockStoreComponent:
         """
         raise NotImplementedError()
 
+    async def read_batch(
+        self, organization_id: OrganizationID, ids: List[UUID]
+    ) -> List[Union[bytes, BlockError]]:
+        """
+        Read the blocks concurrently (at most `BLOCK_BATCH_MAX_CONCURRENCY` at
+        a time), the error raised by `read` being returned in place of the data
+        of the blocks that cannot be read.
+
+        Raises: Nothing !
+        """
+        results = [None] * len(ids)
+        limiter = trio.CapacityLimiter(BLOCK_BATCH_MAX_CONCURRENCY)
+
+        async def _read(index, id):
+            try:
+                async with limiter:
+                    results[index] = await self.read(organization_id, id)
+            except BlockError as exc:
+                results[index] = exc
+
+        async with trio.open_nursery() as nursery:
+            for index, id in enumerate(ids):
+                nursery.start_soon(_read, index, id)
+        return results
+
+    async def create_batch(
+        self, organization_id: OrganizationID, blocks: List[Tuple[UUID, bytes]]
+    ) -> List[Optional[BlockError]]:
+        """
+        Create the blocks concurrently (at most `BLOCK_BATCH_MAX_CONCURRENCY`
+        at a time), the error raised by `create` being returned for the blocks
+        that cannot be created (None otherwise).
+
+        Raises: Nothing !
+        """
+        results = [None] * len(blocks)
+        limiter = trio.CapacityLimiter(BLOCK_BATCH_MAX_CONCURRENCY)
+
+        async def _create(index, id, block):
+            try:
+                async with limiter:
+                    await self.create(organization_id, id, block)
+            except BlockError as exc:
+                results[index] = exc
+
+        async with trio.open_nursery() as nursery:
+            for index, (id, block) in enumerate(blocks):
+                nursery.start_soon(_create, index, id, block)
+        return results
+
+
+async def run_in_worker(fn: Callable, *args, limiter: trio.CapacityLimiter, timeout: float) -> Any:
+    """
+    Run a synchronous blockstore request in a worker thread, among the ones
+    allowed by the limiter.
+
+    Raises:
+        BlockTimeoutError: if the request doesn't complete within the timeout
+    """
+    # Cancellable so a stalled request doesn't hold the client beyond the
+    # timeout, the limiter's token is only released once the abandoned
+    # thread returns though.
+    try:
+        with trio.fail_after(timeout):
+            return await trio.to_thread.run_sync(fn, *args, cancellable=True, limiter=limiter)
+    except trio.TooSlowError as exc:
+        raise BlockTimeoutError() from exc
+
+
+class NodesLatencyTracker:
+    """
+    Keep track of the read latency of each node of a blockstore cluster (as an
+    exponentially weighted moving average) and of the latency percentile of the
+    whole cluster, used to decide when a read is too slow and must be hedged.
+    """
+
+    def __init__(
+        self,
+        nb_nodes: int,
+        alpha: float = 0.2,
+        hedge_percentile: float = 0.95,
+        window_size: int = 100,
+        default_hedge_delay: float = 0.05,
+        min_hedge_delay: float = 0.001,
+    ):
+        self._latencies = [0.0] * nb_nodes
+        self._alpha = alpha
+        self._hedge_percentile = hedge_percentile
+        self._window = deque(maxlen=window_size)
+        self._default_hedge_delay = default_hedge_delay
+        self._min_hedge_delay = min_hedge_delay
+
+    def __len__(self) -> int:
+        return len(self._latencies)
+
+    def latency(self, index: int) -> float:
+        return self._latencies[index]
+
+    def nodes_by_latency(self) -> List[int]:
+        # Stable sort: nodes without samples yet are tried in their natural order
+        return sorted(range(len(self._latencies)), key=self._latencies.__getitem__)
+
+    def hedge_delay(self) -> float:
+        # Not enough samples for a meaningful percentile
+        if len(self._window) < 10:
+            return self._default_hedge_delay
+        window = sorted(self._window)
+        delay = window[min(int(len(window) * self._hedge_percentile), len(window) - 1)]
+        return max(delay, self._min_hedge_delay)
+
+    def record(self, index: int, duration: float) -> None:
+        self._window.append(duration)
+        self._update(index, duration)
+
+    def record_cancelled(self, index: int, duration: float) -> None:
+        # A cancelled read only tells us the latency is higher than its duration
+        if duration > self._latencies[index]:
+            self._update(index, duration)
+
+    def record_failure(self, index: int) -> None:
+        # A failing node often answers quickly, so push it back in the queue
+        self._latencies[index] = 2 * max(self._latencies[index], self.hedge_delay())
+
+    def _update(self, index: int, duration: float) -> None:
+        latency = self._latencies[index]
+        if not latency:
+            self._latencies[index] = duration
+        else:
+            self._latencies[index] = latency + self._alpha * (duration - latency)
+
+
+async def hedged_read(
+    tracker: NodesLatencyTracker,
+    read_node: Callable[[int], Awaitable[bytes]],
+    nb_needed: int,
+    nb_initial: Optional[int] = None,
+) -> Tuple[Dict[int, bytes], Dict[int, BlockError]]:
+    """
+    Read from the `nb_initial` (defaults to `nb_needed`) fastest nodes, a node
+    being replaced as soon as it fails. If no read completes within the hedge
+    delay, an additional request is sent to the next fastest node. Remaining
+    reads are cancelled once `nb_needed` results have been obtained.
+
+    Returns the results and the errors (`BlockNotFoundError`/`BlockTimeoutError`)
+    by node index, there may be less than `nb_needed` results if too many
+    nodes have failed.
+    """
+    results = {}
+    errors = {}
+    nodes = tracker.nodes_by_latency()
+    send_channel, receive_channel = trio.open_memory_channel(len(tracker))
+
+    async def _read_node(index):
+        start = trio.current_time()
+        try:
+            results[index] = await read_node(index)
+            tracker.record(index, trio.current_time() - start)
+
+        except BlockNotFoundError as exc:
+            # Not the node's fault, no need to penalize it
+            errors[index] = exc
+
+        except BlockTimeoutError as exc:
+            errors[index] = exc
+            tracker.record_failure(index)
+
+        except trio.Cancelled:
+            tracker.record_cancelled(index, trio.current_time() - start)
+            raise
+
+        send_channel.send_nowait(index)
+
+    async with trio.open_service_nursery() as nursery:
+
+        def _start_next_node():
+            if not nodes:
+                return 0
+            nursery.start_soon(_read_node, nodes.pop(0))
+            return 1
+
+        running = sum(_start_next_node() for _ in range(nb_initial or nb_needed))
+        while running and len(results) < nb_needed:
+            # No need to hedge once all the nodes have been queried
+            hedge_delay = tracker.hedge_delay() if nodes else inf
+            with trio.move_on_after(hedge_delay) as hedge_scope:
+                index = await receive_channel.receive()
+                running -= 1
+                if index in errors:
+                    running += _start_next_node()
+
+            if hedge_scope.cancelled_caught:
+                running += _start_next_node()
+
+        nursery.cancel_scope.cancel()
+
+    return results, errors
+
 
 def blockstore_factory(
     config: BaseBlockStoreConfig, postgresql_dbh=None
@@ -91,5 +297,22 @@ def blockstore_factory(
 
         return RAID5BlockStoreComponent(blocks)
 
+    elif config.type == "ERASURE_CODING":
+        from parsec.backend.erasure_coding_blockstore import (
+            ErasureCodingBlockStoreComponent,
+            MAX_SHARDS,
+        )
+
+        if config.nb_parity_shards < 1:
+            raise ValueError("Erasure coding block store needs at least 1 parity node")
+        if len(config.blockstores) <= config.nb_parity_shards:
+            raise ValueError("Erasure coding block store needs at least 1 data node")
+        if len(config.blockstores) > MAX_SHARDS:
+            raise ValueError(f"Erasure coding block store cannot have more than {MAX_SHARDS} nodes")
+
+        blocks = [blockstore_factory(subconf, postgresql_dbh) for subconf in config.blockstores]
+
+        return ErasureCodingBlockStoreComponent(blocks, config.nb_parity_shards)
+
     else:
         raise ValueError(f"Unknown block store type `{config.type}`")
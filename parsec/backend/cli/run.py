@@ -20,6 +20,7 @@ from parsec.backend.config import (
     RAID0BlockStoreConfig,
     RAID1BlockStoreConfig,
     RAID5BlockStoreConfig,
+    ErasureCodingBlockStoreConfig,
 )
 
 
@@ -111,11 +112,16 @@ def _parse_blockstore_param(value):
             raise click.BadParameter(f"Invalid blockstore type `{parts[0]}`")
 
 
+def _is_multi_blockstore_mode(mode):
+    mode = mode.upper()
+    return mode in ("RAID0", "RAID1", "RAID5") or (mode.startswith("EC") and mode[2:].isdigit())
+
+
 def _parse_blockstore_params(raw_params):
     raid_configs = defaultdict(list)
     for raw_param in raw_params:
         raw_param_parts = raw_param.split(":", 2)
-        if raw_param_parts[0].upper() in ("RAID0", "RAID1", "RAID5") and len(raw_param_parts) == 3:
+        if _is_multi_blockstore_mode(raw_param_parts[0]) and len(raw_param_parts) == 3:
             raid_mode, raid_node, node_param = raw_param_parts
             try:
                 raid_node = int(raid_node)
@@ -157,6 +163,16 @@ def _parse_blockstore_params(raw_params):
         return RAID1BlockStoreConfig(blockstores=blockstores)
     elif raid_mode.upper() == "RAID5":
         return RAID5BlockStoreConfig(blockstores=blockstores)
+    elif raid_mode.upper().startswith("EC"):
+        nb_parity_shards = int(raid_mode[2:])
+        if not 1 <= nb_parity_shards < len(blockstores):
+            raise click.BadParameter(
+                f"Invalid erasure coding mode `{raid_mode}`, must have at least "
+                "1 parity node and 1 data node"
+            )
+        return ErasureCodingBlockStoreConfig(
+            blockstores=blockstores, nb_parity_shards=nb_parity_shards
+        )
     else:
         raise click.BadParameter(f"Invalid multi blockstore mode `{raid_mode}`")
 
@@ -226,6 +242,13 @@ Allowed values:
     envvar="PARSEC_DB_MAX_CONNECTIONS",
     help="Maximum number of connections to the database if using PostgreSQL",
 )
+@click.option(
+    "--max-pipelined-requests",
+    default=16,
+    show_default=True,
+    envvar="PARSEC_MAX_PIPELINED_REQUESTS",
+    help="Maximum number of requests processed concurrently for a single client connection",
+)
 @click.option(
     "--blockstore",
     "-b",
@@ -245,11 +268,15 @@ Note endpoint_url/auth_url are considered as https by default (e.g.
 Escaping must be used to provide a custom scheme (e.g. `s3:http\\://foo.com:[...]`).
 
 On top of that, multiple blockstore configurations can be provided to form a
-RAID0/1/5 cluster.
+RAID0/1/5 or erasure coding cluster.
 
 Each configuration must be provided with the form
-`<raid_type>:<node>:<config>` with `<raid_type>` RAID0/RAID1/RAID5, `<node>` a
+`<raid_type>:<node>:<config>` with `<raid_type>` RAID0/RAID1/RAID5/EC<m>, `<node>` a
 integer and `<config>` the MOCKED/POSTGRESQL/S3/SWIFT config.
+
+With `EC<m>` (e.g. `EC2`), the blocks are Reed-Solomon encoded: `m` nodes
+store parity shards and the others store data shards, so up to `m` nodes
+can fail.
 """,
 )
 @click.option(
@@ -298,6 +325,7 @@ def run_cmd(
     db_drop_deleted_data,
     db_min_connections,
     db_max_connections,
+    max_pipelined_requests,
     blockstore,
     administration_token,
     ssl_keyfile,
@@ -324,6 +352,7 @@ def run_cmd(
             db_max_connections=db_max_connections,
             blockstore_config=blockstore,
             debug=debug,
+            max_pipelined_requests=max_pipelined_requests,
         )
 
         if ssl_certfile or ssl_keyfile:
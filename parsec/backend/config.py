@@ -29,6 +29,16 @@ class RAID5BlockStoreConfig(BaseBlockStoreConfig):
     blockstores: List[BaseBlockStoreConfig]
 
 
+@attr.s(frozen=True, auto_attribs=True)
+class ErasureCodingBlockStoreConfig(BaseBlockStoreConfig):
+    type = "ERASURE_CODING"
+
+    blockstores: List[BaseBlockStoreConfig]
+    # Number of blockstores holding parity shards, hence the number of failing
+    # blockstores the cluster can withstand (the others hold the data shards)
+    nb_parity_shards: int
+
+
 @attr.s(frozen=True, auto_attribs=True)
 class S3BlockStoreConfig(BaseBlockStoreConfig):
     type = "S3"
@@ -75,6 +85,10 @@ class BackendConfig:
 
     debug: bool
 
+    # Max number of requests processed concurrently on a single client
+    # connection when the client has negotiated requests pipelining
+    max_pipelined_requests: int = 16
+
     @property
     def db_type(self):
         if self.db_url.upper() == "MOCKED":
@@ -0,0 +1,264 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) AGPLv3 2019 Scille SAS
+
+import trio
+import struct
+from uuid import UUID
+from structlog import get_logger
+from typing import List, Dict, Optional
+
+from parsec.api.protocol import OrganizationID
+from parsec.backend.blockstore import BaseBlockStoreComponent, NodesLatencyTracker, hedged_read
+from parsec.backend.block import BlockAlreadyExistsError, BlockNotFoundError, BlockTimeoutError
+
+
+logger = get_logger()
+
+
+# Systematic Reed-Solomon code over GF(2^8): a block is split into `k` data
+# shards stored as-is, and `m` parity shards are computed with a Cauchy
+# matrix (any `k` rows of the whole encoding matrix are invertible, hence any
+# `k` shards are enough to rebuild the block).
+#
+# Computations are done a shard at a time instead of a byte at a time:
+# multiplying a shard by a constant is a `bytes.translate` with the
+# precomputed multiplication table of this constant, and additions are XORs
+# done on the shards converted into big integers.
+
+_GF_EXP = [0] * 512
+_GF_LOG = [0] * 256
+_x = 1
+for _i in range(255):
+    _GF_EXP[_i] = _x
+    _GF_LOG[_x] = _i
+    _x <<= 1
+    if _x & 0x100:
+        _x ^= 0x11D
+for _i in range(255, 512):
+    _GF_EXP[_i] = _GF_EXP[_i - 255]
+del _x, _i
+
+_GF_MUL_TABLES = [bytes(256)] + [
+    bytes([0] + [_GF_EXP[_GF_LOG[c] + _GF_LOG[x]] for x in range(1, 256)]) for c in range(1, 256)
+]
+
+MAX_SHARDS = 256
+
+
+def _gf_mul(a: int, b: int) -> int:
+    return _GF_MUL_TABLES[a][b]
+
+
+def _gf_inv(a: int) -> int:
+    return _GF_EXP[255 - _GF_LOG[a]]
+
+
+def _parity_matrix(nb_data_shards: int, nb_parity_shards: int) -> List[List[int]]:
+    # Cauchy matrix 1 / (x_i + y_j), with x_i and y_j all distinct
+    return [
+        [_gf_inv((nb_data_shards + i) ^ j) for j in range(nb_data_shards)]
+        for i in range(nb_parity_shards)
+    ]
+
+
+def _encoding_row(nb_data_shards: int, nb_parity_shards: int, shard_index: int) -> List[int]:
+    if shard_index < nb_data_shards:
+        return [int(j == shard_index) for j in range(nb_data_shards)]
+    return _parity_matrix(nb_data_shards, nb_parity_shards)[shard_index - nb_data_shards]
+
+
+def _invert_matrix(matrix: List[List[int]]) -> List[List[int]]:
+    # Gauss-Jordan elimination, matrix is small (k x k) so no need to be smart
+    size = len(matrix)
+    work = [row[:] + [int(i == j) for j in range(size)] for i, row in enumerate(matrix)]
+    for col in range(size):
+        pivot = next(row for row in range(col, size) if work[row][col])
+        work[col], work[pivot] = work[pivot], work[col]
+        inv_pivot = _gf_inv(work[col][col])
+        work[col] = [_gf_mul(inv_pivot, x) for x in work[col]]
+        for row in range(size):
+            factor = work[row][col]
+            if row != col and factor:
+                work[row] = [x ^ _gf_mul(factor, y) for x, y in zip(work[row], work[col])]
+    return [row[size:] for row in work]
+
+
+def _linear_combination(coefs: List[int], shards: List[bytes], shard_len: int) -> bytes:
+    acc = 0
+    for coef, shard in zip(coefs, shards):
+        if coef == 0:
+            continue
+        if coef != 1:
+            shard = shard.translate(_GF_MUL_TABLES[coef])
+        acc ^= int.from_bytes(shard, "little")
+    return acc.to_bytes(shard_len, "little")
+
+
+def xor_shards(shards: List[bytes], shard_len: int) -> bytes:
+    return _linear_combination([1] * len(shards), shards, shard_len)
+
+
+def _gather(parts: List[memoryview], start: int, end: int) -> List[memoryview]:
+    # Slices (no copy) covering [start, end) of the concatenation of parts
+    slices = []
+    part_start = 0
+    for part in parts:
+        part_end = part_start + len(part)
+        if start < part_end and part_start < end:
+            slices.append(
+                part[max(start, part_start) - part_start : min(end, part_end) - part_start]
+            )
+        part_start = part_end
+    return slices
+
+
+def split_block_in_shards(block: bytes, nb_shards: int) -> List[bytes]:
+    """
+    Split the block (prefixed by its size, and padded) into `nb_shards` shards of
+    the same size, the block data being copied only once.
+    """
+    payload_size = len(block) + 4  # encode block len as a uint32
+    shard_len = -(-payload_size // nb_shards)
+    padding = bytes(shard_len * nb_shards - payload_size)
+    # The payload is never concatenated, each shard gathers its own slices
+    payload = [memoryview(struct.pack("!I", len(block))), memoryview(block), memoryview(padding)]
+
+    return [
+        b"".join(_gather(payload, shard_len * i, shard_len * (i + 1))) for i in range(nb_shards)
+    ]
+
+
+def join_data_shards(shards: List[bytes]) -> bytes:
+    """
+    Reverse of `split_block_in_shards`
+    """
+    payload = [memoryview(shard) for shard in shards]
+    header = b"".join(_gather(payload, 0, 4))
+    if len(header) < 4:
+        # Corrupted shard, results in a bad block (detected by the client)
+        return b""
+    block_len, = struct.unpack("!I", header)
+    return b"".join(_gather(payload, 4, 4 + block_len))
+
+
+def generate_parity_shards(shards: List[bytes], nb_parity_shards: int) -> List[bytes]:
+    shard_len = len(shards[0])
+    return [
+        _linear_combination(coefs, shards, shard_len)
+        for coefs in _parity_matrix(len(shards), nb_parity_shards)
+    ]
+
+
+def rebuild_block_from_shards(
+    shards: Dict[int, bytes], nb_data_shards: int, nb_parity_shards: int
+) -> bytes:
+    """
+    Rebuild the block from exactly `nb_data_shards` shards, provided as a
+    dict of shard index to shard data.
+    """
+    assert len(shards) == nb_data_shards
+    # A corrupted shard results in a bad block (detected by the client),
+    # just make sure it doesn't break the computation
+    shard_len = max(len(shard) for shard in shards.values())
+    data_shards: List[Optional[bytes]] = [shards.get(i) for i in range(nb_data_shards)]
+
+    missing = [i for i, shard in enumerate(data_shards) if shard is None]
+    if missing:
+        indexes = sorted(shards)
+        decoding_matrix = _invert_matrix(
+            [_encoding_row(nb_data_shards, nb_parity_shards, i) for i in indexes]
+        )
+        available = [shards[i] for i in indexes]
+        for i in missing:
+            data_shards[i] = _linear_combination(decoding_matrix[i], available, shard_len)
+
+    return join_data_shards(data_shards)
+
+
+class ErasureCodingBlockStoreComponent(BaseBlockStoreComponent):
+    def __init__(self, blockstores, nb_parity_shards):
+        self.blockstores = blockstores
+        self.nb_parity_shards = nb_parity_shards
+        self.nb_data_shards = len(blockstores) - nb_parity_shards
+        assert self.nb_data_shards >= 1 and nb_parity_shards >= 1
+        assert len(blockstores) <= MAX_SHARDS
+        self._latencies = NodesLatencyTracker(len(blockstores))
+
+    async def read(self, organization_id: OrganizationID, id: UUID) -> bytes:
+        async def _partial_blockstore_read(blockstore_index):
+            try:
+                return await self.blockstores[blockstore_index].read(organization_id, id)
+            except BlockTimeoutError as exc:
+                logger.warning(
+                    f"Cannot reach erasure coding blockstore #{blockstore_index} "
+                    f"to read block {id}",
+                    exc_info=exc,
+                )
+                raise
+
+        # Fetch the shards from the fastest blockstores (data shards first
+        # until latencies are known, sparing the decoding), a failing or too
+        # slow blockstore being replaced by the next one.
+        # Note we don't know if a not found shard means the id doesn't exist
+        # globally or only in this blockstore...
+        shards, errors = await hedged_read(
+            self._latencies, _partial_blockstore_read, nb_needed=self.nb_data_shards
+        )
+
+        if len(shards) >= self.nb_data_shards:
+            return rebuild_block_from_shards(
+                dict(sorted(shards.items())[: self.nb_data_shards]),
+                self.nb_data_shards,
+                self.nb_parity_shards,
+            )
+
+        elif all(isinstance(exc, BlockNotFoundError) for exc in errors.values()):
+            raise BlockNotFoundError()
+
+        else:
+            logger.error(
+                f"Block {id} cannot be read: Too many failing blockstores in the "
+                "erasure coding cluster"
+            )
+            raise BlockTimeoutError(
+                f"More than {self.nb_parity_shards} blockstores have failed in the "
+                "erasure coding cluster"
+            )
+
+    async def create(self, organization_id: OrganizationID, id: UUID, block: bytes) -> None:
+        shards = split_block_in_shards(block, self.nb_data_shards)
+        shards += generate_parity_shards(shards, self.nb_parity_shards)
+
+        # Actually do the upload
+        error_count = 0
+
+        async def _subblockstore_create(nursery, blockstore_index, shard):
+            nonlocal error_count
+            try:
+                await self.blockstores[blockstore_index].create(organization_id, id, shard)
+            except BlockAlreadyExistsError:
+                # Retrial of a previously partially failed upload (see RAID5)
+                pass
+            except BlockTimeoutError as exc:
+                error_count += 1
+                logger.warning(
+                    f"Cannot reach erasure coding blockstore #{blockstore_index} "
+                    f"to create block {id}",
+                    exc_info=exc,
+                )
+                if error_count > self.nb_parity_shards:
+                    # Early exit
+                    nursery.cancel_scope.cancel()
+
+        async with trio.open_service_nursery() as nursery:
+            for i, shard in enumerate(shards):
+                nursery.start_soon(_subblockstore_create, nursery, i, shard)
+
+        if error_count > self.nb_parity_shards:
+            logger.error(
+                f"Block {id} cannot be created: Too many failing blockstores in the "
+                "erasure coding cluster"
+            )
+            raise BlockTimeoutError(
+                f"More than {self.nb_parity_shards} blockstores have failed in the "
+                "erasure coding cluster"
+            )
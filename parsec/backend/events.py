@@ -1,91 +1,155 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) AGPLv3 2019 Scille SAS
 
 import trio
-
-from parsec.api.protocol import events_subscribe_serializer, events_listen_serializer
+from uuid import UUID
+from typing import Set
+from collections import defaultdict
+
+from parsec.event_bus import EventBus
+from parsec.api.protocol import (
+    events_subscribe_serializer,
+    events_listen_serializer,
+    events_listen_batch_serializer,
+)
 from parsec.backend.utils import catch_protocol_errors, run_with_breathing_transport
 from parsec.backend.realm import BaseRealmComponent
 
 
 class EventsComponent:
-    def __init__(self, realm_component: BaseRealmComponent):
+    def __init__(self, realm_component: BaseRealmComponent, event_bus: EventBus):
         self._realm_component = realm_component
-
-    @catch_protocol_errors
-    async def api_events_subscribe(self, client_ctx, msg):
-        msg = events_subscribe_serializer.req_load(msg)
-
-        def _on_roles_updated(event, organization_id, author, realm_id, user, role):
-            if organization_id != client_ctx.organization_id or user != client_ctx.user_id:
-                return
-
+        # Subscribed clients (indexed by connection id) are looked up by the
+        # events they are concerned with, hence dispatching an event doesn't
+        # depend on the total number of connected clients
+        self._organization_clients = defaultdict(dict)  # org_id -> clients
+        self._user_clients = defaultdict(dict)  # (org_id, user_id) -> clients
+        self._realm_clients = defaultdict(dict)  # (org_id, realm_id) -> clients
+
+        event_bus.connect("pinged", self._on_pinged)
+        event_bus.connect("realm.vlobs_updated", self._on_realm_events)
+        event_bus.connect("realm.maintenance_started", self._on_realm_events)
+        event_bus.connect("realm.maintenance_finished", self._on_realm_events)
+        event_bus.connect("message.received", self._on_message_received)
+        event_bus.connect("realm.roles_updated", self._on_roles_updated)
+
+    @staticmethod
+    def _index_client(index, key, client_ctx) -> None:
+        index[key][client_ctx.conn_id] = client_ctx
+
+    @staticmethod
+    def _unindex_client(index, key, client_ctx) -> None:
+        clients = index.get(key)
+        if clients is not None:
+            clients.pop(client_ctx.conn_id, None)
+            if not clients:
+                del index[key]
+
+    @staticmethod
+    def _send_event(client_ctx, event_data: dict) -> bool:
+        try:
+            client_ctx.send_events_channel.send_nowait(event_data)
+            return True
+        except trio.WouldBlock:
+            client_ctx.logger.warning(f"event queue is full for {client_ctx}")
+            client_ctx.events_overflow = True
+            return False
+
+    def _send_vlobs_updated_event(self, client_ctx, event_data: dict) -> None:
+        if not client_ctx.coalesce_events:
+            self._send_event(client_ctx, event_data)
+            return
+
+        key = (event_data["realm_id"], event_data["src_id"])
+        pending = client_ctx.pending_vlobs_updated.get(key)
+        if pending:
+            # The client hasn't received the previous change on this vlob yet,
+            # just update it (it is only about the latest version anyway)
+            pending["checkpoint"] = event_data["checkpoint"]
+            pending["src_version"] = event_data["src_version"]
+        else:
+            # Copy the event given it may be updated in place later
+            event_data = dict(event_data)
+            if self._send_event(client_ctx, event_data):
+                client_ctx.pending_vlobs_updated[key] = event_data
+
+    @staticmethod
+    def _event_received(client_ctx, event_data: dict) -> dict:
+        if event_data["event"] == "realm.vlobs_updated":
+            key = (event_data["realm_id"], event_data["src_id"])
+            if client_ctx.pending_vlobs_updated.get(key) is event_data:
+                del client_ctx.pending_vlobs_updated[key]
+        return event_data
+
+    def _set_client_realms(self, client_ctx, realms: Set[UUID]) -> None:
+        organization_id = client_ctx.organization_id
+        for realm_id in client_ctx.realms - realms:
+            self._unindex_client(self._realm_clients, (organization_id, realm_id), client_ctx)
+        for realm_id in realms - client_ctx.realms:
+            self._index_client(self._realm_clients, (organization_id, realm_id), client_ctx)
+        client_ctx.realms = realms
+
+    def _on_roles_updated(self, event, organization_id, author, realm_id, user, role):
+        for client_ctx in list(self._user_clients.get((organization_id, user), {}).values()):
             if role is None:
-                client_ctx.realms.discard(realm_id)
+                self._set_client_realms(client_ctx, client_ctx.realms - {realm_id})
             else:
-                client_ctx.realms.add(realm_id)
+                self._set_client_realms(client_ctx, client_ctx.realms | {realm_id})
 
             # Note for this event we don't filter out the ones sent by the client's
             # device, there is two reason for this:
             # 1) A user cannot change it own role, so this case should never occur
             # 2) Returning this event inform the peer we are ready to send it
             #    `realm.vlobs_updated` events on this realm (especially useful during tests)
-            try:
-                client_ctx.send_events_channel.send_nowait(
-                    {"event": event, "realm_id": realm_id, "role": role}
-                )
-            except trio.WouldBlock:
-                client_ctx.logger.warning(f"event queue is full for {client_ctx}")
-
-        def _on_pinged(event, organization_id, author, ping):
-            if organization_id != client_ctx.organization_id or author == client_ctx.device_id:
-                return
-
-            try:
-                client_ctx.send_events_channel.send_nowait({"event": event, "ping": ping})
-            except trio.WouldBlock:
-                client_ctx.logger.warning(f"event queue is full for {client_ctx}")
-
-        def _on_realm_events(event, organization_id, author, realm_id, **kwargs):
-            if (
-                organization_id != client_ctx.organization_id
-                or author == client_ctx.device_id
-                or realm_id not in client_ctx.realms
-            ):
-                return
-
-            msg = {"event": event, "realm_id": realm_id, **kwargs}
-            try:
-                client_ctx.send_events_channel.send_nowait(msg)
-            except trio.WouldBlock:
-                client_ctx.logger.warning(f"event queue is full for {client_ctx}")
-
-        def _on_message_received(event, organization_id, author, recipient, index):
-            if organization_id != client_ctx.organization_id or recipient != client_ctx.user_id:
-                return
-
-            try:
-                client_ctx.send_events_channel.send_nowait({"event": event, "index": index})
-            except trio.WouldBlock:
-                client_ctx.logger.warning(f"event queue is full for {client_ctx}")
+            self._send_event(client_ctx, {"event": event, "realm_id": realm_id, "role": role})
+
+    def _on_pinged(self, event, organization_id, author, ping):
+        event_data = {"event": event, "ping": ping}
+        for client_ctx in self._organization_clients.get(organization_id, {}).values():
+            if author != client_ctx.device_id:
+                self._send_event(client_ctx, event_data)
+
+    def _on_realm_events(self, event, organization_id, author, realm_id, **kwargs):
+        event_data = {"event": event, "realm_id": realm_id, **kwargs}
+        if event == "realm.vlobs_updated":
+            send_event = self._send_vlobs_updated_event
+        else:
+            send_event = self._send_event
+        for client_ctx in self._realm_clients.get((organization_id, realm_id), {}).values():
+            if author != client_ctx.device_id:
+                send_event(client_ctx, event_data)
+
+    def _on_message_received(self, event, organization_id, author, recipient, index):
+        event_data = {"event": event, "index": index}
+        for client_ctx in self._user_clients.get((organization_id, recipient), {}).values():
+            self._send_event(client_ctx, event_data)
+
+    def unsubscribe(self, client_ctx) -> None:
+        """
+        Stop routing events to the client (no-op if not subscribed).
+        """
+        organization_id = client_ctx.organization_id
+        self._unindex_client(self._organization_clients, organization_id, client_ctx)
+        self._unindex_client(self._user_clients, (organization_id, client_ctx.user_id), client_ctx)
+        self._set_client_realms(client_ctx, set())
 
-        # Drop previous event callbacks if any
-        client_ctx.event_bus_ctx.clear()
+    @catch_protocol_errors
+    async def api_events_subscribe(self, client_ctx, msg):
+        msg = events_subscribe_serializer.req_load(msg)
 
-        # Connect the new callbacks
-        client_ctx.event_bus_ctx.connect("pinged", _on_pinged)
-        client_ctx.event_bus_ctx.connect("realm.vlobs_updated", _on_realm_events)
-        client_ctx.event_bus_ctx.connect("realm.maintenance_started", _on_realm_events)
-        client_ctx.event_bus_ctx.connect("realm.maintenance_finished", _on_realm_events)
-        client_ctx.event_bus_ctx.connect("message.received", _on_message_received)
+        # Drop previous subscription if any
+        self.unsubscribe(client_ctx)
 
-        # Final event to keep up to date the list of realm we should listen on
-        client_ctx.event_bus_ctx.connect("realm.roles_updated", _on_roles_updated)
+        # Start listening on the user's events first to keep up to date the list
+        # of realm we should listen on while we are fetching it
+        organization_id = client_ctx.organization_id
+        self._index_client(self._organization_clients, organization_id, client_ctx)
+        self._index_client(self._user_clients, (organization_id, client_ctx.user_id), client_ctx)
 
         # Finally populate the list of realm we should listen on
         realms_for_user = await self._realm_component.get_realms_for_user(
             client_ctx.organization_id, client_ctx.user_id
         )
-        client_ctx.realms = set(realms_for_user.keys())
+        self._set_client_realms(client_ctx, set(realms_for_user.keys()))
 
         return events_subscribe_serializer.rep_dump({"status": "ok"})
 
@@ -107,4 +171,34 @@ class EventsComponent:
             except trio.WouldBlock:
                 return {"status": "no_events"}
 
+        event_data = self._event_received(client_ctx, event_data)
         return events_listen_serializer.rep_dump({"status": "ok", **event_data})
+
+    @catch_protocol_errors
+    async def api_events_listen_batch(self, client_ctx, msg):
+        msg = events_listen_batch_serializer.req_load(msg)
+        client_ctx.coalesce_events = True
+
+        events = []
+        if msg["wait"]:
+            event_data = await run_with_breathing_transport(
+                client_ctx.transport, client_ctx.receive_events_channel.receive
+            )
+
+            if not event_data:
+                return {"status": "cancelled", "reason": "Client cancelled the listening"}
+
+            events.append(self._event_received(client_ctx, event_data))
+
+        while len(events) < msg["max_events"]:
+            try:
+                event_data = client_ctx.receive_events_channel.receive_nowait()
+            except trio.WouldBlock:
+                break
+            events.append(self._event_received(client_ctx, event_data))
+
+        overflow = client_ctx.events_overflow
+        client_ctx.events_overflow = False
+        return events_listen_batch_serializer.rep_dump(
+            {"status": "ok", "events": events, "overflow": overflow}
+        )
@@ -1,6 +1,7 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) AGPLv3 2019 Scille SAS
 
 from uuid import UUID
+from typing import List, Tuple, Optional, Union
 import attr
 
 from parsec.api.protocol import DeviceID, OrganizationID
@@ -9,6 +10,7 @@ from parsec.backend.realm import BaseRealmComponent, RealmNotFoundError
 from parsec.backend.blockstore import BaseBlockStoreComponent
 from parsec.backend.block import (
     BaseBlockComponent,
+    BlockError,
     BlockAlreadyExistsError,
     BlockAccessError,
     BlockNotFoundError,
@@ -72,6 +74,40 @@ class MemoryBlockComponent(BaseBlockComponent):
 
         return await self._blockstore_component.read(organization_id, block_id)
 
+    async def read_batch(
+        self, organization_id: OrganizationID, author: DeviceID, block_ids: List[UUID]
+    ) -> List[Union[bytes, BlockError]]:
+        results = [None] * len(block_ids)
+        to_read = {}
+        realm_errors = {}
+        for index, block_id in enumerate(block_ids):
+            try:
+                blockmeta = self._blockmetas[(organization_id, block_id)]
+            except KeyError:
+                results[index] = BlockNotFoundError()
+                continue
+
+            # Only check the access once per realm
+            if blockmeta.realm_id not in realm_errors:
+                try:
+                    self._check_realm_read_access(
+                        organization_id, blockmeta.realm_id, author.user_id
+                    )
+                    realm_errors[blockmeta.realm_id] = None
+                except BlockError as exc:
+                    realm_errors[blockmeta.realm_id] = exc
+            if realm_errors[blockmeta.realm_id] is not None:
+                results[index] = realm_errors[blockmeta.realm_id]
+            else:
+                to_read[index] = block_id
+
+        blocks = await self._blockstore_component.read_batch(
+            organization_id, list(to_read.values())
+        )
+        for index, block in zip(to_read, blocks):
+            results[index] = block
+        return results
+
     async def create(
         self,
         organization_id: OrganizationID,
@@ -85,6 +121,29 @@ class MemoryBlockComponent(BaseBlockComponent):
         await self._blockstore_component.create(organization_id, block_id, block)
         self._blockmetas[(organization_id, block_id)] = BlockMeta(realm_id, len(block))
 
+    async def create_batch(
+        self,
+        organization_id: OrganizationID,
+        author: DeviceID,
+        realm_id: UUID,
+        blocks: List[Tuple[UUID, bytes]],
+    ) -> List[Optional[BlockError]]:
+        self._check_realm_write_access(organization_id, realm_id, author.user_id)
+
+        results = [
+            BlockAlreadyExistsError() if (organization_id, block_id) in self._blockmetas else None
+            for block_id, _ in blocks
+        ]
+        to_create = {index: block for index, block in enumerate(blocks) if results[index] is None}
+        created = await self._blockstore_component.create_batch(
+            organization_id, list(to_create.values())
+        )
+        for (index, (block_id, block)), result in zip(to_create.items(), created):
+            results[index] = result
+            if result is None:
+                self._blockmetas[(organization_id, block_id)] = BlockMeta(realm_id, len(block))
+        return results
+
 
 class MemoryBlockStoreComponent(BaseBlockStoreComponent):
     def __init__(self):
@@ -3,7 +3,7 @@
 import attr
 import pendulum
 from uuid import UUID
-from typing import List, Tuple, Dict, Optional
+from typing import List, Tuple, Dict, Optional, Union
 from collections import defaultdict
 
 from parsec.api.protocol import DeviceID, OrganizationID
@@ -11,6 +11,7 @@ from parsec.api.protocol import RealmRole
 from parsec.backend.realm import BaseRealmComponent, RealmNotFoundError
 from parsec.backend.vlob import (
     BaseVlobComponent,
+    VlobError,
     VlobAccessError,
     VlobVersionError,
     VlobTimestampError,
@@ -259,6 +260,24 @@ class MemoryVlobComponent(BaseVlobComponent):
         except IndexError:
             raise VlobVersionError()
 
+    async def read_batch(
+        self,
+        organization_id: OrganizationID,
+        author: DeviceID,
+        encryption_revision: int,
+        items: List[Tuple[UUID, Optional[int], Optional[pendulum.Pendulum]]],
+    ) -> List[Union[Tuple[int, bytes, DeviceID, pendulum.Pendulum], VlobError]]:
+        results = []
+        for vlob_id, version, timestamp in items:
+            try:
+                result = await self.read(
+                    organization_id, author, encryption_revision, vlob_id, version, timestamp
+                )
+            except VlobError as exc:
+                result = exc
+            results.append(result)
+        return results
+
     async def update(
         self,
         organization_id: OrganizationID,
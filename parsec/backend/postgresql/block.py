@@ -1,7 +1,9 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) AGPLv3 2019 Scille SAS
 
+import trio
 from triopg.exceptions import UniqueViolationError
 from uuid import UUID
+from typing import List, Tuple, Optional, Union
 import pendulum
 from pypika import Parameter
 
@@ -62,6 +64,46 @@ _q_get_block_write_right_and_unicity = Query.select(
 ).get_sql()
 
 
+_q_get_blocks_meta = """
+SELECT
+    block.block_id,
+    block.deleted_on,
+    realm.maintenance_type IS NOT NULL,
+    ({})
+FROM block
+INNER JOIN realm
+ON block.realm = realm._id
+WHERE
+    block.organization = ({})
+    AND block.block_id = any($3::uuid[])
+""".format(
+    q_user_can_read_vlob(
+        user=q_user_internal_id(organization_id=Parameter("$1"), user_id=Parameter("$2")),
+        realm=t_block.realm,
+    ),
+    q_organization_internal_id(Parameter("$1")),
+)
+
+
+_q_get_block_write_right = Query.select(
+    q_user_can_write_vlob(
+        user=q_user_internal_id(organization_id=Parameter("$1"), user_id=Parameter("$2")),
+        realm=q_realm_internal_id(organization_id=Parameter("$1"), realm_id=Parameter("$3")),
+    )
+).get_sql()
+
+
+_q_get_existing_blocks = """
+SELECT block_id
+FROM block
+WHERE
+    organization = ({})
+    AND block_id = any($2::uuid[])
+""".format(
+    q_organization_internal_id(Parameter("$1"))
+)
+
+
 _q_insert_block = (
     Query.into(t_block)
     .columns("organization", "block_id", "realm", "author", "size", "created_on")
@@ -116,6 +158,41 @@ class PGBlockComponent(BaseBlockComponent):
 
         return await self._blockstore_component.read(organization_id, block_id)
 
+    async def read_batch(
+        self, organization_id: OrganizationID, author: DeviceID, block_ids: List[UUID]
+    ) -> List[Union[bytes, BlockError]]:
+        # Blocks metadata and realm accesses are all retrieved in a single query
+        async with self.dbh.pool.acquire() as conn:
+            rows = await conn.fetch(_q_get_blocks_meta, organization_id, author.user_id, block_ids)
+        metas = {row[0]: row[1:] for row in rows}
+
+        results = [None] * len(block_ids)
+        to_read = {}
+        for index, block_id in enumerate(block_ids):
+            try:
+                deleted_on, in_maintenance, can_read = metas[block_id]
+            except KeyError:
+                results[index] = BlockNotFoundError()
+                continue
+
+            if in_maintenance:
+                results[index] = BlockInMaintenanceError(
+                    "Data realm is currently under maintenance"
+                )
+            elif deleted_on:
+                results[index] = BlockNotFoundError()
+            elif not can_read:
+                results[index] = BlockAccessError()
+            else:
+                to_read[index] = block_id
+
+        blocks = await self._blockstore_component.read_batch(
+            organization_id, list(to_read.values())
+        )
+        for index, block in zip(to_read, blocks):
+            results[index] = block
+        return results
+
     async def create(
         self,
         organization_id: OrganizationID,
@@ -167,6 +244,57 @@ class PGBlockComponent(BaseBlockComponent):
             if ret != "INSERT 0 1":
                 raise BlockError(f"Insertion error: {ret}")
 
+    async def create_batch(
+        self,
+        organization_id: OrganizationID,
+        author: DeviceID,
+        realm_id: UUID,
+        blocks: List[Tuple[UUID, bytes]],
+    ) -> List[Optional[BlockError]]:
+        async with self.dbh.pool.acquire() as conn, conn.transaction():
+            await _check_realm(conn, organization_id, realm_id)
+
+            # 1) Check access rights once for all the blocks
+            can_write = await conn.fetchval(
+                _q_get_block_write_right, organization_id, author.user_id, realm_id
+            )
+            if not can_write:
+                raise BlockAccessError()
+
+            # 2) Check blocks unicity
+            rows = await conn.fetch(
+                _q_get_existing_blocks, organization_id, [block_id for block_id, _ in blocks]
+            )
+            existing = {row[0] for row in rows}
+            results = [
+                BlockAlreadyExistsError() if block_id in existing else None
+                for block_id, _ in blocks
+            ]
+
+            # 3) Upload blocks data concurrently in the blockstore
+            # (see `create` about the lack of atomicity)
+            to_create = {
+                index: block for index, block in enumerate(blocks) if results[index] is None
+            }
+            created = await self._blockstore_component.create_batch(
+                organization_id, list(to_create.values())
+            )
+            for index, result in zip(to_create, created):
+                results[index] = result
+
+            # 4) Insert the metadata of the created blocks into the database
+            now = pendulum.now()
+            await conn.executemany(
+                _q_insert_block,
+                [
+                    (organization_id, block_id, realm_id, author, len(block), now)
+                    for (block_id, block), result in zip(blocks, results)
+                    if result is None
+                ],
+            )
+
+        return results
+
 
 _q_get_block_data = (
     Query.from_(t_block_data)
@@ -187,9 +315,12 @@ _q_insert_block_data = (
 class PGBlockStoreComponent(BaseBlockStoreComponent):
     def __init__(self, dbh: PGHandler):
         self.dbh = dbh
+        # Keep connections available for the metadata queries, which may hold
+        # one while waiting for the blocks (see `PGBlockComponent.create_batch`)
+        self._limiter = trio.CapacityLimiter(max(dbh.max_connections // 2, 1))
 
     async def read(self, organization_id: OrganizationID, id: UUID) -> bytes:
-        async with self.dbh.pool.acquire() as conn:
+        async with self._limiter, self.dbh.pool.acquire() as conn:
             ret = await conn.fetchrow(_q_get_block_data, organization_id, id)
             if not ret:
                 raise BlockNotFoundError()
@@ -197,7 +328,7 @@ class PGBlockStoreComponent(BaseBlockStoreComponent):
             return ret[0]
 
     async def create(self, organization_id: OrganizationID, id: UUID, block: bytes) -> None:
-        async with self.dbh.pool.acquire() as conn:
+        async with self._limiter, self.dbh.pool.acquire() as conn:
             try:
                 ret = await conn.execute(_q_insert_block_data, organization_id, id, block)
                 if ret != "INSERT 0 1":
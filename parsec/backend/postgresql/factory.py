@@ -29,7 +29,7 @@ async def components_factory(config: BackendConfig, event_bus: EventBus):
     ping = PGPingComponent(dbh)
     blockstore = blockstore_factory(config.blockstore_config, postgresql_dbh=dbh)
     block = PGBlockComponent(dbh, blockstore, vlob)
-    events = EventsComponent(realm)
+    events = EventsComponent(realm, event_bus)
 
     async with trio.open_service_nursery() as nursery:
         await dbh.init(nursery)
@@ -3,13 +3,14 @@
 import pendulum
 from triopg import UniqueViolationError
 from uuid import UUID
-from typing import List, Tuple, Dict, Optional
+from typing import List, Tuple, Dict, Optional, Union
 from pypika import Parameter
 
 from parsec.api.protocol import DeviceID, OrganizationID
 from parsec.backend.realm import RealmRole
 from parsec.backend.vlob import (
     BaseVlobComponent,
+    VlobError,
     VlobAccessError,
     VlobVersionError,
     VlobTimestampError,
@@ -347,6 +348,89 @@ WHERE
 
         return list(data)
 
+    async def read_batch(
+        self,
+        organization_id: OrganizationID,
+        author: DeviceID,
+        encryption_revision: int,
+        items: List[Tuple[UUID, Optional[int], Optional[pendulum.Pendulum]]],
+    ) -> List[Union[Tuple[int, bytes, DeviceID, pendulum.Pendulum], VlobError]]:
+        if not items:
+            return []
+
+        # Fetch all the readable items in a single query, the realm checks
+        # (access, maintenance and encryption revision) being done along the way
+        query = """
+WITH cte_items AS (
+    SELECT *
+    FROM unnest($3::uuid[], $4::integer[], $5::timestamptz[])
+    WITH ORDINALITY AS item(item_vlob_id, item_version, item_timestamp, item_index)
+)
+SELECT DISTINCT ON (item_index)
+    item_index,
+    vlob_atom.version,
+    vlob_atom.blob,
+    ({}) as author,
+    vlob_atom.created_on
+FROM cte_items
+INNER JOIN vlob_atom
+ON vlob_atom.vlob_id = cte_items.item_vlob_id
+INNER JOIN vlob_encryption_revision
+ON vlob_atom.vlob_encryption_revision = vlob_encryption_revision._id
+INNER JOIN realm
+ON vlob_encryption_revision.realm = realm._id
+WHERE
+    vlob_atom.organization = ({})
+    AND vlob_encryption_revision.encryption_revision = $6
+    AND realm.encryption_revision = $6
+    AND realm.maintenance_type IS NULL
+    AND (
+        SELECT role
+        FROM realm_user_role
+        WHERE realm_user_role.realm = realm._id AND realm_user_role.user_ = ({})
+        ORDER BY certified_on DESC
+        LIMIT 1
+    ) IS NOT NULL
+    AND (item_version IS NULL OR vlob_atom.version = item_version)
+    AND (item_timestamp IS NULL OR vlob_atom.created_on <= item_timestamp)
+ORDER BY item_index, vlob_atom.version DESC
+""".format(
+            q_device(_id=Parameter("vlob_atom.author")).select("device_id"),
+            q_organization_internal_id(Parameter("$1")),
+            q_user_internal_id(organization_id=Parameter("$1"), user_id=Parameter("$2")),
+        )
+
+        async with self.dbh.pool.acquire() as conn:
+            rows = await conn.fetch(
+                query,
+                organization_id,
+                author.user_id,
+                [vlob_id for vlob_id, _, _ in items],
+                [version for _, version, _ in items],
+                [timestamp for _, _, timestamp in items],
+                encryption_revision,
+            )
+        found = {
+            row["item_index"]: (row["version"], row["blob"], row["author"], row["created_on"])
+            for row in rows
+        }
+
+        results = []
+        for index, (vlob_id, version, timestamp) in enumerate(items, 1):
+            if index in found:
+                results.append(found[index])
+                continue
+            # Missing items are expected to be rare, read them one by one to
+            # figure out the exact error
+            try:
+                result = await self.read(
+                    organization_id, author, encryption_revision, vlob_id, version, timestamp
+                )
+            except VlobError as exc:
+                result = exc
+            results.append(result)
+        return results
+
     @retry_on_unique_violation
     async def update(
         self,
@@ -4,32 +4,29 @@ import trio
 from uuid import UUID
 
 from parsec.api.protocol import OrganizationID
-from parsec.backend.blockstore import BaseBlockStoreComponent
-from parsec.backend.block import BlockAlreadyExistsError, BlockNotFoundError, BlockTimeoutError
+from parsec.backend.blockstore import BaseBlockStoreComponent, NodesLatencyTracker, hedged_read
+from parsec.backend.block import BlockAlreadyExistsError, BlockNotFoundError
 
 
 class RAID1BlockStoreComponent(BaseBlockStoreComponent):
     def __init__(self, blockstores):
         self.blockstores = blockstores
+        self._latencies = NodesLatencyTracker(len(blockstores))
 
     async def read(self, organization_id: OrganizationID, id: UUID) -> bytes:
-        async def _single_blockstore_read(nursery, blockstore):
-            nonlocal value
-            try:
-                value = await blockstore.read(organization_id, id)
-                nursery.cancel_scope.cancel()
-            except (BlockNotFoundError, BlockTimeoutError):
-                pass
-
-        value = None
-        async with trio.open_service_nursery() as nursery:
-            for blockstore in self.blockstores:
-                nursery.start_soon(_single_blockstore_read, nursery, blockstore)
-
-        if not value:
+        # Read from the two fastest blockstores, hedged with the next ones if
+        # both are too slow. Reading a single one would save a request, but a
+        # slow read would then cost the hedge delay on top of the next one.
+        results, _ = await hedged_read(
+            self._latencies,
+            lambda index: self.blockstores[index].read(organization_id, id),
+            nb_needed=1,
+            nb_initial=2,
+        )
+        if not results:
             raise BlockNotFoundError()
 
-        return value
+        return next(iter(results.values()))
 
     async def create(self, organization_id: OrganizationID, id: UUID, block: bytes) -> None:
         async def _single_blockstore_create(blockstore):
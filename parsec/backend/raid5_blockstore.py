@@ -2,42 +2,28 @@
 
 import trio
 from uuid import UUID
-import struct
 from structlog import get_logger
-from sys import byteorder
 from typing import List, Optional
 
 from parsec.api.protocol import OrganizationID
 from parsec.backend.blockstore import BaseBlockStoreComponent
 from parsec.backend.block import BlockAlreadyExistsError, BlockNotFoundError, BlockTimeoutError
+from parsec.backend.erasure_coding_blockstore import (
+    split_block_in_shards,
+    xor_shards,
+    join_data_shards,
+)
 
 
 logger = get_logger()
 
 
-def _xor_buffers(*buffers):
-    buff_len = len(buffers[0])
-    xored = int.from_bytes(buffers[0], byteorder)
-    for buff in buffers[1:]:
-        assert len(buff) == buff_len
-        xored ^= int.from_bytes(buff, byteorder)
-    return xored.to_bytes(buff_len, byteorder)
-
-
 def split_block_in_chunks(block: bytes, nb_chunks: int) -> List[bytes]:
-    payload_size = len(block) + 4  # encode block len as a uint32
-    chunk_len = payload_size // nb_chunks
-    if nb_chunks * chunk_len < payload_size:
-        chunk_len += 1
-    padding_len = chunk_len * nb_chunks - payload_size
-
-    payload = struct.pack("!I", len(block)) + block + b"\x00" * padding_len
-
-    return [payload[chunk_len * i : chunk_len * (i + 1)] for i in range(nb_chunks)]
+    return split_block_in_shards(block, nb_chunks)
 
 
 def generate_checksum_chunk(chunks: List[bytes]) -> bytes:
-    return _xor_buffers(*chunks)
+    return xor_shards(chunks, len(chunks[0]))
 
 
 def rebuild_block_from_chunks(chunks: List[Optional[bytes]], checksum_chunk: bytes) -> bytes:
@@ -46,13 +32,13 @@ def rebuild_block_from_chunks(chunks: List[Optional[bytes]], checksum_chunk: byt
     try:
         missing_chunk_id = next(index for index, chunk in enumerate(chunks) if chunk is None)
         assert checksum_chunk is not None
-        chunks[missing_chunk_id] = _xor_buffers(*valid_chunks, checksum_chunk)
+        chunks[missing_chunk_id] = xor_shards(
+            [*valid_chunks, checksum_chunk], max(len(checksum_chunk), *map(len, valid_chunks))
+        )
     except StopIteration:
         pass
 
-    payload = b"".join(chunks)
-    block_len, = struct.unpack("!I", payload[:4])
-    return payload[4 : 4 + block_len]
+    return join_data_shards(chunks)
 
 
 class RAID5BlockStoreComponent(BaseBlockStoreComponent):
@@ -2,20 +2,38 @@
 
 import trio
 import boto3
-from botocore.exceptions import (
-    ClientError as S3ClientError,
-    EndpointConnectionError as S3EndpointConnectionError,
-)
+from botocore.config import Config as S3Config
+from botocore.exceptions import BotoCoreError, ClientError as S3ClientError
 from uuid import UUID
-from functools import partial
 
 from parsec.api.protocol import OrganizationID
-from parsec.backend.blockstore import BaseBlockStoreComponent
+from parsec.backend.blockstore import BaseBlockStoreComponent, run_in_worker
 from parsec.backend.block import BlockAlreadyExistsError, BlockNotFoundError, BlockTimeoutError
 
 
+# boto3 is synchronous, so each request is run in a worker thread. The number
+# of threads is bounded and sized with the client's connection pool so that
+# every worker gets its own persistent connection.
+DEFAULT_MAX_CONCURRENCY = 32
+DEFAULT_TIMEOUT = 30
+
+
+def _is_not_found(exc: S3ClientError) -> bool:
+    # HEAD requests have no body, hence only the HTTP status is available
+    return exc.response["Error"]["Code"] in ("404", "NoSuchKey")
+
+
 class S3BlockStoreComponent(BaseBlockStoreComponent):
-    def __init__(self, s3_region, s3_bucket, s3_key, s3_secret, s3_endpoint_url=None):
+    def __init__(
+        self,
+        s3_region,
+        s3_bucket,
+        s3_key,
+        s3_secret,
+        s3_endpoint_url=None,
+        max_concurrency=DEFAULT_MAX_CONCURRENCY,
+        timeout=DEFAULT_TIMEOUT,
+    ):
         self._s3 = None
         self._s3_bucket = None
         self._s3 = boto3.client(
@@ -24,45 +42,52 @@ class S3BlockStoreComponent(BaseBlockStoreComponent):
             aws_access_key_id=s3_key,
             aws_secret_access_key=s3_secret,
             endpoint_url=s3_endpoint_url,
+            config=S3Config(
+                max_pool_connections=max_concurrency, connect_timeout=timeout, read_timeout=timeout
+            ),
         )
         self._s3_bucket = s3_bucket
         self._s3.head_bucket(Bucket=s3_bucket)
+        self._limiter = trio.CapacityLimiter(max_concurrency)
+        self._timeout = timeout
+
+    def _sync_read(self, slug: str) -> bytes:
+        obj = self._s3.get_object(Bucket=self._s3_bucket, Key=slug)
+        return obj["Body"].read()
+
+    def _sync_create(self, slug: str, block: bytes) -> None:
+        try:
+            self._s3.head_object(Bucket=self._s3_bucket, Key=slug)
+        except S3ClientError as exc:
+            if not _is_not_found(exc):
+                raise
+        else:
+            raise BlockAlreadyExistsError()
+        self._s3.put_object(Bucket=self._s3_bucket, Key=slug, Body=block)
 
     async def read(self, organization_id: OrganizationID, id: UUID) -> bytes:
         slug = f"{organization_id}/{id}"
         try:
-            obj = self._s3.get_object(Bucket=self._s3_bucket, Key=slug)
+            return await run_in_worker(
+                self._sync_read, slug, limiter=self._limiter, timeout=self._timeout
+            )
 
         except S3ClientError as exc:
-            if exc.response["Error"]["Code"] == "404":
+            if _is_not_found(exc):
                 raise BlockNotFoundError() from exc
 
             else:
                 raise BlockTimeoutError() from exc
 
-        except S3EndpointConnectionError as exc:
+        except BotoCoreError as exc:
             raise BlockTimeoutError() from exc
 
-        return obj["Body"].read()
-
     async def create(self, organization_id: OrganizationID, id: UUID, block: bytes) -> None:
         slug = f"{organization_id}/{id}"
         try:
-            await trio.to_thread.run_sync(
-                partial(self._s3.head_object, Bucket=self._s3_bucket, Key=slug)
+            await run_in_worker(
+                self._sync_create, slug, block, limiter=self._limiter, timeout=self._timeout
             )
-        except S3ClientError as exc:
-            if exc.response["Error"]["Code"] == "404":
-                try:
-                    await trio.to_thread.run_sync(
-                        partial(self._s3.put_object, Bucket=self._s3_bucket, Key=slug, Body=block)
-                    )
-                except (S3ClientError, S3EndpointConnectionError) as exc:
-                    raise BlockTimeoutError() from exc
-            else:
-                raise BlockTimeoutError() from exc
 
-        except S3EndpointConnectionError as exc:
+        except (S3ClientError, BotoCoreError) as exc:
             raise BlockTimeoutError() from exc
-        else:
-            raise BlockAlreadyExistsError()
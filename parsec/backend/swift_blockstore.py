@@ -24,23 +24,72 @@ import swiftclient
 from swiftclient.exceptions import ClientException
 
 from parsec.api.protocol import OrganizationID
-from parsec.backend.blockstore import BaseBlockStoreComponent
+from parsec.backend.blockstore import BaseBlockStoreComponent, run_in_worker
 from parsec.backend.block import BlockAlreadyExistsError, BlockNotFoundError, BlockTimeoutError
 
 
+# swiftclient is synchronous and its `Connection` is not thread-safe, so each
+# worker thread borrows its own persistent connection from a pool.
+DEFAULT_MAX_CONCURRENCY = 32
+DEFAULT_TIMEOUT = 30
+
+
 class SwiftBlockStoreComponent(BaseBlockStoreComponent):
-    def __init__(self, auth_url, tenant, container, user, password):
-        self.swift_client = swiftclient.Connection(
-            authurl=auth_url, user=":".join([user, tenant]), key=password
+    def __init__(
+        self,
+        auth_url,
+        tenant,
+        container,
+        user,
+        password,
+        max_concurrency=DEFAULT_MAX_CONCURRENCY,
+        timeout=DEFAULT_TIMEOUT,
+    ):
+        self._connect = partial(
+            swiftclient.Connection,
+            authurl=auth_url,
+            user=":".join([user, tenant]),
+            key=password,
+            timeout=timeout,
         )
+        self.swift_client = self._connect()
         self._container = container
         self.swift_client.head_container(container)
+        self._connections = [self.swift_client]
+        self._limiter = trio.CapacityLimiter(max_concurrency)
+        self._timeout = timeout
+
+    def _with_connection(self, fn_name, *args):
+        # Only called from the worker threads, `list.pop/append` are atomic
+        try:
+            connection = self._connections.pop()
+        except IndexError:
+            connection = self._connect()
+        try:
+            return getattr(connection, fn_name)(*args)
+        finally:
+            self._connections.append(connection)
+
+    def _sync_create(self, slug: str, block: bytes) -> None:
+        try:
+            self._with_connection("head_object", self._container, slug)
+        except ClientException as exc:
+            if exc.http_status != 404:
+                raise
+        else:
+            raise BlockAlreadyExistsError()
+        self._with_connection("put_object", self._container, slug, block)
 
     async def read(self, organization_id: OrganizationID, id: UUID) -> bytes:
         slug = f"{organization_id}/{id}"
         try:
-            headers, obj = await trio.to_thread.run_sync(
-                self.swift_client.get_object, self._container, slug
+            headers, obj = await run_in_worker(
+                self._with_connection,
+                "get_object",
+                self._container,
+                slug,
+                limiter=self._limiter,
+                timeout=self._timeout,
             )
 
         except ClientException as exc:
@@ -50,22 +99,18 @@ class SwiftBlockStoreComponent(BaseBlockStoreComponent):
             else:
                 raise BlockTimeoutError() from exc
 
+        # Connection errors once swiftclient is done retrying
+        except OSError as exc:
+            raise BlockTimeoutError() from exc
+
         return obj
 
     async def create(self, organization_id: OrganizationID, id: UUID, block: bytes) -> None:
         slug = f"{organization_id}/{id}"
         try:
-            _, obj = await trio.to_thread.run_sync(
-                self.swift_client.get_object, self._container, slug
+            await run_in_worker(
+                self._sync_create, slug, block, limiter=self._limiter, timeout=self._timeout
             )
 
-        except ClientException as exc:
-            if exc.http_status == 404:
-                await trio.to_thread.run_sync(
-                    partial(self.swift_client.put_object, self._container, slug, block)
-                )
-            else:
-                raise BlockTimeoutError() from exc
-
-        else:
-            raise BlockAlreadyExistsError()
+        except (ClientException, OSError) as exc:
+            raise BlockTimeoutError() from exc
@@ -48,6 +48,11 @@ async def run_with_breathing_transport(transport, fn, *args, **kwargs):
     online and handles websocket pings
     """
 
+    if transport.handshake.pipelining:
+        # The connection loop keeps reading the transport when pipelining is
+        # enabled, new requests are then processed concurrently with this one
+        return await fn(*args, **kwargs)
+
     rep = None
 
     async def _keep_transport_breathing():
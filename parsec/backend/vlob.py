@@ -1,6 +1,6 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) AGPLv3 2019 Scille SAS
 
-from typing import List, Tuple, Dict, Optional
+from typing import List, Tuple, Dict, Optional, Union
 from uuid import UUID
 import pendulum
 
@@ -10,6 +10,7 @@ from parsec.api.protocol import (
     OrganizationID,
     vlob_create_serializer,
     vlob_read_serializer,
+    vlob_read_batch_serializer,
     vlob_update_serializer,
     vlob_poll_changes_serializer,
     vlob_list_versions_serializer,
@@ -59,6 +60,23 @@ class VlobMaintenanceError(VlobError):
     pass
 
 
+def _vlob_read_error_to_rep(exc: VlobError) -> dict:
+    if isinstance(exc, VlobNotFoundError):
+        return {"status": "not_found", "reason": str(exc)}
+    elif isinstance(exc, VlobAccessError):
+        return {"status": "not_allowed"}
+    elif isinstance(exc, VlobVersionError):
+        return {"status": "bad_version"}
+    elif isinstance(exc, VlobTimestampError):
+        return {"status": "bad_timestamp"}
+    elif isinstance(exc, VlobEncryptionRevisionError):
+        return {"status": "bad_encryption_revision"}
+    elif isinstance(exc, VlobInMaintenanceError):
+        return {"status": "in_maintenance"}
+    else:
+        raise exc
+
+
 class BaseVlobComponent:
     @catch_protocol_errors
     async def api_vlob_create(self, client_ctx, msg):
@@ -122,6 +140,35 @@ class BaseVlobComponent:
             }
         )
 
+    @catch_protocol_errors
+    async def api_vlob_read_batch(self, client_ctx, msg):
+        msg = vlob_read_batch_serializer.req_load(msg)
+
+        results = await self.read_batch(
+            client_ctx.organization_id,
+            client_ctx.device_id,
+            msg["encryption_revision"],
+            [(x["vlob_id"], x["version"], x["timestamp"]) for x in msg["items"]],
+        )
+
+        items = []
+        for result in results:
+            if isinstance(result, VlobError):
+                items.append(_vlob_read_error_to_rep(result))
+            else:
+                version, blob, author, created_on = result
+                items.append(
+                    {
+                        "status": "ok",
+                        "blob": blob,
+                        "version": version,
+                        "author": author,
+                        "timestamp": created_on,
+                    }
+                )
+
+        return vlob_read_batch_serializer.rep_dump({"status": "ok", "items": items})
+
     @catch_protocol_errors
     async def api_vlob_update(self, client_ctx, msg):
         msg = vlob_update_serializer.req_load(msg)
@@ -322,6 +369,23 @@ class BaseVlobComponent:
         """
         raise NotImplementedError()
 
+    async def read_batch(
+        self,
+        organization_id: OrganizationID,
+        author: DeviceID,
+        encryption_revision: int,
+        items: List[Tuple[UUID, Optional[int], Optional[pendulum.Pendulum]]],
+    ) -> List[Union[Tuple[int, bytes, DeviceID, pendulum.Pendulum], VlobError]]:
+        """
+        Read several vlobs at once, each item being a (vlob_id, version, timestamp) tuple.
+
+        The results are returned in the same order than the items. An item that cannot
+        be read gets the error `read` would have raised instead of a result.
+
+        Raises: Nothing !
+        """
+        raise NotImplementedError()
+
     async def update(
         self,
         organization_id: OrganizationID,
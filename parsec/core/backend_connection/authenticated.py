@@ -39,6 +39,24 @@ def _handle_event(event_bus: EventBus, rep: dict) -> None:
         logger.warning("Bad response to `events_listen` command", rep=rep)
         return
 
+    _dispatch_event(event_bus, rep)
+
+
+def _handle_events(event_bus: EventBus, rep: dict) -> None:
+    if rep["status"] != "ok":
+        logger.warning("Bad response to `events_listen_batch` command", rep=rep)
+        return
+
+    for event in rep["events"]:
+        _dispatch_event(event_bus, event)
+
+    if rep["overflow"]:
+        # The backend has dropped some events, monitors must find out by
+        # themselves what they have missed
+        event_bus.send("backend.events.overflow")
+
+
+def _dispatch_event(event_bus: EventBus, rep: dict) -> None:
     if rep["event"] == "message.received":
         event_bus.send("backend.message.received", index=rep["index"])
 
@@ -75,10 +93,14 @@ def _handle_event(event_bus: EventBus, rep: dict) -> None:
         )
 
 
-def _transport_pool_factory(addr, device_id, signing_key, max_pool, keepalive):
+def _transport_pool_factory(addr, device_id, signing_key, max_pool, keepalive, pipelining):
     async def _connect():
         transport = await connect(
-            addr, device_id=device_id, signing_key=signing_key, keepalive=keepalive
+            addr,
+            device_id=device_id,
+            signing_key=signing_key,
+            keepalive=keepalive,
+            pipelining=pipelining,
         )
         transport.logger = transport.logger.bind(device_id=device_id)
         return transport
@@ -96,13 +118,15 @@ class BackendAuthenticatedConn:
         max_cooldown: int = 30,
         max_pool: int = 4,
         keepalive: Optional[int] = None,
+        max_pipelined_requests: int = 0,
+        max_events_per_listen: int = 100,
     ):
         if max_pool < 2:
             raise ValueError("max_pool must be at least 2 (for event listener + query sender)")
 
         self._started = False
         self._transport_pool = _transport_pool_factory(
-            addr, device_id, signing_key, max_pool, keepalive
+            addr, device_id, signing_key, max_pool, keepalive, max_pipelined_requests
         )
         self._status = BackendConnStatus.LOST
         self._status_exc = None
@@ -114,6 +138,7 @@ class BackendAuthenticatedConn:
         self._backend_connection_failures = 0
         self.event_bus = event_bus
         self.max_cooldown = max_cooldown
+        self.max_events_per_listen = max_events_per_listen
 
     @property
     def status(self) -> BackendConnStatus:
@@ -232,14 +257,26 @@ class BackendAuthenticatedConn:
                         "backend.connection.changed", status=self._status, status_exc=None
                     )
 
-                    while True:
-                        rep = await cmds.events_listen(transport, wait=True)
-                        _handle_event(self.event_bus, rep)
+                    await self._listen_events(transport)
 
             finally:
                 # No more monitors are running
                 self._monitors_idle_event.set()
 
+    async def _listen_events(self, transport):
+        while True:
+            rep = await cmds.events_listen_batch(
+                transport, wait=True, max_events=self.max_events_per_listen
+            )
+            if rep["status"] == "unknown_command":
+                # Older backend, fallback to one event per request
+                break
+            _handle_events(self.event_bus, rep)
+
+        while True:
+            rep = await cmds.events_listen(transport, wait=True)
+            _handle_event(self.event_bus, rep)
+
     @asynccontextmanager
     async def _acquire_transport(
         self, force_fresh=False, ignore_status=False, allow_not_available=False
@@ -1,6 +1,6 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) AGPLv3 2019 Scille SAS
 
-from typing import Tuple, List, Dict
+from typing import Tuple, List, Dict, Optional, Union
 from uuid import UUID
 import pendulum
 from pendulum import Pendulum
@@ -13,6 +13,7 @@ from parsec.api.protocol import (
     DeviceName,
     DeviceID,
     ProtocolError,
+    packb,
     ping_serializer,
     organization_create_serializer,
     organization_stats_serializer,
@@ -21,8 +22,10 @@ from parsec.api.protocol import (
     organization_bootstrap_serializer,
     events_subscribe_serializer,
     events_listen_serializer,
+    events_listen_batch_serializer,
     message_get_serializer,
     vlob_read_serializer,
+    vlob_read_batch_serializer,
     vlob_create_serializer,
     vlob_update_serializer,
     vlob_poll_changes_serializer,
@@ -36,7 +39,9 @@ from parsec.api.protocol import (
     realm_start_reencryption_maintenance_serializer,
     realm_finish_reencryption_maintenance_serializer,
     block_create_serializer,
+    block_create_batch_serializer,
     block_read_serializer,
+    block_read_batch_serializer,
     user_get_serializer,
     user_find_serializer,
     human_find_serializer,
@@ -54,9 +59,10 @@ from parsec.api.protocol import (
 )
 from parsec.core.types import EntryID
 from parsec.core.backend_connection.exceptions import BackendNotAvailable, BackendProtocolError
+from parsec.core.backend_connection.transport import TransportPipeline
 
 
-async def _send_cmd(transport: Transport, serializer, **req) -> dict:
+async def _send_cmd(transport: Union[Transport, TransportPipeline], serializer, **req) -> dict:
     """
     Raises:
         Backend
@@ -69,24 +75,37 @@ async def _send_cmd(transport: Transport, serializer, **req) -> dict:
         BackendCmdsBadResponse
     """
     transport.logger.info("Request", cmd=req["cmd"])
+    pipelined = isinstance(transport, TransportPipeline)
 
     try:
-        raw_req = serializer.req_dumps(req)
+        if pipelined:
+            req_data = serializer.req_dump(req)
+            req_id = req_data["req_id"] = transport.new_req_id()
+            raw_req = packb(req_data)
+        else:
+            raw_req = serializer.req_dumps(req)
 
     except ProtocolError as exc:
         transport.logger.exception("Invalid request data", cmd=req["cmd"], error=exc)
         raise BackendProtocolError("Invalid request data") from exc
 
     try:
-        await transport.send(raw_req)
-        raw_rep = await transport.recv()
+        if pipelined:
+            # The pipeline has to unpack the reply to dispatch it
+            rep_data = await transport.send_req(req_id, raw_req)
+        else:
+            await transport.send(raw_req)
+            raw_rep = await transport.recv()
 
     except TransportError as exc:
         transport.logger.debug("Request failed (backend not available)", cmd=req["cmd"])
         raise BackendNotAvailable(exc) from exc
 
     try:
-        rep = serializer.rep_loads(raw_rep)
+        if pipelined:
+            rep = serializer.rep_load(rep_data)
+        else:
+            rep = serializer.rep_loads(raw_rep)
 
     except ProtocolError as exc:
         transport.logger.exception("Invalid response data", cmd=req["cmd"], error=exc)
@@ -117,6 +136,18 @@ async def events_listen(transport: Transport, wait: bool = True) -> dict:
     return await _send_cmd(transport, events_listen_serializer, cmd="events_listen", wait=wait)
 
 
+async def events_listen_batch(
+    transport: Transport, wait: bool = True, max_events: int = 100
+) -> dict:
+    return await _send_cmd(
+        transport,
+        events_listen_batch_serializer,
+        cmd="events_listen_batch",
+        wait=wait,
+        max_events=max_events,
+    )
+
+
 ### Message API ###
 
 
@@ -165,6 +196,20 @@ async def vlob_read(
     )
 
 
+async def vlob_read_batch(
+    transport: Transport,
+    encryption_revision: int,
+    items: List[Tuple[UUID, Optional[int], Optional[pendulum.Pendulum]]],
+) -> dict:
+    return await _send_cmd(
+        transport,
+        vlob_read_batch_serializer,
+        cmd="vlob_read_batch",
+        encryption_revision=encryption_revision,
+        items=[{"vlob_id": x[0], "version": x[1], "timestamp": x[2]} for x in items],
+    )
+
+
 async def vlob_update(
     transport: Transport,
     encryption_revision: int,
@@ -310,10 +355,28 @@ async def block_create(transport: Transport, block_id: UUID, realm_id: UUID, blo
     )
 
 
+async def block_create_batch(
+    transport: Transport, realm_id: UUID, blocks: List[Tuple[UUID, bytes]]
+) -> dict:
+    return await _send_cmd(
+        transport,
+        block_create_batch_serializer,
+        cmd="block_create_batch",
+        realm_id=realm_id,
+        blocks=[{"block_id": x[0], "block": x[1]} for x in blocks],
+    )
+
+
 async def block_read(transport: Transport, block_id: UUID) -> dict:
     return await _send_cmd(transport, block_read_serializer, cmd="block_read", block_id=block_id)
 
 
+async def block_read_batch(transport: Transport, block_ids: List[UUID]) -> dict:
+    return await _send_cmd(
+        transport, block_read_batch_serializer, cmd="block_read_batch", block_ids=block_ids
+    )
+
+
 ### User API ###
 
 
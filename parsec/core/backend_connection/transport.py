@@ -3,6 +3,7 @@
 import os
 import trio
 import ssl
+from itertools import count
 from async_generator import asynccontextmanager
 from structlog import get_logger
 from typing import Optional, Union
@@ -12,6 +13,7 @@ from parsec.api.transport import Transport, TransportError, TransportClosedByPee
 from parsec.api.protocol import (
     DeviceID,
     ProtocolError,
+    unpackb,
     HandshakeError,
     AnonymousClientHandshake,
     AuthenticatedClientHandshake,
@@ -35,7 +37,8 @@ async def connect(
     signing_key: Optional[SigningKey] = None,
     administration_token: Optional[str] = None,
     keepalive: Optional[int] = None,
-) -> Transport:
+    pipelining: int = 0,
+) -> Union[Transport, "TransportPipeline"]:
     """
     Raises:
         BackendConnectionError
@@ -65,7 +68,11 @@ async def connect(
         if not signing_key:
             raise BackendConnectionError(f"Missing signing_key to connect as `{device_id}`")
         handshake = AuthenticatedClientHandshake(
-            addr.organization_id, device_id, signing_key, addr.root_verify_key
+            addr.organization_id,
+            device_id,
+            signing_key,
+            addr.root_verify_key,
+            pipelining=pipelining,
         )
 
     try:
@@ -95,6 +102,8 @@ async def connect(
         await transport.aclose()
         raise
 
+    if handshake.pipelining:
+        return TransportPipeline(transport, handshake.pipelining)
     return transport
 
 
@@ -131,12 +140,126 @@ async def _do_handshake(transport: Transport, handshake):
         raise BackendProtocolError(exc) from exc
 
 
+class TransportPipeline:
+    """
+    Transport on which requests pipelining has been negotiated with the backend.
+
+    Multiple requests can be in flight concurrently, each one being tagged with
+    a `req_id` the backend copies into the reply. There is no dedicated reader
+    task: the first requester waiting for a reply reads the transport and
+    dispatches the replies of the others until its own arrives, then wakes up
+    the remaining requesters so one of them takes over the reading.
+    """
+
+    def __init__(self, transport: Transport, max_in_flight: int):
+        self.transport = transport
+        self.broken = False
+        self._in_flight = trio.Semaphore(max_in_flight)
+        self._req_ids = count()
+        self._waiters = {}
+        self._replies = {}
+        self._reading = False
+
+    @property
+    def conn_id(self):
+        return self.transport.conn_id
+
+    @property
+    def logger(self):
+        return self.transport.logger
+
+    @logger.setter
+    def logger(self, logger):
+        self.transport.logger = logger
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+    def new_req_id(self) -> int:
+        return next(self._req_ids)
+
+    async def send_req(self, req_id: int, raw_req: bytes) -> dict:
+        """
+        `raw_req` must contain the `req_id` field, the unpacked reply is returned.
+
+        Raises:
+            TransportError
+        """
+        async with self._in_flight:
+            if self.broken:
+                raise TransportError("Transport is no longer usable")
+
+            self._waiters[req_id] = trio.Event()
+            try:
+                try:
+                    await self.transport.send(raw_req)
+                except BaseException:
+                    # The request may have been partially sent
+                    self._set_broken()
+                    raise
+
+                while True:
+                    if req_id in self._replies:
+                        return self._replies.pop(req_id)
+                    if self.broken:
+                        raise TransportError("Connection lost while waiting for reply")
+                    if self._reading:
+                        waiter = self._waiters[req_id] = trio.Event()
+                        await waiter.wait()
+                    else:
+                        await self._read_replies(req_id)
+
+            finally:
+                del self._waiters[req_id]
+                self._replies.pop(req_id, None)
+
+    async def _read_replies(self, req_id: int) -> None:
+        self._reading = True
+        try:
+            while req_id not in self._replies:
+                raw_rep = await self.transport.recv()
+                try:
+                    rep = unpackb(raw_rep)
+                    rep_req_id = rep.pop("req_id")
+                except (ProtocolError, AttributeError, KeyError) as exc:
+                    raise TransportError(f"Invalid pipelined reply: {exc}") from exc
+                waiter = self._waiters.get(rep_req_id)
+                # Replies to cancelled requests are simply ignored
+                if waiter:
+                    self._replies[rep_req_id] = rep
+                    waiter.set()
+
+        except TransportError:
+            self._set_broken()
+            raise
+
+        finally:
+            self._reading = False
+            # Hand over the reading to the requesters still waiting
+            for waiter in self._waiters.values():
+                waiter.set()
+
+    def _set_broken(self) -> None:
+        self.broken = True
+        for waiter in self._waiters.values():
+            waiter.set()
+
+
 class TransportPool:
     def __init__(self, connect_cb, max_pool):
         self._connect_cb = connect_cb
         self._transports = []
         self._closed = False
         self._lock = trio.Semaphore(max_pool)
+        # Pipelined transport shared by the requests (it doesn't hold a slot
+        # in the pool given it limits the in-flight requests by itself)
+        self._shared = None
+
+    def _share(self, transport) -> bool:
+        if isinstance(transport, TransportPipeline) and not transport.broken and not self._shared:
+            self._shared = transport
+            return True
+        return False
 
     @asynccontextmanager
     async def acquire(self, force_fresh=False):
@@ -145,30 +268,61 @@ class TransportPool:
             BackendConnectionError
             trio.ClosedResourceError: if used after having being closed
         """
-        async with self._lock:
-            transport = None
-            if not force_fresh:
-                try:
-                    # Fifo style to retreive oldest first
-                    transport = self._transports.pop(0)
-                except IndexError:
-                    pass
+        shared = None if force_fresh else self._shared
+        if not shared:
+            async with self._lock:
+                # Shared transport may have been created while we were waiting
+                shared = None if force_fresh else self._shared
+                if not shared:
+                    transport = None
+                    if not force_fresh:
+                        try:
+                            # Fifo style to retreive oldest first
+                            transport = self._transports.pop(0)
+                        except IndexError:
+                            pass
 
-            if not transport:
-                if self._closed:
-                    raise trio.ClosedResourceError()
+                    if not transport:
+                        if self._closed:
+                            raise trio.ClosedResourceError()
 
-                transport = await self._connect_cb()
+                        transport = await self._connect_cb()
 
-            try:
-                yield transport
+                    if force_fresh or not self._share(transport):
+                        try:
+                            yield transport
+
+                        except TransportClosedByPeer:
+                            raise
+
+                        except Exception:
+                            await transport.aclose()
+                            raise
+
+                        else:
+                            if not self._share(transport):
+                                self._transports.append(transport)
 
-            except TransportClosedByPeer:
-                raise
+                        return
 
-            except Exception:
+                    shared = transport
+
+        # No need to keep a slot in the pool for a shared transport
+        async with self._use_shared(shared) as transport:
+            yield transport
+
+    @asynccontextmanager
+    async def _use_shared(self, transport):
+        try:
+            yield transport
+
+        except Exception:
+            if transport.broken:
+                if self._shared is transport:
+                    self._shared = None
                 await transport.aclose()
-                raise
+            raise
 
-            else:
-                self._transports.append(transport)
+        finally:
+            if transport.broken and self._shared is transport:
+                self._shared = None
@@ -11,6 +11,7 @@ from parsec.core.cli import create_organization
 from parsec.core.cli import stats_organization
 from parsec.core.cli import create_workspace
 from parsec.core.cli import share_workspace
+from parsec.core.cli import pin_path
 from parsec.core.cli import bootstrap_organization
 from parsec.core.cli import run
 
@@ -27,6 +28,7 @@ core_cmd.add_command(run.run_gui, "gui")
 core_cmd.add_command(run.run_mountpoint, "run")
 core_cmd.add_command(create_workspace.create_workspace, "create_workspace")
 core_cmd.add_command(share_workspace.share_workspace, "share_workspace")
+core_cmd.add_command(pin_path.pin_path, "pin_path")
 core_cmd.add_command(list_devices.list_devices, "list_devices")
 core_cmd.add_command(invite_user.invite_user, "invite_user")
 core_cmd.add_command(claim_user.claim_user, "claim_user")
@@ -0,0 +1,38 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) AGPLv3 2019 Scille SAS
+
+import click
+
+from parsec.utils import trio_run
+from parsec.cli_utils import cli_exception_handler
+from parsec.core import logged_core_factory
+from parsec.core.fs import FSWorkspaceNotFoundError
+from parsec.core.cli.utils import core_config_and_device_options
+
+
+async def _pin_path(config, device, workspace_name, path, unpin):
+    async with logged_core_factory(config, device) as core:
+        user_manifest = core.user_fs.get_user_manifest()
+        for workspace_entry in user_manifest.workspaces:
+            if workspace_entry.name == workspace_name:
+                break
+        else:
+            raise FSWorkspaceNotFoundError(f"Unknown workspace `{workspace_name}`")
+
+        workspace = core.user_fs.get_workspace(workspace_entry.id)
+        if unpin:
+            await workspace.unpin(path)
+        else:
+            await workspace.pin(path)
+
+
+@click.command(short_help="make a path available offline")
+@core_config_and_device_options
+@click.argument("workspace_name")
+@click.argument("path")
+@click.option("--unpin", is_flag=True, help="No longer keep the path available offline")
+def pin_path(config, device, workspace_name, path, unpin, **kwargs):
+    """
+    Download a file or a folder and keep it available offline.
+    """
+    with cli_exception_handler(config.debug):
+        trio_run(_pin_path, config, device, workspace_name, path, unpin)
@@ -52,11 +52,17 @@ class CoreConfig:
     cache_base_dir: Path
     mountpoint_base_dir: Path
 
+    # Shared by the block caches of all the workspaces
+    block_cache_size: int = 512 * 1024 * 1024
+
     debug: bool = False
 
     backend_max_cooldown: int = 30
     backend_connection_keepalive: Optional[int] = 29
     backend_max_connections: int = 4
+    # Max number of requests sent concurrently on a single connection
+    # (0 disables requests pipelining)
+    backend_max_pipelined_requests: int = 0
 
     invitation_token_size: int = 8
 
@@ -89,10 +95,12 @@ def config_factory(
     data_base_dir: Path = None,
     cache_base_dir: Path = None,
     mountpoint_base_dir: Path = None,
+    block_cache_size: int = 512 * 1024 * 1024,
     mountpoint_enabled: bool = False,
     backend_max_cooldown: int = 30,
     backend_connection_keepalive: Optional[int] = 29,
     backend_max_connections: int = 4,
+    backend_max_pipelined_requests: int = 0,
     telemetry_enabled: bool = True,
     debug: bool = False,
     gui_last_device: str = None,
@@ -112,10 +120,12 @@ def config_factory(
         data_base_dir=data_base_dir,
         cache_base_dir=cache_base_dir or get_default_cache_base_dir(environ),
         mountpoint_base_dir=get_default_mountpoint_base_dir(environ),
+        block_cache_size=block_cache_size,
         mountpoint_enabled=mountpoint_enabled,
         backend_max_cooldown=backend_max_cooldown,
         backend_connection_keepalive=backend_connection_keepalive,
         backend_max_connections=backend_max_connections,
+        backend_max_pipelined_requests=backend_max_pipelined_requests,
         telemetry_enabled=telemetry_enabled,
         debug=debug,
         sentry_url=environ.get("SENTRY_URL") or None,
@@ -183,6 +193,7 @@ def save_config(config: CoreConfig):
             {
                 "data_base_dir": str(config.data_base_dir),
                 "cache_base_dir": str(config.cache_base_dir),
+                "block_cache_size": config.block_cache_size,
                 "telemetry_enabled": config.telemetry_enabled,
                 "backend_max_cooldown": config.backend_max_cooldown,
                 "backend_connection_keepalive": config.backend_connection_keepalive,
@@ -1,9 +1,11 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) AGPLv3 2019 Scille SAS
 
+import trio
+from functools import partial
 from pendulum import Pendulum, now as pendulum_now
 from typing import Dict, Optional, List, Tuple
 
-from parsec.utils import timestamps_in_the_ballpark
+from parsec.utils import timestamps_in_the_ballpark, run_cpu_bound
 from parsec.crypto import HashDigest, CryptoError
 from parsec.api.protocol import UserID, DeviceID, RealmRole
 from parsec.api.data import (
@@ -28,6 +30,44 @@ from parsec.core.fs.exceptions import (
     FSWorkspaceNoWriteAccess,
 )
 
+# Should be lower than the size of the backend connection pool,
+# one connection being kept busy by the event listener
+DEFAULT_MAX_CONCURRENT_DOWNLOADS = 3
+DEFAULT_MAX_CONCURRENT_UPLOADS = 3
+
+# Maximum number of vlobs accepted by the backend in a single `vlob_read_batch`
+VLOB_READ_BATCH_MAX_SIZE = 1000
+
+# Blocks up to this size are grouped into `block_read_batch` and `block_create_batch`
+# requests, each request carrying at most `BLOCK_BATCH_MAX_COUNT` blocks for a
+# total of `BLOCK_BATCH_MAX_BYTES`
+BLOCK_BATCH_ITEM_MAX_SIZE = 64 * 1024
+BLOCK_BATCH_MAX_BYTES = 1024 * 1024
+BLOCK_BATCH_MAX_COUNT = 1000
+
+
+def _split_block_batches(items: list, get_size) -> List[list]:
+    """Group the small blocks into batches, the bigger ones being left alone."""
+    batches = []
+    batch = []
+    batch_size = 0
+    for item in items:
+        size = get_size(item)
+        if size > BLOCK_BATCH_ITEM_MAX_SIZE:
+            batches.append([item])
+            continue
+        if batch and (
+            batch_size + size > BLOCK_BATCH_MAX_BYTES or len(batch) >= BLOCK_BATCH_MAX_COUNT
+        ):
+            batches.append(batch)
+            batch = []
+            batch_size = 0
+        batch.append(item)
+        batch_size += size
+    if batch:
+        batches.append(batch)
+    return batches
+
 
 class RemoteLoader:
     def __init__(
@@ -38,6 +78,7 @@ class RemoteLoader:
         backend_cmds,
         remote_device_manager,
         local_storage,
+        max_concurrent_downloads: int = DEFAULT_MAX_CONCURRENT_DOWNLOADS,
     ):
         self.device = device
         self.workspace_id = workspace_id
@@ -45,6 +86,8 @@ class RemoteLoader:
         self.backend_cmds = backend_cmds
         self.remote_device_manager = remote_device_manager
         self.local_storage = local_storage
+        self._download_limiter = trio.CapacityLimiter(max(max_concurrent_downloads, 1))
+        self._blocks_in_flight = {}
         self._realm_role_certificates_cache = None
         self._realm_role_certificates_cache_timestamp = None
 
@@ -170,8 +213,15 @@ class RemoteLoader:
             FSBackendOfflineError
             FSWorkspaceInMaintenance
         """
-        for access in accesses:
-            await self.load_block(access)
+        # The small blocks are downloaded in batches. The number of concurrent downloads
+        # is bounded by `load_block` and `_load_block_batch`. The service nursery
+        # collapses the multi-errors, so the first error is raised as is.
+        async with trio.open_service_nursery() as nursery:
+            for batch in _split_block_batches(accesses, lambda access: access.size):
+                if len(batch) == 1:
+                    nursery.start_soon(self.load_block, batch[0])
+                else:
+                    nursery.start_soon(self._load_block_batch, batch)
 
     async def load_block(self, access: BlockAccess) -> None:
         """
@@ -182,8 +232,51 @@ class RemoteLoader:
             FSWorkspaceInMaintenance
             FSWorkspaceNoAccess
         """
-        # Download
-        rep = await self._backend_cmds("block_read", access.id)
+        # The block is already being downloaded by another task: simply wait for
+        # this download to complete. If it fails, the block is still missing and
+        # the caller will request it again.
+        in_flight = self._blocks_in_flight.get(access.id)
+        if in_flight is not None:
+            await in_flight.wait()
+            return
+
+        in_flight = self._blocks_in_flight[access.id] = trio.Event()
+        try:
+            async with self._download_limiter:
+                await self._load_block(access)
+        finally:
+            del self._blocks_in_flight[access.id]
+            in_flight.set()
+
+    async def _load_block_batch(self, accesses: List[BlockAccess]) -> None:
+        # Same as `load_block`: the blocks already being downloaded by other
+        # tasks are simply waited for
+        to_load = {}
+        in_flights = {}
+        waiting = []
+        for access in accesses:
+            in_flight = self._blocks_in_flight.get(access.id)
+            if in_flight is not None:
+                waiting.append(in_flight)
+                continue
+            in_flights[access.id] = self._blocks_in_flight[access.id] = trio.Event()
+            to_load[access.id] = access
+        try:
+            if len(to_load) == 1:
+                async with self._download_limiter:
+                    await self._load_block(*to_load.values())
+            elif to_load:
+                async with self._download_limiter:
+                    await self._load_blocks(list(to_load.values()))
+        finally:
+            for block_id, in_flight in in_flights.items():
+                del self._blocks_in_flight[block_id]
+                in_flight.set()
+
+        for in_flight in waiting:
+            await in_flight.wait()
+
+    def _check_block_read_rep(self, access: BlockAccess, rep: dict) -> None:
         if rep["status"] == "not_found":
             raise FSRemoteBlockNotFound(access)
         elif rep["status"] == "not_allowed":
@@ -196,17 +289,78 @@ class RemoteLoader:
         elif rep["status"] != "ok":
             raise FSError(f"Cannot download block: `{rep['status']}`")
 
-        # Decryption
+    async def _load_block(self, access: BlockAccess) -> None:
+        # Download
+        rep = await self._backend_cmds("block_read", access.id)
+        self._check_block_read_rep(access, rep)
+        await self._store_blocks([(access, rep["block"])])
+
+    async def _load_blocks(self, accesses: List[BlockAccess]) -> None:
+        # Download all the blocks in a single request
+        rep = await self._backend_cmds("block_read_batch", [access.id for access in accesses])
+        if rep["status"] == "unknown_command":
+            # Older backend, fallback to one block per request
+            items = []
+            for access in accesses:
+                items.append(await self._backend_cmds("block_read", access.id))
+            rep = {"status": "ok", "items": items}
+        if rep["status"] != "ok":
+            raise FSError(f"Cannot download blocks: `{rep['status']}`")
+
+        # Keep the blocks that have been downloaded, even if some others have failed
+        ciphered_blocks = []
+        error = None
+        for access, item_rep in zip(accesses, rep["items"]):
+            try:
+                self._check_block_read_rep(access, item_rep)
+            except FSError as exc:
+                error = error or exc
+                continue
+            ciphered_blocks.append((access, item_rep["block"]))
+
+        await self._store_blocks(ciphered_blocks)
+        if error:
+            raise error
+
+    async def _store_blocks(self, ciphered_blocks: List[Tuple[BlockAccess, bytes]]) -> None:
+        # Decryption and digest check, both performed in a single worker thread call
+        def _decrypt_blocks():
+            results = []
+            for access, ciphered in ciphered_blocks:
+                block = access.key.decrypt(ciphered)
+                results.append((block, HashDigest.from_data(block)))
+            return results
+
         try:
-            block = access.key.decrypt(rep["block"])
+            results = await run_cpu_bound(
+                _decrypt_blocks, size=sum(len(ciphered) for _, ciphered in ciphered_blocks)
+            )
 
         # Decryption error
         except CryptoError as exc:
             raise FSError(f"Cannot decrypt block: {exc}") from exc
 
-        # TODO: let encryption manager do the digest check ?
-        assert HashDigest.from_data(block) == access.digest, access
-        await self.local_storage.set_clean_block(access.id, block)
+        for (access, _), (block, digest) in zip(ciphered_blocks, results):
+            # TODO: let encryption manager do the digest check ?
+            assert digest == access.digest, access
+            await self.local_storage.set_clean_block(access.id, block)
+
+    async def upload_blocks(self, blocks: List[Tuple[BlockAccess, bytes]]):
+        """
+        Upload the blocks one after the other, the small ones being grouped
+        into batch requests.
+
+        Raises:
+            FSError
+            FSBackendOfflineError
+            FSWorkspaceInMaintenance
+            FSWorkspaceNoAccess
+        """
+        for batch in _split_block_batches(blocks, lambda block: len(block[1])):
+            if len(batch) == 1:
+                await self.upload_block(*batch[0])
+            else:
+                await self._upload_block_batch(batch)
 
     async def upload_block(self, access: BlockAccess, data: bytes):
         """
@@ -218,7 +372,7 @@ class RemoteLoader:
         """
         # Encryption
         try:
-            ciphered = access.key.encrypt(data)
+            ciphered = await run_cpu_bound(access.key.encrypt, data, size=len(data))
 
         # Encryption error
         except CryptoError as exc:
@@ -226,6 +380,13 @@ class RemoteLoader:
 
         # Upload block
         rep = await self._backend_cmds("block_create", access.id, self.workspace_id, ciphered)
+        self._check_block_create_rep(rep)
+
+        # Update local storage
+        await self.local_storage.set_clean_block(access.id, data)
+        await self.local_storage.clear_chunk(ChunkID(access.id), miss_ok=True)
+
+    def _check_block_create_rep(self, rep: dict) -> None:
         if rep["status"] == "already_exists":
             # Ignore exception if the block has already been uploaded
             # This might happen when a failure occurs before the local storage is updated
@@ -240,9 +401,54 @@ class RemoteLoader:
         elif rep["status"] != "ok":
             raise FSError(f"Cannot upload block: {rep}")
 
-        # Update local storage
-        await self.local_storage.set_clean_block(access.id, data)
-        await self.local_storage.clear_chunk(ChunkID(access.id), miss_ok=True)
+    async def _upload_block_batch(self, blocks: List[Tuple[BlockAccess, bytes]]):
+        # Encryption, performed in a single worker thread call
+        def _encrypt_blocks():
+            return [access.key.encrypt(data) for access, data in blocks]
+
+        try:
+            ciphered_blocks = await run_cpu_bound(
+                _encrypt_blocks, size=sum(len(data) for _, data in blocks)
+            )
+
+        # Encryption error
+        except CryptoError as exc:
+            raise FSError(f"Cannot encrypt block: {exc}") from exc
+
+        # Upload all the blocks in a single request
+        items = [(access.id, ciphered) for (access, _), ciphered in zip(blocks, ciphered_blocks)]
+        rep = await self._backend_cmds("block_create_batch", self.workspace_id, items)
+        if rep["status"] == "unknown_command":
+            # Older backend, fallback to one block per request
+            item_reps = []
+            for block_id, ciphered in items:
+                item_reps.append(
+                    await self._backend_cmds("block_create", block_id, self.workspace_id, ciphered)
+                )
+            rep = {"status": "ok", "items": item_reps}
+        if rep["status"] == "not_allowed":
+            # Seems we lost the access to the realm
+            raise FSWorkspaceNoWriteAccess("Cannot upload block: no write access")
+        elif rep["status"] == "in_maintenance":
+            raise FSWorkspaceInMaintenance(
+                f"Cannot upload block while the workspace in maintenance"
+            )
+        elif rep["status"] != "ok":
+            raise FSError(f"Cannot upload blocks: {rep}")
+
+        # Update local storage with the blocks that have been uploaded.
+        # As for `upload_block`, a block might have already been uploaded.
+        error = None
+        for (access, data), item_rep in zip(blocks, rep["items"]):
+            try:
+                self._check_block_create_rep(item_rep)
+            except FSError as exc:
+                error = error or exc
+                continue
+            await self.local_storage.set_clean_block(access.id, data)
+            await self.local_storage.clear_chunk(ChunkID(access.id), miss_ok=True)
+        if error:
+            raise error
 
     async def load_manifest(
         self,
@@ -280,6 +486,90 @@ class RemoteLoader:
             version=version,
             timestamp=timestamp if version is None else None,
         )
+        self._check_vlob_read_rep(entry_id, rep)
+
+        if version not in (None, rep["version"]):
+            raise FSError(
+                f"Backend returned invalid version for vlob {entry_id} (expecting {version}, "
+                f"got {rep['version']})"
+            )
+
+        if expected_backend_timestamp and expected_backend_timestamp != rep["timestamp"]:
+            raise FSError(
+                f"Backend returned invalid expected timestamp for vlob {entry_id} at version "
+                f"{version} (expecting {expected_backend_timestamp}, got {rep['timestamp']})"
+            )
+
+        remote_manifest, = await self._decrypt_and_verify_manifests(
+            workspace_entry, [(entry_id, rep)]
+        )
+        return remote_manifest
+
+    async def load_manifests(
+        self, entry_ids: List[EntryID], timestamp: Pendulum = None
+    ) -> Dict[EntryID, RemoteManifest]:
+        """
+        Download the last version (or the version at the given timestamp) of several
+        manifests at once, the ones that are not found are omitted.
+
+        Raises:
+            FSError
+            FSBackendOfflineError
+            FSWorkspaceInMaintenance
+            FSBadEncryptionRevision
+            FSWorkspaceNoAccess
+        """
+        workspace_entry = self.get_workspace_entry()
+        manifests = {}
+        for i in range(0, len(entry_ids), VLOB_READ_BATCH_MAX_SIZE):
+            batch = entry_ids[i : i + VLOB_READ_BATCH_MAX_SIZE]
+
+            # Download the vlobs
+            async with self._download_limiter:
+                rep = await self._backend_cmds(
+                    "vlob_read_batch",
+                    workspace_entry.encryption_revision,
+                    [(entry_id, None, timestamp) for entry_id in batch],
+                )
+                if rep["status"] == "unknown_command":
+                    # Older backend, fallback to one vlob per request
+                    items = []
+                    for entry_id in batch:
+                        item_rep = await self._backend_cmds(
+                            "vlob_read",
+                            workspace_entry.encryption_revision,
+                            entry_id,
+                            timestamp=timestamp,
+                        )
+                        items.append(item_rep)
+                    rep = {"status": "ok", "items": items}
+            if rep["status"] != "ok":
+                raise FSError(f"Cannot fetch vlobs: `{rep['status']}`")
+
+            vlobs = []
+            for entry_id, item_rep in zip(batch, rep["items"]):
+                try:
+                    self._check_vlob_read_rep(entry_id, item_rep)
+                except FSRemoteManifestNotFound:
+                    continue
+                vlobs.append((entry_id, item_rep))
+
+            # Then verify them all together
+            remote_manifests = await self._decrypt_and_verify_manifests(workspace_entry, vlobs)
+            for (entry_id, _), remote_manifest in zip(vlobs, remote_manifests):
+                manifests[entry_id] = remote_manifest
+
+        return manifests
+
+    def _check_vlob_read_rep(self, entry_id: EntryID, rep: dict) -> None:
+        """
+        Raises:
+            FSError
+            FSWorkspaceInMaintenance
+            FSRemoteManifestNotFound
+            FSBadEncryptionRevision
+            FSWorkspaceNoAccess
+        """
         if rep["status"] == "not_found":
             raise FSRemoteManifestNotFound(entry_id)
         elif rep["status"] == "not_allowed":
@@ -300,52 +590,58 @@ class RemoteLoader:
         elif rep["status"] != "ok":
             raise FSError(f"Cannot fetch vlob {entry_id}: `{rep['status']}`")
 
-        expected_version = rep["version"]
-        expected_author = rep["author"]
-        expected_timestamp = rep["timestamp"]
-        if version not in (None, expected_version):
-            raise FSError(
-                f"Backend returned invalid version for vlob {entry_id} (expecting {version}, "
-                f"got {expected_version})"
-            )
-
-        if expected_backend_timestamp and expected_backend_timestamp != expected_timestamp:
-            raise FSError(
-                f"Backend returned invalid expected timestamp for vlob {entry_id} at version "
-                f"{version} (expecting {expected_backend_timestamp}, got {expected_timestamp})"
-            )
-
-        author = await self.remote_device_manager.get_device(expected_author)
+    async def _decrypt_and_verify_manifests(
+        self, workspace_entry, vlobs: List[Tuple[EntryID, dict]]
+    ) -> List[RemoteManifest]:
+        """
+        Raises:
+            FSError
+            FSBackendOfflineError
+        """
+        # Each author is only fetched once
+        authors = {}
+        for _, rep in vlobs:
+            if rep["author"] not in authors:
+                authors[rep["author"]] = await self.remote_device_manager.get_device(rep["author"])
+
+        def _decrypt_verify_and_load_all():
+            return [
+                RemoteManifest.decrypt_verify_and_load(
+                    rep["blob"],
+                    key=workspace_entry.key,
+                    author_verify_key=authors[rep["author"]].verify_key,
+                    expected_author=rep["author"],
+                    expected_timestamp=rep["timestamp"],
+                    expected_version=rep["version"],
+                    expected_id=entry_id,
+                )
+                for entry_id, rep in vlobs
+            ]
 
         try:
-            remote_manifest = RemoteManifest.decrypt_verify_and_load(
-                rep["blob"],
-                key=workspace_entry.key,
-                author_verify_key=author.verify_key,
-                expected_author=expected_author,
-                expected_timestamp=expected_timestamp,
-                expected_version=expected_version,
-                expected_id=entry_id,
+            remote_manifests = await run_cpu_bound(
+                _decrypt_verify_and_load_all, size=sum(len(rep["blob"]) for _, rep in vlobs)
             )
         except DataError as exc:
             raise FSError(f"Cannot decrypt vlob: {exc}") from exc
 
-        # Finally make sure author was allowed to create this manifest
-        role_at_timestamp = await self._get_user_realm_role_at(
-            expected_author.user_id, expected_timestamp
-        )
-        if role_at_timestamp is None:
-            raise FSError(
-                f"Manifest was created at {expected_timestamp} by `{expected_author}` "
-                "which had no right to access the workspace at that time"
-            )
-        elif role_at_timestamp == RealmRole.READER:
-            raise FSError(
-                f"Manifest was created at {expected_timestamp} by `{expected_author}` "
-                "which had write right on the workspace at that time"
+        # Finally make sure authors were allowed to create those manifests
+        for _, rep in vlobs:
+            role_at_timestamp = await self._get_user_realm_role_at(
+                rep["author"].user_id, rep["timestamp"]
             )
+            if role_at_timestamp is None:
+                raise FSError(
+                    f"Manifest was created at {rep['timestamp']} by `{rep['author']}` "
+                    "which had no right to access the workspace at that time"
+                )
+            elif role_at_timestamp == RealmRole.READER:
+                raise FSError(
+                    f"Manifest was created at {rep['timestamp']} by `{rep['author']}` "
+                    "which had write right on the workspace at that time"
+                )
 
-        return remote_manifest
+        return remote_manifests
 
     async def list_versions(self, entry_id: EntryID) -> Dict[int, Tuple[Pendulum, DeviceID]]:
         """
@@ -404,8 +700,12 @@ class RemoteLoader:
         workspace_entry = self.get_workspace_entry()
 
         try:
-            ciphered = manifest.dump_sign_and_encrypt(
-                key=workspace_entry.key, author_signkey=self.device.signing_key
+            ciphered = await run_cpu_bound(
+                partial(
+                    manifest.dump_sign_and_encrypt,
+                    key=workspace_entry.key,
+                    author_signkey=self.device.signing_key,
+                )
             )
         except DataError as exc:
             raise FSError(f"Cannot encrypt vlob: {exc}") from exc
@@ -512,6 +812,8 @@ class RemoteLoaderTimestamped(RemoteLoader):
         self.backend_cmds = remote_loader.backend_cmds
         self.remote_device_manager = remote_loader.remote_device_manager
         self.local_storage = remote_loader.local_storage.to_timestamped(timestamp)
+        self._download_limiter = remote_loader._download_limiter
+        self._blocks_in_flight = remote_loader._blocks_in_flight
         self._realm_role_certificates_cache = None
         self._realm_role_certificates_cache_timestamp = None
         self.timestamp = timestamp
@@ -519,6 +821,9 @@ class RemoteLoaderTimestamped(RemoteLoader):
     async def upload_block(self, *e, **ke):
         raise FSError(f"Cannot upload block through a timestamped remote loader")
 
+    async def upload_blocks(self, *e, **ke):
+        raise FSError(f"Cannot upload blocks through a timestamped remote loader")
+
     async def load_manifest(
         self,
         entry_id: EntryID,
@@ -551,6 +856,21 @@ class RemoteLoaderTimestamped(RemoteLoader):
             expected_backend_timestamp=expected_backend_timestamp,
         )
 
+    async def load_manifests(
+        self, entry_ids: List[EntryID], timestamp: Pendulum = None
+    ) -> Dict[EntryID, RemoteManifest]:
+        """
+        Raises:
+            FSError
+            FSBackendOfflineError
+            FSWorkspaceInMaintenance
+            FSBadEncryptionRevision
+            FSWorkspaceNoAccess
+        """
+        if timestamp is None:
+            timestamp = self.timestamp
+        return await super().load_manifests(entry_ids, timestamp=timestamp)
+
     async def upload_manifest(self, *e, **ke):
         raise FSError(f"Cannot upload manifest through a timestamped remote loader")
 
@@ -2,15 +2,17 @@
 
 from parsec.core.fs.storage.local_database import LocalDatabase
 from parsec.core.fs.storage.user_storage import UserStorage
-from parsec.core.fs.storage.manifest_storage import ManifestStorage
-from parsec.core.fs.storage.chunk_storage import ChunkStorage, BlockStorage
+from parsec.core.fs.storage.manifest_storage import ManifestStorage, ManifestCacheStatistics
+from parsec.core.fs.storage.chunk_storage import ChunkStorage, BlockStorage, BlockCacheManager
 from parsec.core.fs.storage.workspace_storage import WorkspaceStorage, WorkspaceStorageTimestamped
 
 __all__ = (
     "LocalDatabase",
     "ManifestStorage",
+    "ManifestCacheStatistics",
     "ChunkStorage",
     "BlockStorage",
+    "BlockCacheManager",
     "UserStorage",
     "WorkspaceStorage",
     "WorkspaceStorageTimestamped",
@@ -1,16 +1,30 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) AGPLv3 2019 Scille SAS
 
 import time
+from typing import Optional, List, Dict, Tuple
+from collections import defaultdict
 
 import trio
 from async_generator import asynccontextmanager
 
+from parsec.utils import run_cpu_bound
 from parsec.core.types import ChunkID
 from parsec.core.fs.exceptions import FSLocalMissError
 from parsec.core.types import LocalDevice, DEFAULT_BLOCK_SIZE
 from parsec.core.fs.storage.local_database import LocalDatabase
 
 
+# Number of buffered access times that triggers a write to the block cache
+DEFAULT_ACCESS_FLUSH_THRESHOLD = 100
+
+# Maximum number of host parameters in a single SQLite statement
+SQLITE_MAX_VARIABLE_NUMBER = 999
+
+
+def _decrypt_chunks(key, ciphered_chunks: Dict[ChunkID, bytes]) -> Dict[ChunkID, bytes]:
+    return {chunk_id: key.decrypt(ciphered) for chunk_id, ciphered in ciphered_chunks.items()}
+
+
 class ChunkStorage:
     """Interface to access the local chunks of data."""
 
@@ -33,7 +47,7 @@ class ChunkStorage:
             with trio.CancelScope(shield=True):
                 await self.localdb.commit()
 
-    def _open_cursor(self):
+    async def _write(self, fn, *args):
         # There is no point in commiting dirty chunks:
         # they are referenced by a manifest that will get commited
         # soon after them. This greatly improves the performance of
@@ -42,12 +56,15 @@ class ChunkStorage:
         # memory during the writing, this means that the data and
         # metadata is typically not flushed to the disk until an
         # an acutal flush operation is performed.
-        return self.localdb.open_cursor(commit=False)
+        return await self.localdb.run_write(fn, *args, commit=False)
+
+    async def _read(self, fn, *args):
+        return await self.localdb.run_read(fn, *args)
 
     # Database initialization
 
     async def _create_db(self):
-        async with self._open_cursor() as cursor:
+        def _create_db(cursor):
             cursor.execute(
                 """CREATE TABLE IF NOT EXISTS chunks
                     (chunk_id BLOB PRIMARY KEY NOT NULL, -- UUID
@@ -58,52 +75,88 @@ class ChunkStorage:
                 );"""
             )
 
+        await self._write(_create_db)
+
     # Size and chunks
 
     async def get_nb_blocks(self):
-        async with self._open_cursor() as cursor:
+        def _get_nb_blocks(cursor):
             cursor.execute("SELECT COUNT(*) FROM chunks")
             result, = cursor.fetchone()
             return result
 
+        return await self._read(_get_nb_blocks)
+
     async def get_total_size(self):
-        async with self._open_cursor() as cursor:
+        def _get_total_size(cursor):
             cursor.execute("SELECT COALESCE(SUM(size), 0) FROM chunks")
             result, = cursor.fetchone()
             return result
 
+        return await self._read(_get_total_size)
+
     # Generic chunk operations
 
     async def is_chunk(self, chunk_id: ChunkID):
-        async with self._open_cursor() as cursor:
+        def _is_chunk(cursor):
             cursor.execute("SELECT chunk_id FROM chunks WHERE chunk_id = ?", (chunk_id.bytes,))
-            manifest_row = cursor.fetchone()
+            return cursor.fetchone()
+
+        manifest_row = await self._read(_is_chunk)
         return bool(manifest_row)
 
+    async def _get_ciphered_chunk(self, chunk_id: ChunkID):
+        def _get_ciphered_chunk(cursor):
+            cursor.execute("""SELECT data FROM chunks WHERE chunk_id = ?""", (chunk_id.bytes,))
+            return cursor.fetchone()
+
+        row = await self._read(_get_ciphered_chunk)
+        if not row:
+            raise FSLocalMissError(chunk_id)
+        ciphered, = row
+        return ciphered
+
     async def get_chunk(self, chunk_id: ChunkID):
-        async with self._open_cursor() as cursor:
-            cursor.execute(
-                """
-                UPDATE chunks SET accessed_on = ? WHERE chunk_id = ?;
-                """,
-                (time.time(), chunk_id.bytes),
-            )
-            cursor.execute("SELECT changes()")
-            changes, = cursor.fetchone()
-            if not changes:
-                raise FSLocalMissError(chunk_id)
+        ciphered = await self._get_ciphered_chunk(chunk_id)
+        return await run_cpu_bound(self.local_symkey.decrypt, ciphered, size=len(ciphered))
+
+    async def _get_ciphered_chunks(self, chunk_ids: List[ChunkID]) -> Dict[ChunkID, bytes]:
+        chunk_ids_by_bytes = {chunk_id.bytes: chunk_id for chunk_id in chunk_ids}
+
+        def _get_ciphered_chunks(cursor):
+            rows = []
+            raw_ids = list(chunk_ids_by_bytes)
+            for i in range(0, len(raw_ids), SQLITE_MAX_VARIABLE_NUMBER):
+                batch = raw_ids[i : i + SQLITE_MAX_VARIABLE_NUMBER]
+                cursor.execute(
+                    f"""SELECT chunk_id, data FROM chunks
+                    WHERE chunk_id IN ({", ".join("?" * len(batch))})""",
+                    batch,
+                )
+                rows += cursor.fetchall()
+            return rows
 
-            cursor.execute("""SELECT data FROM chunks WHERE chunk_id = ?""", (chunk_id.bytes,))
-            ciphered, = cursor.fetchone()
+        rows = await self._read(_get_ciphered_chunks)
+        return {chunk_ids_by_bytes[bytes(raw_id)]: ciphered for raw_id, ciphered in rows}
+
+    async def get_chunks(
+        self, chunk_ids: List[ChunkID]
+    ) -> Tuple[Dict[ChunkID, bytes], List[ChunkID]]:
+        """Return the data of the given chunks along with the ids of the missing ones.
 
-        return self.local_symkey.decrypt(ciphered)
+        The chunks are fetched with a single query and decrypted in a single batch.
+        """
+        ciphered_chunks = await self._get_ciphered_chunks(chunk_ids)
+        size = sum(len(ciphered) for ciphered in ciphered_chunks.values())
+        chunks = await run_cpu_bound(_decrypt_chunks, self.local_symkey, ciphered_chunks, size=size)
+        missing = [chunk_id for chunk_id in dict.fromkeys(chunk_ids) if chunk_id not in chunks]
+        return chunks, missing
 
     async def set_chunk(self, chunk_id: ChunkID, raw: bytes):
         assert isinstance(raw, (bytes, bytearray))
-        ciphered = self.local_symkey.encrypt(raw)
+        ciphered = await run_cpu_bound(self.local_symkey.encrypt, raw, size=len(raw))
 
-        # Update database
-        async with self._open_cursor() as cursor:
+        def _set_chunk(cursor):
             cursor.execute(
                 """INSERT OR REPLACE INTO
                 chunks (chunk_id, size, offline, accessed_on, data)
@@ -111,29 +164,126 @@ class ChunkStorage:
                 (chunk_id.bytes, len(ciphered), False, time.time(), ciphered),
             )
 
+        # Update database
+        await self._write(_set_chunk)
+
     async def clear_chunk(self, chunk_id: ChunkID):
-        async with self._open_cursor() as cursor:
+        def _clear_chunk(cursor):
             cursor.execute("DELETE FROM chunks WHERE chunk_id = ?", (chunk_id.bytes,))
             cursor.execute("SELECT changes()")
             changes, = cursor.fetchone()
+            return changes
 
+        changes = await self._write(_clear_chunk)
         if not changes:
             raise FSLocalMissError(chunk_id)
 
 
 class BlockStorage(ChunkStorage):
-    """Interface for caching the data blocks."""
-
-    def __init__(self, device: LocalDevice, localdb: LocalDatabase, cache_size: int):
+    """Interface for caching the data blocks.
+
+    The number of blocks and their total size are tracked in memory, so
+    the cache limit is enforced without scanning the table. Access times
+    are buffered and written in batches: reading a block only costs a
+    single select, and the eviction relies on an index on `accessed_on`.
+
+    Blocks flagged as `offline` are pinned: they are never evicted and are
+    not taken into account by the counters.
+    """
+
+    def __init__(
+        self,
+        device: LocalDevice,
+        localdb: LocalDatabase,
+        cache_size: int,
+        access_flush_threshold: int = DEFAULT_ACCESS_FLUSH_THRESHOLD,
+        cache_manager: Optional["BlockCacheManager"] = None,
+    ):
         super().__init__(device, localdb)
-        self.cache_size = cache_size
+        self.cache_manager = cache_manager
+        self.cache_size = cache_manager.cache_size if cache_manager else cache_size
+        self.access_flush_threshold = access_flush_threshold
 
-    def _open_cursor(self):
+        # Running counters, loaded from the database on startup
+        self._nb_blocks = 0
+        self._total_size = 0
+
+        # Access times waiting to be written to the database
+        self._pending_accesses = {}
+
+    @classmethod
+    @asynccontextmanager
+    async def run(cls, *args, **kwargs):
+        async with super().run(*args, **kwargs) as self:
+            if self.cache_manager:
+                self.cache_manager.register(self)
+            try:
+                yield self
+            finally:
+                if self.cache_manager:
+                    self.cache_manager.unregister(self)
+                with trio.CancelScope(shield=True):
+                    await self.flush_access_times()
+
+    async def _write(self, fn, *args):
         # It doesn't matter for blocks to be commited as soon as they're added
         # since they exists in the remote storage anyway. But it's simply more
         # convenient to perform the commit right away as does't cost much (at
         # least compare to the downloading of the block).
-        return self.localdb.open_cursor(commit=True)
+        return await self.localdb.run_write(fn, *args, commit=True)
+
+    # Database initialization
+
+    async def _create_db(self):
+        await super()._create_db()
+
+        def _create_index_and_count(cursor):
+            cursor.execute(
+                """CREATE INDEX IF NOT EXISTS chunks_offline_accessed_on_idx
+                ON chunks (offline, accessed_on)"""
+            )
+            cursor.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM chunks WHERE offline = 0")
+            return cursor.fetchone()
+
+        self._nb_blocks, self._total_size = await self._write(_create_index_and_count)
+
+    # Size and chunks
+
+    async def get_nb_blocks(self):
+        return self._nb_blocks
+
+    async def get_total_size(self):
+        return self._total_size
+
+    # Access times
+
+    async def _register_accesses(self, chunk_ids: List[ChunkID]):
+        # The access time is only relevant for the garbage collection of the blocks
+        accessed_on = time.time()
+        for chunk_id in chunk_ids:
+            self._pending_accesses[chunk_id] = accessed_on
+        if len(self._pending_accesses) >= self.access_flush_threshold:
+            await self.flush_access_times()
+
+    async def flush_access_times(self):
+        if not self._pending_accesses:
+            return
+        accesses, self._pending_accesses = self._pending_accesses, {}
+
+        def _flush_access_times(cursor):
+            cursor.executemany(
+                "UPDATE chunks SET accessed_on = ? WHERE chunk_id = ?",
+                ((accessed_on, chunk_id.bytes) for chunk_id, accessed_on in accesses.items()),
+            )
+
+        try:
+            await self._write(_flush_access_times)
+
+        # Keep the access times for the next flush
+        except BaseException:
+            for chunk_id, accessed_on in accesses.items():
+                self._pending_accesses.setdefault(chunk_id, accessed_on)
+            raise
 
     # Garbage collection
 
@@ -142,31 +292,215 @@ class BlockStorage(ChunkStorage):
         return self.cache_size // DEFAULT_BLOCK_SIZE
 
     async def clear_all_blocks(self):
-        async with self._open_cursor() as cursor:
+        def _clear_all_blocks(cursor):
             cursor.execute("DELETE FROM chunks")
 
+        await self._write(_clear_all_blocks)
+        self._nb_blocks = 0
+        self._total_size = 0
+        self._pending_accesses.clear()
+
+    async def ensure_cache_limit(self):
+        # The cache limit is shared with the other workspaces
+        if self.cache_manager:
+            await self.cache_manager.ensure_budget()
+            return
+
+        extra_blocks = self._nb_blocks - self.block_limit
+        if extra_blocks > 0:
+
+            # Remove the extra block plus 10 % of the cache size, i.e about 100 blocks
+            limit = extra_blocks + self.block_limit // 10
+            await self.clear_old_blocks(limit=limit)
+
+    async def get_old_blocks(self, limit):
+        """Return the access time and size of the least recently used blocks."""
+        # The order must take the most recent accesses into account
+        await self.flush_access_times()
+
+        def _get_old_blocks(cursor):
+            cursor.execute(
+                """SELECT accessed_on, size FROM chunks WHERE offline = 0
+                ORDER BY accessed_on ASC LIMIT ?""",
+                (limit,),
+            )
+            return cursor.fetchall()
+
+        return await self._read(_get_old_blocks)
+
     async def clear_old_blocks(self, limit):
-        async with self._open_cursor() as cursor:
+        # The eviction order must take the most recent accesses into account
+        await self.flush_access_times()
+
+        def _clear_old_blocks(cursor):
             cursor.execute(
-                """
-                DELETE FROM chunks WHERE chunk_id IN (
-                    SELECT chunk_id FROM chunks ORDER BY accessed_on ASC LIMIT ?
-                )
-                """,
+                """SELECT chunk_id, size FROM chunks WHERE offline = 0
+                ORDER BY accessed_on ASC LIMIT ?""",
                 (limit,),
             )
+            rows = cursor.fetchall()
+            cursor.executemany(
+                "DELETE FROM chunks WHERE chunk_id = ?", ((chunk_id,) for chunk_id, _ in rows)
+            )
+            return len(rows), sum(size for _, size in rows)
 
-    # Upgraded set method
+        removed_blocks, removed_size = await self._write(_clear_old_blocks)
+        self._nb_blocks -= removed_blocks
+        self._total_size -= removed_size
+
+    # Upgraded chunk operations
+
+    async def get_chunk(self, chunk_id: ChunkID):
+        ciphered = await self._get_ciphered_chunk(chunk_id)
+        await self._register_accesses([chunk_id])
+        return await run_cpu_bound(self.local_symkey.decrypt, ciphered, size=len(ciphered))
+
+    async def get_chunks(
+        self, chunk_ids: List[ChunkID]
+    ) -> Tuple[Dict[ChunkID, bytes], List[ChunkID]]:
+        chunks, missing = await super().get_chunks(chunk_ids)
+        await self._register_accesses(list(chunks))
+        return chunks, missing
 
     async def set_chunk(self, chunk_id: ChunkID, raw: bytes):
+        assert isinstance(raw, (bytes, bytearray))
+        ciphered = await run_cpu_bound(self.local_symkey.encrypt, raw, size=len(raw))
+
+        def _set_chunk(cursor):
+            cursor.execute("SELECT size, offline FROM chunks WHERE chunk_id = ?", (chunk_id.bytes,))
+            previous_row = cursor.fetchone()
+            # A pinned block remains pinned
+            offline = bool(previous_row and previous_row[1])
+            cursor.execute(
+                """INSERT OR REPLACE INTO
+                chunks (chunk_id, size, offline, accessed_on, data)
+                VALUES (?, ?, ?, ?, ?)""",
+                (chunk_id.bytes, len(ciphered), offline, time.time(), ciphered),
+            )
+            return previous_row
+
         # Actual set operation
-        await super().set_chunk(chunk_id, raw)
+        previous_row = await self._write(_set_chunk)
+        self._pending_accesses.pop(chunk_id, None)
+        if previous_row:
+            previous_size, offline = previous_row
+            if offline:
+                return
+            self._total_size += len(ciphered) - previous_size
+        else:
+            self._nb_blocks += 1
+            self._total_size += len(ciphered)
 
         # Clean up if necessary
-        nb_blocks = await self.get_nb_blocks()
-        extra_blocks = nb_blocks - self.block_limit
-        if extra_blocks > 0:
+        await self.ensure_cache_limit()
 
-            # Remove the extra block plus 10 % of the cache size, i.e about 100 blocks
-            limit = extra_blocks + self.block_limit // 10
-            await self.clear_old_blocks(limit=limit)
+    async def clear_chunk(self, chunk_id: ChunkID):
+        def _clear_chunk(cursor):
+            cursor.execute("SELECT size, offline FROM chunks WHERE chunk_id = ?", (chunk_id.bytes,))
+            row = cursor.fetchone()
+            if row:
+                cursor.execute("DELETE FROM chunks WHERE chunk_id = ?", (chunk_id.bytes,))
+            return row
+
+        row = await self._write(_clear_chunk)
+        if not row:
+            raise FSLocalMissError(chunk_id)
+
+        size, offline = row
+        if not offline:
+            self._nb_blocks -= 1
+            self._total_size -= size
+        self._pending_accesses.pop(chunk_id, None)
+
+    # Offline availability
+
+    async def set_offline(self, chunk_ids: List[ChunkID], offline: bool) -> List[ChunkID]:
+        """Pin (or unpin) the given blocks and return the ones that are missing."""
+
+        def _set_offline(cursor):
+            missing = []
+            changed = []
+            for chunk_id in chunk_ids:
+                cursor.execute(
+                    "SELECT size, offline FROM chunks WHERE chunk_id = ?", (chunk_id.bytes,)
+                )
+                row = cursor.fetchone()
+                if not row:
+                    missing.append(chunk_id)
+                elif bool(row[1]) != offline:
+                    cursor.execute(
+                        "UPDATE chunks SET offline = ? WHERE chunk_id = ?",
+                        (offline, chunk_id.bytes),
+                    )
+                    changed.append(row[0])
+            return missing, changed
+
+        missing, changed = await self._write(_set_offline)
+
+        # Pinned blocks are not accounted for
+        sign = -1 if offline else 1
+        self._nb_blocks += sign * len(changed)
+        self._total_size += sign * sum(changed)
+
+        # Unpinned blocks might exceed the cache limit
+        if not offline and changed:
+            await self.ensure_cache_limit()
+        return missing
+
+
+class BlockCacheManager:
+    """Enforce a single byte budget on the block caches of several workspaces.
+
+    The block storages register themselves on startup. When the total size of
+    the caches exceeds the budget, the least recently used blocks are evicted,
+    regardless of the workspace they belong to.
+    """
+
+    def __init__(self, cache_size: int):
+        self.cache_size = cache_size
+        self._block_storages = []
+        self._eviction_lock = trio.Lock()
+
+    def register(self, block_storage: BlockStorage) -> None:
+        self._block_storages.append(block_storage)
+
+    def unregister(self, block_storage: BlockStorage) -> None:
+        self._block_storages.remove(block_storage)
+
+    def get_total_size(self) -> int:
+        return sum(block_storage._total_size for block_storage in self._block_storages)
+
+    async def ensure_budget(self) -> None:
+        if self.get_total_size() <= self.cache_size:
+            return
+
+        # Only one eviction at a time, the others simply wait for it
+        async with self._eviction_lock:
+
+            # Remove the extra blocks plus 10 % of the cache size
+            target_size = self.cache_size - self.cache_size // 10
+            while self.get_total_size() > target_size:
+                if not await self._evict(self.get_total_size() - target_size):
+                    break
+
+    async def _evict(self, extra_size: int) -> int:
+        # Gather the oldest blocks of each cache
+        limit = extra_size // DEFAULT_BLOCK_SIZE + 1
+        candidates = []
+        for block_storage in list(self._block_storages):
+            for accessed_on, size in await block_storage.get_old_blocks(limit):
+                candidates.append((accessed_on, size, block_storage))
+
+        # Pick the least recently used ones, across all the caches
+        to_remove = defaultdict(int)
+        removed_size = 0
+        for _, size, block_storage in sorted(candidates, key=lambda x: x[0]):
+            if removed_size >= extra_size:
+                break
+            to_remove[block_storage] += 1
+            removed_size += size
+
+        # The selected blocks are the least recently used ones of their own cache
+        for block_storage, nb_blocks in to_remove.items():
+            await block_storage.clear_old_blocks(limit=nb_blocks)
+        return sum(to_remove.values())
@@ -44,7 +44,7 @@ async def thread_pool_runner(max_workers=None):
 def protect_with_lock(fn):
     """Use as a decorator to protect an async method with `self._lock`.
 
-    Also works with async gen method so it can be used for `open_cursor`.
+    Also works with async gen method.
     """
 
     if inspect.isasyncgenfunction(fn):
@@ -66,16 +66,41 @@ def protect_with_lock(fn):
     return wrapper
 
 
+# Number of read-only connections that can run concurrently with the writer
+DEFAULT_MAX_READERS = 4
+
+
 class LocalDatabase:
-    """Base class for managing an sqlite3 connection."""
+    """Base class for managing an sqlite3 database.
+
+    All the SQL statements are executed outside of the trio thread:
+    - the write operations go through a single writer connection running
+      in a dedicated worker thread and protected by `self._lock`
+    - the read operations are dispatched to a pool of read-only connections
+      that take advantage of the WAL journal mode to run concurrently with
+      the writer (and with each other)
 
-    def __init__(self, path, vacuum_threshold=None):
+    The SQL statements are provided as a function taking a cursor as first argument,
+    so a single thread hop can run several statements at once.
+    """
+
+    def __init__(self, path, vacuum_threshold=None, max_readers=DEFAULT_MAX_READERS):
         self._conn = None
         self._lock = trio.Lock()
         self._run_in_thread = None
 
+        # Read-only connections
+        self._reader_conns = []
+        self._reader_limiter = trio.CapacityLimiter(max(max_readers, 1))
+        self._run_in_reader_thread = None
+
+        # Whether the writer connection holds changes that are not visible
+        # from the reader connections yet
+        self._pending_commit = False
+
         self.path = Path(path)
         self.vacuum_threshold = vacuum_threshold
+        self.max_readers = max_readers
 
     @classmethod
     @asynccontextmanager
@@ -83,21 +108,26 @@ class LocalDatabase:
         # Instanciate the local database
         self = cls(*args, **kwargs)
 
-        # Run a pool with single worker thread
+        # Run a pool with single worker thread for the writer
         # (although the lock already protects against concurrent access to the pool)
         async with thread_pool_runner(max_workers=1) as self._run_in_thread:
 
-            # Create the connection to the sqlite database
-            try:
-                await self._connect()
+            # Run another pool for the readers
+            async with thread_pool_runner(
+                max_workers=max(self.max_readers, 1)
+            ) as self._run_in_reader_thread:
 
-                # Yield the instance
-                yield self
+                # Create the connection to the sqlite database
+                try:
+                    await self._connect()
 
-            # Safely flush and close the connection
-            finally:
-                with trio.CancelScope(shield=True):
-                    await self._close()
+                    # Yield the instance
+                    yield self
+
+                # Safely flush and close the connections
+                finally:
+                    with trio.CancelScope(shield=True):
+                        await self._close()
 
     # Life cycle
 
@@ -122,6 +152,16 @@ class LocalDatabase:
         # Return connection
         return conn
 
+    async def _create_reader_connection(self):
+        def _connect():
+            # The reader connections run in autocommit mode so each statement
+            # sees the latest committed state of the database. Thanks to the WAL
+            # journal mode, they are neither blocked by nor blocking the writer.
+            uri = f"{self.path.resolve().as_uri()}?mode=ro"
+            return sqlite_connect(uri, uri=True, check_same_thread=False, isolation_level=None)
+
+        return await self._run_in_reader_thread(_connect)
+
     @protect_with_lock
     async def _connect(self):
         if self._conn is not None:
@@ -136,34 +176,81 @@ class LocalDatabase:
         if self._conn is None:
             return
 
+        # Close the readers
+        for conn in self._reader_conns:
+            conn.close()
+        self._reader_conns.clear()
+
         # Commit and close
         await self._run_in_thread(self._conn.commit)
+        self._pending_commit = False
         self._conn.close()
         self._conn = None
 
-    # Cursor management
+    # SQL execution
 
-    @asynccontextmanager
-    @protect_with_lock
-    async def open_cursor(self, commit=True):
-        # Get a cursor
-        cursor = self._conn.cursor()
+    def _run_with_cursor(self, conn, fn, *args, commit=False):
+        cursor = conn.cursor()
         try:
 
             # Execute SQL commands
-            yield cursor
+            result = fn(cursor, *args)
 
             # Commit the transaction when finished
-            if commit and self._conn.in_transaction:
-                await self._run_in_thread(self._conn.commit)
+            if commit and conn.in_transaction:
+                conn.commit()
+
+            return result, conn.in_transaction
 
         # Close cursor
         finally:
             cursor.close()
 
+    @protect_with_lock
+    async def run_write(self, fn, *args, commit=True):
+        """Run `fn(cursor, *args)` in the writer thread and return its result.
+
+        If `commit` is false, the changes are kept in the current transaction
+        until the next commit.
+        """
+        result, self._pending_commit = await self._run_in_thread(
+            functools.partial(self._run_with_cursor, self._conn, fn, *args, commit=commit)
+        )
+        return result
+
+    async def run_read(self, fn, *args):
+        """Run `fn(cursor, *args)` in a reader thread and return its result.
+
+        The statements executed by `fn` should not modify the database.
+        """
+        if not self.max_readers:
+            return await self.run_write(fn, *args, commit=False)
+
+        # The uncommitted changes are only visible from the writer connection:
+        # commit them first instead of queuing the read behind the next writes
+        if self._pending_commit:
+            await self.commit()
+
+        async with self._reader_limiter:
+            # Get an idle reader connection or create a new one
+            try:
+                conn = self._reader_conns.pop()
+            except IndexError:
+                conn = await self._create_reader_connection()
+
+            # Run in a reader thread, then give the connection back to the pool
+            try:
+                result, _ = await self._run_in_reader_thread(
+                    functools.partial(self._run_with_cursor, conn, fn, *args)
+                )
+            finally:
+                self._reader_conns.append(conn)
+            return result
+
     @protect_with_lock
     async def commit(self):
         await self._run_in_thread(self._conn.commit)
+        self._pending_commit = False
 
     # Vacuum
 
@@ -184,6 +271,7 @@ class LocalDatabase:
 
         # Flush to disk
         await self._run_in_thread(self._conn.commit)
+        self._pending_commit = False
 
         # No reason to vacuum yet
         if self.get_disk_usage() < self.vacuum_threshold:
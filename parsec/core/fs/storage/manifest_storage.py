@@ -1,10 +1,13 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) AGPLv3 2019 Scille SAS
 
+import attr
 import trio
+from collections import OrderedDict
 from structlog import get_logger
 from typing import Dict, Tuple, Set, Optional
 from async_generator import asynccontextmanager
 
+from parsec.utils import run_cpu_bound
 from parsec.core.fs.exceptions import FSLocalMissError
 from parsec.core.types import EntryID, ChunkID, LocalDevice, LocalManifest
 from parsec.core.fs.storage.local_database import LocalDatabase
@@ -12,20 +15,61 @@ from parsec.core.fs.storage.local_database import LocalDatabase
 logger = get_logger()
 
 
+def _count_manifest_items(manifest: LocalManifest) -> int:
+    # The bulk of a manifest's serialized form is its list of chunks or children
+    blocks = getattr(manifest, "blocks", None)
+    if blocks is not None:
+        return sum(len(chunks) for chunks in blocks)
+    return len(getattr(manifest, "children", None) or getattr(manifest, "workspaces", ()))
+
+
+@attr.s(slots=True, auto_attribs=True)
+class ManifestCacheStatistics:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    entries: int = 0
+    size: int = 0
+
+
 class ManifestStorage:
     """Persistent storage with cache for storing manifests.
 
     Also stores the checkpoint.
+
+    The cache can be bounded with a budget in number of entries and/or in bytes
+    (the size of a manifest being approximated by the size of its serialized form).
+    The least recently used manifests get evicted first, except for the ones that
+    still need to be written to the localdb.
     """
 
-    def __init__(self, device: LocalDevice, localdb: LocalDatabase, realm_id: EntryID):
+    def __init__(
+        self,
+        device: LocalDevice,
+        localdb: LocalDatabase,
+        realm_id: EntryID,
+        cache_max_entries: Optional[int] = None,
+        cache_max_bytes: Optional[int] = None,
+    ):
         self.device = device
         self.localdb = localdb
         self.realm_id = realm_id
+        self.cache_max_entries = cache_max_entries
+        self.cache_max_bytes = cache_max_bytes
+
+        # This cache contains the manifests that have been set or accessed
+        # since the last call to `clear_memory_cache`, in least recently used
+        # order. All of them are kept if no budget has been configured.
+        self._cache = OrderedDict()
+
+        # Approximated size of the cached manifests, when known
+        self._cache_sizes = {}
+        self._cache_size = 0
+        self._cache_statistics = ManifestCacheStatistics()
 
-        # This cache contains all the manifests that have been set or accessed
-        # since the last call to `clear_memory_cache`
-        self._cache = {}
+        # Number of ongoing writes to the localdb for each entry
+        # (the entry cannot be evicted until those writes are over)
+        self._cache_being_flushed = {}
 
         # This dictionnary keeps track of all the entry ids of the manifests
         # that have been added to the cache but still needs to be written to
@@ -35,6 +79,9 @@ class ManifestStorage:
         # still requires to be flushed.
         self._cache_ahead_of_localdb = {}
 
+        # Entries pinned for offline availability, loaded on startup
+        self._pinned_entries = set()
+
     @property
     def path(self):
         return self.localdb.path
@@ -50,21 +97,91 @@ class ManifestStorage:
             with trio.CancelScope(shield=True):
                 await self._flush_cache_ahead_of_persistance()
 
-    def _open_cursor(self):
+    async def _write(self, fn, *args):
         # We want the manifest to be written to the disk as soon as possible
         # (unless they are purposely kept out of the local database)
-        return self.localdb.open_cursor(commit=True)
+        return await self.localdb.run_write(fn, *args, commit=True)
+
+    async def _read(self, fn, *args):
+        return await self.localdb.run_read(fn, *args)
 
     async def clear_memory_cache(self, flush=True):
         if flush:
             await self._flush_cache_ahead_of_persistance()
         self._cache_ahead_of_localdb.clear()
         self._cache.clear()
+        self._cache_sizes.clear()
+        self._cache_size = 0
+
+    # Cache management
+
+    def get_cache_statistics(self) -> ManifestCacheStatistics:
+        return attr.evolve(self._cache_statistics, entries=len(self._cache), size=self._cache_size)
+
+    def _cache_set(
+        self,
+        entry_id: EntryID,
+        manifest: LocalManifest,
+        size: Optional[int] = None,
+        touch: bool = True,
+    ):
+        self._cache[entry_id] = manifest
+        if touch:
+            self._cache.move_to_end(entry_id)
+        if size is not None:
+            self._cache_size += size - self._cache_sizes.get(entry_id, 0)
+            self._cache_sizes[entry_id] = size
+        self._cache_evict()
+
+    def _estimate_cache_size(self, entry_id: EntryID, manifest: LocalManifest) -> int:
+        # Scale the size of the previous version according to the number of items
+        previous = self._cache.get(entry_id)
+        size = self._cache_sizes.get(entry_id)
+        if previous is not None and size is not None:
+            return (
+                size
+                * (_count_manifest_items(manifest) + 1)
+                // (_count_manifest_items(previous) + 1)
+            )
+        # No previous version to compare with
+        return len(manifest.dump())
+
+    def _cache_pop(self, entry_id: EntryID) -> Optional[LocalManifest]:
+        self._cache_size -= self._cache_sizes.pop(entry_id, 0)
+        return self._cache.pop(entry_id, None)
+
+    def _cache_is_over_budget(self, extra_entries: int = 0, extra_size: int = 0) -> bool:
+        if self.cache_max_entries is not None:
+            if len(self._cache) - extra_entries > self.cache_max_entries:
+                return True
+        if self.cache_max_bytes is not None:
+            if self._cache_size - extra_size > self.cache_max_bytes:
+                return True
+        return False
+
+    def _cache_evict(self) -> None:
+        if not self._cache_is_over_budget():
+            return
+
+        # Collect the least recently used entries that can safely be dropped
+        to_evict = []
+        evicted_size = 0
+        for entry_id in self._cache:
+            if not self._cache_is_over_budget(len(to_evict), evicted_size):
+                break
+            if entry_id in self._cache_ahead_of_localdb or entry_id in self._cache_being_flushed:
+                continue
+            to_evict.append(entry_id)
+            evicted_size += self._cache_sizes.get(entry_id, 0)
+
+        for entry_id in to_evict:
+            self._cache_pop(entry_id)
+        self._cache_statistics.evictions += len(to_evict)
 
     # Database initialization
 
     async def _create_db(self):
-        async with self._open_cursor() as cursor:
+        def _create_db(cursor):
             cursor.execute(
                 """
                 CREATE TABLE IF NOT EXISTS vlobs
@@ -89,24 +206,70 @@ class ManifestStorage:
                 """
             )
 
+            # Entries (and their children) to keep available offline
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS pinned_entries
+                (
+                  entry_id BLOB PRIMARY KEY NOT NULL -- UUID
+                );
+                """
+            )
+            cursor.execute("SELECT entry_id FROM pinned_entries")
+            return cursor.fetchall()
+
+        rows = await self._write(_create_db)
+        self._pinned_entries = {EntryID(entry_id) for entry_id, in rows}
+
+    # Offline availability operations
+
+    def get_pinned_entries(self) -> Set[EntryID]:
+        """
+        Raises: Nothing !
+        """
+        return set(self._pinned_entries)
+
+    async def set_entry_pinned(self, entry_id: EntryID, pinned: bool) -> None:
+        """
+        Raises: Nothing !
+        """
+
+        def _set_entry_pinned(cursor):
+            if pinned:
+                cursor.execute(
+                    "INSERT OR IGNORE INTO pinned_entries (entry_id) VALUES (?)", (entry_id.bytes,)
+                )
+            else:
+                cursor.execute("DELETE FROM pinned_entries WHERE entry_id = ?", (entry_id.bytes,))
+
+        await self._write(_set_entry_pinned)
+        if pinned:
+            self._pinned_entries.add(entry_id)
+        else:
+            self._pinned_entries.discard(entry_id)
+
     # Checkpoint operations
 
     async def get_realm_checkpoint(self) -> int:
         """
         Raises: Nothing !
         """
-        async with self._open_cursor() as cursor:
+
+        def _get_realm_checkpoint(cursor):
             cursor.execute("SELECT checkpoint FROM realm_checkpoint WHERE _id = 0")
             rep = cursor.fetchone()
             return rep[0] if rep else 0
 
+        return await self._read(_get_realm_checkpoint)
+
     async def update_realm_checkpoint(
         self, new_checkpoint: int, changed_vlobs: Dict[EntryID, int]
     ) -> None:
         """
         Raises: Nothing !
         """
-        async with self._open_cursor() as cursor:
+
+        def _update_realm_checkpoint(cursor):
             cursor.executemany(
                 "UPDATE vlobs SET remote_version = ? WHERE vlob_id = ?",
                 ((version, entry_id.bytes) for entry_id, version in changed_vlobs.items()),
@@ -117,24 +280,29 @@ class ManifestStorage:
                 (new_checkpoint,),
             )
 
+        await self._write(_update_realm_checkpoint)
+
     async def get_need_sync_entries(self) -> Tuple[Set[EntryID], Set[EntryID]]:
         """
         Raises: Nothing !
         """
-        async with self._open_cursor() as cursor:
+
+        def _get_need_sync_entries(cursor):
             cursor.execute(
                 "SELECT vlob_id, need_sync, base_version, remote_version "
                 "FROM vlobs WHERE need_sync = 1 OR base_version != remote_version"
             )
-            local_changes = set()
-            remote_changes = set()
-            for manifest_id, need_sync, bv, rv in cursor.fetchall():
-                manifest_id = EntryID(manifest_id)
-                if need_sync:
-                    local_changes.add(manifest_id)
-                if bv != rv:
-                    remote_changes.add(manifest_id)
-            return local_changes, remote_changes
+            return cursor.fetchall()
+
+        local_changes = set()
+        remote_changes = set()
+        for manifest_id, need_sync, bv, rv in await self._read(_get_need_sync_entries):
+            manifest_id = EntryID(manifest_id)
+            if need_sync:
+                local_changes.add(manifest_id)
+            if bv != rv:
+                remote_changes.add(manifest_id)
+        return local_changes, remote_changes
 
     # Manifest operations
 
@@ -145,27 +313,39 @@ class ManifestStorage:
         """
         # Look in cache first
         try:
-            return self._cache[entry_id]
+            manifest = self._cache[entry_id]
         except KeyError:
-            pass
+            self._cache_statistics.misses += 1
+        else:
+            self._cache_statistics.hits += 1
+            self._cache.move_to_end(entry_id)
+            return manifest
 
         # Look into the database
-        async with self._open_cursor() as cursor:
+        def _get_manifest(cursor):
             cursor.execute("SELECT blob FROM vlobs WHERE vlob_id = ?", (entry_id.bytes,))
-            manifest_row = cursor.fetchone()
+            return cursor.fetchone()
+
+        manifest_row = await self._read(_get_manifest)
 
         # Not found
         if not manifest_row:
             raise FSLocalMissError(entry_id)
 
+        # Load the manifest, large ones are processed in a worker thread
+        blob, = manifest_row
+        manifest = await run_cpu_bound(
+            LocalManifest.decrypt_and_load, blob, self.device.local_symkey, size=len(blob)
+        )
+
         # Safely fill the cache
-        if entry_id not in self._cache:
-            self._cache[entry_id] = LocalManifest.decrypt_and_load(
-                manifest_row[0], key=self.device.local_symkey
-            )
+        if entry_id in self._cache:
+            manifest = self._cache[entry_id]
+        else:
+            self._cache_set(entry_id, manifest, size=len(blob))
 
         # Always return the cached value
-        return self._cache[entry_id]
+        return manifest
 
     async def set_manifest(
         self,
@@ -179,12 +359,14 @@ class ManifestStorage:
         """
         assert isinstance(entry_id, EntryID)
 
-        # Set the cache first
-        self._cache[entry_id] = manifest
-
         # Tag the entry as ahead of localdb
         self._cache_ahead_of_localdb.setdefault(entry_id, set())
 
+        # Set the cache first, with an estimation of its size until it gets
+        # serialized by the flush
+        size = self._estimate_cache_size(entry_id, manifest)
+        self._cache_set(entry_id, manifest, size=size)
+
         # Cleanup
         if removed_ids:
             self._cache_ahead_of_localdb[entry_id] |= removed_ids
@@ -195,19 +377,18 @@ class ManifestStorage:
 
     async def _ensure_manifest_persistent(self, entry_id: EntryID) -> None:
 
-        # Get cursor
-        async with self._open_cursor() as cursor:
-
-            # Flushing is not necessary
-            if entry_id not in self._cache_ahead_of_localdb:
-                return
+        # Flushing is not necessary
+        if entry_id not in self._cache_ahead_of_localdb:
+            return
 
-            # Safely get the manifest
-            manifest = self._cache[entry_id]
-
-            # Dump and decrypt the manifest
-            ciphered = manifest.dump_and_encrypt(self.device.local_symkey)
+        # Safely get the manifest and take ownership of the pending chunks.
+        # The entry is tagged as up-to-date right away: if the manifest gets
+        # updated during the write, it will simply be tagged again.
+        manifest = self._cache[entry_id]
+        pending_chunk_ids = self._cache_ahead_of_localdb.pop(entry_id)
+        self._cache_being_flushed[entry_id] = self._cache_being_flushed.get(entry_id, 0) + 1
 
+        def _ensure_manifest_persistent(cursor, ciphered):
             # Insert into the local database
             cursor.execute(
                 """INSERT OR REPLACE INTO vlobs (vlob_id, blob, need_sync, base_version, remote_version)
@@ -229,11 +410,32 @@ class ManifestStorage:
             )
 
             # Clean all the pending chunks
-            for chunk_id in self._cache_ahead_of_localdb[entry_id]:
+            for chunk_id in pending_chunk_ids:
                 cursor.execute("DELETE FROM chunks WHERE chunk_id = ?", (chunk_id.bytes,))
 
-            # Safely tag entry as up-to-date
-            self._cache_ahead_of_localdb.pop(entry_id)
+        try:
+            # Dump and encrypt the manifest. The size of its previous serialization,
+            # if known, is a good enough hint to decide whether to use a worker thread.
+            ciphered = await run_cpu_bound(
+                manifest.dump_and_encrypt,
+                self.device.local_symkey,
+                size=self._cache_sizes.get(entry_id),
+            )
+            await self._write(_ensure_manifest_persistent, ciphered)
+
+        # The manifest still needs to be flushed
+        except BaseException:
+            self._cache_ahead_of_localdb.setdefault(entry_id, set()).update(pending_chunk_ids)
+            raise
+
+        finally:
+            self._cache_being_flushed[entry_id] -= 1
+            if not self._cache_being_flushed[entry_id]:
+                del self._cache_being_flushed[entry_id]
+
+        # The manifest can now be evicted from the cache
+        if self._cache.get(entry_id) is manifest:
+            self._cache_set(entry_id, manifest, size=len(ciphered), touch=False)
 
     async def ensure_manifest_persistent(self, entry_id: EntryID) -> None:
         """
@@ -259,21 +461,24 @@ class ManifestStorage:
             FSLocalMissError
         """
 
-        async with self._open_cursor() as cursor:
+        # Safely remove from cache
+        in_cache = bool(self._cache_pop(entry_id))
 
-            # Safely remove from cache
-            in_cache = bool(self._cache.pop(entry_id, None))
+        # Clean all the pending chunks
+        # TODO: should also add the content of the popped manifest
+        pending_chunk_ids = self._cache_ahead_of_localdb.pop(entry_id, ())
 
+        def _clear_manifest(cursor):
             # Remove from local database
             cursor.execute("DELETE FROM vlobs WHERE vlob_id = ?", (entry_id.bytes,))
             cursor.execute("SELECT changes()")
             deleted, = cursor.fetchone()
 
-            # Clean all the pending chunks
-            # TODO: should also add the content of the popped manifest
-            pending_chunk_ids = self._cache_ahead_of_localdb.pop(entry_id, ())
             for chunk_id in pending_chunk_ids:
                 cursor.execute("DELETE FROM chunks WHERE chunk_id = ?", (chunk_id.bytes,))
+            return deleted
+
+        deleted = await self._write(_clear_manifest)
 
         # Raise a miss if the entry wasn't found
         if not deleted and not in_cache:
@@ -1,8 +1,7 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) AGPLv3 2019 Scille SAS
 
 from pathlib import Path
-from collections import defaultdict
-from typing import Dict, Tuple, Set, Optional
+from typing import Dict, Tuple, Set, Optional, List
 
 import trio
 from trio import hazmat
@@ -22,8 +21,8 @@ from parsec.core.types import (
 from parsec.core.fs.exceptions import FSError, FSLocalMissError, FSInvalidFileDescriptor
 
 from parsec.core.fs.storage.local_database import LocalDatabase
-from parsec.core.fs.storage.manifest_storage import ManifestStorage
-from parsec.core.fs.storage.chunk_storage import ChunkStorage, BlockStorage
+from parsec.core.fs.storage.manifest_storage import ManifestStorage, ManifestCacheStatistics
+from parsec.core.fs.storage.chunk_storage import ChunkStorage, BlockStorage, BlockCacheManager
 from parsec.core.fs.storage.version import WORKSPACE_DATA_STORAGE_NAME, WORKSPACE_CACHE_STORAGE_NAME
 
 
@@ -32,6 +31,57 @@ logger = get_logger()
 # TODO: should be in config.py
 DEFAULT_BLOCK_CACHE_SIZE = 512 * 1024 * 1024
 DEFAULT_CHUNK_VACUUM_THRESHOLD = 512 * 1024 * 1024
+DEFAULT_MANIFEST_CACHE_MAX_ENTRIES = 10000
+
+
+class EntryLock:
+    """A shared/exclusive lock protecting an entry.
+
+    Many tasks can hold the shared side at the same time, while the exclusive
+    side is held by a single task. Waiting exclusive requests take precedence
+    over new shared requests so the writers do not starve.
+    """
+
+    def __init__(self):
+        self.readers = 0
+        self.writer = None
+        self.waiting_writers = 0
+        # Number of tasks holding or waiting for the lock
+        self.users = 0
+        self._lot = hazmat.ParkingLot()
+
+    async def acquire_shared(self) -> None:
+        await hazmat.checkpoint_if_cancelled()
+        parked = False
+        while self.writer is not None or self.waiting_writers:
+            await self._lot.park()
+            parked = True
+        self.readers += 1
+        if not parked:
+            await hazmat.cancel_shielded_checkpoint()
+
+    def release_shared(self) -> None:
+        self.readers -= 1
+        if not self.readers:
+            self._lot.unpark_all()
+
+    async def acquire_exclusive(self) -> None:
+        await hazmat.checkpoint_if_cancelled()
+        parked = False
+        self.waiting_writers += 1
+        try:
+            while self.writer is not None or self.readers:
+                await self._lot.park()
+                parked = True
+        finally:
+            self.waiting_writers -= 1
+        self.writer = hazmat.current_task()
+        if not parked:
+            await hazmat.cancel_shielded_checkpoint()
+
+    def release_exclusive(self) -> None:
+        self.writer = None
+        self._lot.unpark_all()
 
 
 class WorkspaceStorage:
@@ -63,9 +113,8 @@ class WorkspaceStorage:
         self.open_fds: Dict[FileDescriptor, EntryID] = {}
         self.fd_counter = 0
 
-        # Locking structures
-        self.locking_tasks = {}
-        self.entry_locks = defaultdict(trio.Lock)
+        # Locking structures (a lock is removed once no task holds or waits for it)
+        self.entry_locks: Dict[EntryID, EntryLock] = {}
 
         # Manifest and block storage
         self.data_localdb = data_localdb
@@ -74,6 +123,10 @@ class WorkspaceStorage:
         self.block_storage = block_storage
         self.chunk_storage = chunk_storage
 
+        # Chunks assembled in memory by the file descriptors. They must reach
+        # the chunk storage before any manifest referencing them gets persisted
+        self.chunk_buffers: Dict[ChunkID, Tuple[EntryID, bytearray]] = {}
+
     @classmethod
     @asynccontextmanager
     async def run(
@@ -83,6 +136,9 @@ class WorkspaceStorage:
         workspace_id: EntryID,
         cache_size=DEFAULT_BLOCK_CACHE_SIZE,
         vacuum_threshold=DEFAULT_CHUNK_VACUUM_THRESHOLD,
+        manifest_cache_max_entries=DEFAULT_MANIFEST_CACHE_MAX_ENTRIES,
+        manifest_cache_max_bytes=None,
+        block_cache_manager: Optional[BlockCacheManager] = None,
     ):
         data_path = path / WORKSPACE_DATA_STORAGE_NAME
         cache_path = path / WORKSPACE_CACHE_STORAGE_NAME
@@ -97,19 +153,23 @@ class WorkspaceStorage:
 
                 # Block storage service
                 async with BlockStorage.run(
-                    device, cache_localdb, cache_size=cache_size
+                    device, cache_localdb, cache_size=cache_size, cache_manager=block_cache_manager
                 ) as block_storage:
 
                     # Manifest storage service
                     async with ManifestStorage.run(
-                        device, data_localdb, workspace_id
+                        device,
+                        data_localdb,
+                        workspace_id,
+                        cache_max_entries=manifest_cache_max_entries,
+                        cache_max_bytes=manifest_cache_max_bytes,
                     ) as manifest_storage:
 
                         # Chunk storage service
                         async with ChunkStorage.run(device, data_localdb) as chunk_storage:
 
                             # Instanciate workspace storage
-                            yield cls(
+                            self = cls(
                                 device,
                                 path,
                                 workspace_id,
@@ -119,6 +179,13 @@ class WorkspaceStorage:
                                 chunk_storage=chunk_storage,
                                 manifest_storage=manifest_storage,
                             )
+                            try:
+                                yield self
+
+                            # The manifest storage flushes its cache on teardown
+                            finally:
+                                with trio.CancelScope(shield=True):
+                                    await self.flush_chunk_buffers()
 
     # Helpers
 
@@ -127,27 +194,50 @@ class WorkspaceStorage:
         return FileDescriptor(self.fd_counter)
 
     async def clear_memory_cache(self, flush=True):
+        if flush:
+            await self.flush_chunk_buffers()
+        else:
+            self.chunk_buffers.clear()
         await self.manifest_storage.clear_memory_cache(flush=flush)
 
+    def get_manifest_cache_statistics(self) -> ManifestCacheStatistics:
+        return self.manifest_storage.get_cache_statistics()
+
     # Locking helpers
 
     @asynccontextmanager
-    async def lock_entry_id(self, entry_id: EntryID):
-        async with self.entry_locks[entry_id]:
-            try:
-                self.locking_tasks[entry_id] = hazmat.current_task()
-                yield entry_id
-            finally:
-                del self.locking_tasks[entry_id]
+    async def lock_entry_id(self, entry_id: EntryID, shared: bool = False):
+        """Lock the given entry, the shared lock being enough to only read it."""
+        lock = self.entry_locks.get(entry_id)
+        if lock is None:
+            lock = self.entry_locks[entry_id] = EntryLock()
+        lock.users += 1
+        try:
+            if shared:
+                await lock.acquire_shared()
+                try:
+                    yield entry_id
+                finally:
+                    lock.release_shared()
+            else:
+                await lock.acquire_exclusive()
+                try:
+                    yield entry_id
+                finally:
+                    lock.release_exclusive()
+        finally:
+            lock.users -= 1
+            if not lock.users:
+                del self.entry_locks[entry_id]
 
     @asynccontextmanager
-    async def lock_manifest(self, entry_id: EntryID):
-        async with self.lock_entry_id(entry_id):
+    async def lock_manifest(self, entry_id: EntryID, shared: bool = False):
+        async with self.lock_entry_id(entry_id, shared=shared):
             yield await self.get_manifest(entry_id)
 
     def _check_lock_status(self, entry_id: EntryID) -> None:
-        task = self.locking_tasks.get(entry_id)
-        if task != hazmat.current_task():
+        lock = self.entry_locks.get(entry_id)
+        if lock is None or lock.writer != hazmat.current_task():
             raise RuntimeError(f"Entry `{entry_id}` modified without beeing locked")
 
     # Checkpoint interface
@@ -182,12 +272,15 @@ class WorkspaceStorage:
     ) -> None:
         if check_lock_status:
             self._check_lock_status(entry_id)
+        if not cache_only:
+            await self.flush_chunk_buffers(entry_id)
         await self.manifest_storage.set_manifest(
             entry_id, manifest, cache_only=cache_only, removed_ids=removed_ids
         )
 
     async def ensure_manifest_persistent(self, entry_id: EntryID) -> None:
         self._check_lock_status(entry_id)
+        await self.flush_chunk_buffers(entry_id)
         await self.manifest_storage.ensure_manifest_persistent(entry_id)
 
     async def clear_manifest(self, entry_id: EntryID) -> None:
@@ -210,8 +303,38 @@ class WorkspaceStorage:
     async def get_dirty_block(self, block_id: BlockID) -> bytes:
         return await self.chunk_storage.get_chunk(ChunkID(block_id))
 
+    async def get_dirty_chunk(self, chunk_id: ChunkID) -> bytes:
+        assert isinstance(chunk_id, ChunkID)
+        return await self.chunk_storage.get_chunk(chunk_id)
+
+    async def set_clean_blocks_offline(
+        self, block_ids: List[BlockID], offline: bool
+    ) -> List[BlockID]:
+        """Pin or unpin the given blocks, and return the ones that are missing locally."""
+        chunk_ids = [ChunkID(block_id) for block_id in block_ids]
+        missing = []
+        for chunk_id in await self.block_storage.set_offline(chunk_ids, offline):
+            # Dirty blocks are never evicted in the first place
+            if not await self.chunk_storage.is_chunk(chunk_id):
+                missing.append(BlockID(chunk_id))
+        return missing
+
+    # Offline availability interface
+
+    def get_pinned_entries(self) -> Set[EntryID]:
+        return self.manifest_storage.get_pinned_entries()
+
+    async def set_entry_pinned(self, entry_id: EntryID, pinned: bool) -> None:
+        await self.manifest_storage.set_entry_pinned(entry_id, pinned)
+
     # Chunk interface
 
+    async def is_chunk(self, chunk_id: ChunkID) -> bool:
+        assert isinstance(chunk_id, ChunkID)
+        if await self.chunk_storage.is_chunk(chunk_id):
+            return True
+        return await self.block_storage.is_chunk(chunk_id)
+
     async def get_chunk(self, chunk_id: ChunkID) -> bytes:
         assert isinstance(chunk_id, ChunkID)
         try:
@@ -219,6 +342,26 @@ class WorkspaceStorage:
         except FSLocalMissError:
             return await self.block_storage.get_chunk(chunk_id)
 
+    async def get_chunks(
+        self, chunk_ids: List[ChunkID]
+    ) -> Tuple[Dict[ChunkID, bytes], List[ChunkID]]:
+        """Return the data of the given chunks along with the ids of the missing ones.
+
+        The buffered chunks are looked up first, then the dirty chunks and the
+        clean blocks, with a single query per database.
+        """
+        buffered = {
+            x: bytes(self.chunk_buffers[x][1]) for x in chunk_ids if x in self.chunk_buffers
+        }
+        chunks, missing = await self.chunk_storage.get_chunks(
+            [x for x in chunk_ids if x not in buffered]
+        )
+        chunks.update(buffered)
+        if missing:
+            blocks, missing = await self.block_storage.get_chunks(missing)
+            chunks.update(blocks)
+        return chunks, missing
+
     async def set_chunk(self, chunk_id: ChunkID, block: bytes) -> None:
         assert isinstance(chunk_id, ChunkID)
         return await self.chunk_storage.set_chunk(chunk_id, block)
@@ -231,6 +374,48 @@ class WorkspaceStorage:
             if not miss_ok:
                 raise
 
+    # Chunk buffer interface
+
+    def set_chunk_buffer(self, entry_id: EntryID, chunk_id: ChunkID, data: bytearray) -> None:
+        """Register a chunk assembled in memory, the data being extended in place."""
+        assert isinstance(chunk_id, ChunkID)
+        self.chunk_buffers[chunk_id] = (entry_id, data)
+
+    def get_chunk_buffer(self, chunk_id: ChunkID) -> Optional[bytearray]:
+        try:
+            return self.chunk_buffers[chunk_id][1]
+        except KeyError:
+            return None
+
+    async def flush_chunk_buffer(self, chunk_id: ChunkID) -> None:
+        try:
+            _, data = self.chunk_buffers[chunk_id]
+        except KeyError:
+            return
+        # The data remains readable from the buffer until it reaches the chunk storage
+        block = bytes(data)
+        await self.chunk_storage.set_chunk(chunk_id, block)
+        # The buffer might have been extended in the meantime
+        if self.get_chunk_buffer(chunk_id) is data and len(data) == len(block):
+            del self.chunk_buffers[chunk_id]
+
+    async def flush_chunk_buffers(self, entry_id: Optional[EntryID] = None) -> None:
+        """Write the buffered chunks of the given entry (or all of them) to the chunk storage."""
+        for chunk_id, (buffer_entry_id, _) in list(self.chunk_buffers.items()):
+            if entry_id is None or buffer_entry_id == entry_id:
+                await self.flush_chunk_buffer(chunk_id)
+
+    def drop_chunk_buffers(self, entry_id: EntryID) -> Set[ChunkID]:
+        """Discard the buffered chunks of the given entry and return their ids."""
+        dropped = {
+            chunk_id
+            for chunk_id, (buffer_entry_id, _) in self.chunk_buffers.items()
+            if buffer_entry_id == entry_id
+        }
+        for chunk_id in dropped:
+            del self.chunk_buffers[chunk_id]
+        return dropped
+
     # File management interface
 
     def create_file_descriptor(self, manifest: LocalFileManifest) -> FileDescriptor:
@@ -294,6 +479,8 @@ class WorkspaceStorageTimestamped(WorkspaceStorage):
         self.set_chunk = self._throw_permission_error
         self.clear_chunk = self._throw_permission_error
         self.clear_manifest = self._throw_permission_error
+        self.set_clean_blocks_offline = self._throw_permission_error
+        self.set_entry_pinned = self._throw_permission_error
 
     def _throw_permission_error(*args, **kwargs):
         raise FSError("Not implemented : WorkspaceStorage is timestamped")
@@ -309,13 +496,22 @@ class WorkspaceStorageTimestamped(WorkspaceStorage):
             raise FSLocalMissError(entry_id)
 
     async def set_manifest(
-        self, entry_id: EntryID, manifest: LocalManifest, cache_only: bool = False
+        self,
+        entry_id: EntryID,
+        manifest: LocalManifest,
+        cache_only: bool = False,
+        check_lock_status: bool = True,
+        removed_ids: Optional[Set[ChunkID]] = None,
     ) -> None:  # initially for clean
         assert isinstance(entry_id, EntryID)
         if manifest.need_sync:
             return self._throw_permission_error()
-        self._check_lock_status(entry_id)
+        if check_lock_status:
+            self._check_lock_status(entry_id)
         self._cache[entry_id] = manifest
 
     async def ensure_manifest_persistent(self, entry_id: EntryID) -> None:
         pass
+
+    def get_pinned_entries(self) -> Set[EntryID]:
+        return set()
@@ -44,8 +44,13 @@ from parsec.core.remote_devices_manager import (
 )
 
 from parsec.core.fs.workspacefs import WorkspaceFS
-from parsec.core.fs.remote_loader import RemoteLoader
-from parsec.core.fs.storage import UserStorage, WorkspaceStorage
+from parsec.core.fs.remote_loader import (
+    RemoteLoader,
+    DEFAULT_MAX_CONCURRENT_DOWNLOADS,
+    DEFAULT_MAX_CONCURRENT_UPLOADS,
+)
+from parsec.core.fs.storage import UserStorage, WorkspaceStorage, BlockCacheManager
+from parsec.core.fs.storage.workspace_storage import DEFAULT_BLOCK_CACHE_SIZE
 from parsec.core.fs.userfs.merging import merge_local_user_manifests, merge_workspace_entry
 from parsec.core.fs.exceptions import (
     FSError,
@@ -154,15 +159,23 @@ class UserFS:
         backend_cmds: BackendAuthenticatedCmds,
         remote_devices_manager: RemoteDevicesManager,
         event_bus: EventBus,
+        max_concurrent_downloads: int = DEFAULT_MAX_CONCURRENT_DOWNLOADS,
+        max_concurrent_uploads: int = DEFAULT_MAX_CONCURRENT_UPLOADS,
+        block_cache_size: int = DEFAULT_BLOCK_CACHE_SIZE,
     ):
         self.device = device
         self.path = path
         self.backend_cmds = backend_cmds
         self.remote_devices_manager = remote_devices_manager
         self.event_bus = event_bus
+        self.max_concurrent_downloads = max_concurrent_downloads
+        self.max_concurrent_uploads = max_concurrent_uploads
 
         self.storage = None
 
+        # A single block cache budget for all the workspaces
+        self.block_cache_manager = BlockCacheManager(block_cache_size)
+
         # Message processing is done in-order, hence it is pointless to do
         # it concurrently
         self._workspace_storage_nursery = None
@@ -239,7 +252,9 @@ class UserFS:
         path = self.path / str(workspace_id)
 
         async def workspace_storage_task(task_status=trio.TASK_STATUS_IGNORED):
-            async with WorkspaceStorage.run(self.device, path, workspace_id) as workspace_storage:
+            async with WorkspaceStorage.run(
+                self.device, path, workspace_id, block_cache_manager=self.block_cache_manager
+            ) as workspace_storage:
                 task_status.started(workspace_storage)
                 await trio.sleep_forever()
 
@@ -267,6 +282,10 @@ class UserFS:
             backend_cmds=self.backend_cmds,
             event_bus=self.event_bus,
             remote_device_manager=self.remote_devices_manager,
+            max_concurrent_downloads=self.max_concurrent_downloads,
+            max_concurrent_uploads=self.max_concurrent_uploads,
+            # Readahead tasks live as long as the workspace storages
+            prefetch_nursery=self._workspace_storage_nursery,
         )
 
     async def _create_workspace(
@@ -1,20 +1,24 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) AGPLv3 2019 Scille SAS
 
-from typing import Tuple
+from typing import Tuple, List, Dict, Optional
 from async_generator import asynccontextmanager
 
+from parsec.types import FrozenDict
 from parsec.core.types import (
     EntryID,
+    EntryName,
     FsPath,
     WorkspaceRole,
     LocalManifest,
     LocalFileManifest,
     LocalFolderManifest,
     FileDescriptor,
+    BlockAccess,
 )
 
 
 from parsec.core.fs.workspacefs.file_transactions import FileTransactions
+from parsec.core.fs.workspacefs.file_operations import chunk_id_set
 from parsec.core.fs.utils import is_file_manifest, is_folder_manifest, is_folderish_manifest
 from parsec.core.fs.exceptions import (
     FSPermissionError,
@@ -22,18 +26,26 @@ from parsec.core.fs.exceptions import (
     FSReadOnlyError,
     FSNotADirectoryError,
     FSFileNotFoundError,
-    FSCrossDeviceError,
     FSFileExistsError,
     FSIsADirectoryError,
     FSDirectoryNotEmptyError,
+    FSInvalidArgumentError,
     FSLocalMissError,
 )
 
 
 WRITE_RIGHT_ROLES = (WorkspaceRole.OWNER, WorkspaceRole.MANAGER, WorkspaceRole.CONTRIBUTOR)
 
+# Maximum number of folders in the path resolution cache
+DENTRY_CACHE_MAX_SIZE = 10000
+
 
 class EntryTransactions(FileTransactions):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Path resolution cache, mapping the folders to their children
+        self._dentries: Dict[EntryID, FrozenDict[EntryName, EntryID]] = {}
+        self._dentries_generation = 0
 
     # Right management helper
 
@@ -46,6 +58,35 @@ class EntryTransactions(FileTransactions):
         if self.get_workspace_entry().role not in WRITE_RIGHT_ROLES:
             raise FSReadOnlyError(filename=path)
 
+    # Path resolution cache helpers
+
+    def _invalidate_dentries(self, entry_id: EntryID) -> None:
+        """Must be called while the entry is still locked after changing its children."""
+        self._dentries_generation += 1
+        self._dentries.pop(entry_id, None)
+
+    async def _get_children(
+        self, entry_id: EntryID, path: FsPath
+    ) -> FrozenDict[EntryName, EntryID]:
+        # Cache hit
+        try:
+            return self._dentries[entry_id]
+        except KeyError:
+            pass
+
+        # Load the manifest
+        generation = self._dentries_generation
+        manifest = await self._load_manifest(entry_id)
+        if is_file_manifest(manifest):
+            raise FSNotADirectoryError(filename=path)
+
+        # The children might have changed in the meantime
+        if generation == self._dentries_generation:
+            if len(self._dentries) >= DENTRY_CACHE_MAX_SIZE:
+                del self._dentries[next(iter(self._dentries))]
+            self._dentries[entry_id] = manifest.children
+        return manifest.children
+
     # Look-up helpers
 
     async def _get_manifest(self, entry_id: EntryID) -> LocalManifest:
@@ -56,41 +97,51 @@ class EntryTransactions(FileTransactions):
             return LocalManifest.from_remote(remote_manifest)
 
     @asynccontextmanager
-    async def _load_and_lock_manifest(self, entry_id: EntryID):
-        async with self.local_storage.lock_entry_id(entry_id):
-            try:
-                local_manifest = await self.local_storage.get_manifest(entry_id)
-            except FSLocalMissError as exc:
-                remote_manifest = await self.remote_loader.load_manifest(exc.id)
-                local_manifest = LocalManifest.from_remote(remote_manifest)
-                await self.local_storage.set_manifest(entry_id, local_manifest)
-            yield local_manifest
+    async def _load_and_lock_manifest(self, entry_id: EntryID, shared: bool = False):
+        # Loop over attempts
+        while True:
+            async with self.local_storage.lock_entry_id(entry_id, shared=shared):
+                try:
+                    local_manifest = await self.local_storage.get_manifest(entry_id)
+                except FSLocalMissError as exc:
+                    # Storing the downloaded manifest requires the exclusive lock
+                    if shared:
+                        local_manifest = None
+                    else:
+                        remote_manifest = await self.remote_loader.load_manifest(exc.id)
+                        local_manifest = LocalManifest.from_remote(remote_manifest)
+                        await self.local_storage.set_manifest(entry_id, local_manifest)
+                if local_manifest is not None:
+                    yield local_manifest
+                    return
+
+            # Release the shared lock and download the manifest
+            async with self._load_and_lock_manifest(entry_id):
+                pass
 
     async def _load_manifest(self, entry_id: EntryID) -> LocalManifest:
-        async with self._load_and_lock_manifest(entry_id) as manifest:
+        async with self._load_and_lock_manifest(entry_id, shared=True) as manifest:
             return manifest
 
     @asynccontextmanager
-    async def _lock_manifest_from_path(self, path: FsPath) -> LocalManifest:
+    async def _lock_manifest_from_path(self, path: FsPath, shared: bool = False) -> LocalManifest:
         # Root entry_id and manifest
         entry_id = self.workspace_id
 
         # Follow the path
         for name in path.parts:
-            manifest = await self._load_manifest(entry_id)
-            if is_file_manifest(manifest):
-                raise FSNotADirectoryError(filename=path)
+            children = await self._get_children(entry_id, path)
             try:
-                entry_id = manifest.children[name]
-            except (AttributeError, KeyError):
+                entry_id = children[name]
+            except KeyError:
                 raise FSFileNotFoundError(filename=path)
 
         # Lock entry
-        async with self._load_and_lock_manifest(entry_id) as manifest:
+        async with self._load_and_lock_manifest(entry_id, shared=shared) as manifest:
             yield manifest
 
     async def _get_manifest_from_path(self, path: FsPath) -> LocalManifest:
-        async with self._lock_manifest_from_path(path) as manifest:
+        async with self._lock_manifest_from_path(path, shared=True) as manifest:
             return manifest
 
     @asynccontextmanager
@@ -111,9 +162,8 @@ class EntryTransactions(FileTransactions):
         # This double locking is only required for a single use case: the overwriting
         # of empty directory during a move. We have to make sure that no one adds
         # something to the directory while it is being overwritten.
-        # If read/write locks were to be implemented, the parent would be write locked
-        # and the child read locked. This means that despite locking two entries, only
-        # a single entry is modified at a time.
+        # Both entries are exclusively locked: the child is usually only read, but
+        # copying a file over an existing one replaces the content of the child.
 
         # Source is root
         if path.is_root():
@@ -148,6 +198,137 @@ class EntryTransactions(FileTransactions):
             # Release the lock and download the child manifest
             await self._load_manifest(entry_id)
 
+    @asynccontextmanager
+    async def _lock_entry_ids(self, entry_ids: List[EntryID]):
+        # Lock the entries one after the other, in the given order
+        if not entry_ids:
+            yield
+            return
+        async with self.local_storage.lock_entry_id(entry_ids[0]):
+            async with self._lock_entry_ids(entry_ids[1:]):
+                yield
+
+    # Rename helpers
+
+    def _check_overwrite(
+        self, source_manifest: LocalManifest, child: LocalManifest, destination: FsPath
+    ) -> None:
+        # Overwrite a file
+        if is_file_manifest(source_manifest):
+
+            # Destination is a folder
+            if is_folder_manifest(child):
+                raise FSIsADirectoryError(filename=destination)
+
+        # Overwrite a folder
+        if is_folder_manifest(source_manifest):
+
+            # Destination is not a folder
+            if is_file_manifest(child):
+                raise FSNotADirectoryError(filename=destination)
+
+            # Destination is not empty
+            if child.children:
+                raise FSDirectoryNotEmptyError(filename=destination)
+
+    async def _entry_move(self, source: FsPath, destination: FsPath, overwrite: bool) -> EntryID:
+        # Only the manifests of the two parents and of the moved entry are updated,
+        # whatever the size of the moved entry.
+
+        # Loop over attempts
+        while True:
+
+            # Fetch the parents and the involved children
+            source_parent = await self._get_manifest_from_path(source.parent)
+            destination_parent = await self._get_manifest_from_path(destination.parent)
+            for path, parent in ((source, source_parent), (destination, destination_parent)):
+                if not is_folderish_manifest(parent):
+                    raise FSNotADirectoryError(filename=path.parent)
+            if source.name not in source_parent.children:
+                raise FSFileNotFoundError(filename=source)
+
+            # Folder moved into itself
+            if source.parts == destination.parts[: len(source.parts)]:
+                raise FSInvalidArgumentError(filename=source, filename2=destination)
+
+            source_id = source_parent.children[source.name]
+            destination_id = destination_parent.children.get(destination.name)
+            await self._load_manifest(source_id)
+            if destination_id is not None:
+                await self._load_manifest(destination_id)
+
+            # Parents must be locked before their children, so the entries are
+            # locked by depth, then by id to get a deterministic order
+            depths = {
+                source_parent.id: len(source.parts) - 1,
+                destination_parent.id: len(destination.parts) - 1,
+                source_id: len(source.parts),
+            }
+            if destination_id is not None:
+                depths[destination_id] = len(destination.parts)
+            entry_ids = sorted(depths, key=lambda entry_id: (depths[entry_id], str(entry_id)))
+
+            # Lock the entries
+            async with self._lock_entry_ids(entry_ids):
+                try:
+                    source_parent = await self.local_storage.get_manifest(source_parent.id)
+                    destination_parent = await self.local_storage.get_manifest(
+                        destination_parent.id
+                    )
+                    source_manifest = await self.local_storage.get_manifest(source_id)
+                    child = None
+                    if destination_id is not None:
+                        child = await self.local_storage.get_manifest(destination_id)
+
+                # A manifest has been removed from the local storage in the meantime
+                except FSLocalMissError:
+                    continue
+
+                # The entries have changed in the meantime
+                if (
+                    source_parent.children.get(source.name) != source_id
+                    or destination_parent.children.get(destination.name) != destination_id
+                ):
+                    continue
+
+                # Destination already exists
+                if not overwrite and child is not None:
+                    raise FSFileExistsError(filename=destination)
+
+                # Overwrite logic
+                if overwrite and child is not None:
+                    self._check_overwrite(source_manifest, child, destination)
+
+                # Create new manifests
+                new_source_parent = source_parent.evolve_children_and_mark_updated(
+                    {source.name: None}
+                )
+                new_destination_parent = destination_parent.evolve_children_and_mark_updated(
+                    {destination.name: source_id}
+                )
+                new_source_manifest = source_manifest.evolve(
+                    parent=destination_parent.id, need_sync=True
+                )
+
+                # Make sure the moved entry only references stored data
+                await self._flush_write_buffers(source_id)
+
+                # Register the entry in its new parent first, so it cannot get lost
+                await self.local_storage.set_manifest(source_id, new_source_manifest)
+                await self.local_storage.set_manifest(destination_parent.id, new_destination_parent)
+                await self.local_storage.set_manifest(source_parent.id, new_source_parent)
+                self._invalidate_dentries(destination_parent.id)
+                self._invalidate_dentries(source_parent.id)
+                break
+
+        # Send events
+        self._send_event("fs.entry.updated", id=source_parent.id)
+        self._send_event("fs.entry.updated", id=destination_parent.id)
+        self._send_event("fs.entry.updated", id=source_id)
+
+        # Return the entry id of the moved entry
+        return source_id
+
     # Transactions
 
     async def entry_info(self, path: FsPath) -> dict:
@@ -156,7 +337,55 @@ class EntryTransactions(FileTransactions):
 
         # Fetch data
         manifest = await self._get_manifest_from_path(path)
+        return self._get_stats(manifest)
 
+    async def entry_scandir(self, path: FsPath) -> Dict[EntryName, dict]:
+        """Return the stats of all the children of a folder, sorted by name.
+
+        A child whose manifest is neither available locally nor in the backend
+        is reported with the `inconsistency` type and its entry id.
+        """
+        # Check read rights
+        self.check_read_rights(path)
+
+        # Resolve the folder only once
+        manifest = await self._get_manifest_from_path(path)
+        if is_file_manifest(manifest):
+            raise FSNotADirectoryError(filename=path)
+
+        # The children are only read, manifests being replaced atomically
+        # in the local storage there is no need to lock them
+        children: Dict[EntryName, Optional[LocalManifest]] = {}
+        missing: Dict[EntryName, EntryID] = {}
+        for name, entry_id in sorted(manifest.children.items()):
+            try:
+                children[name] = await self.local_storage.get_manifest(entry_id)
+            except FSLocalMissError:
+                children[name] = None
+                missing[name] = entry_id
+
+        # Download the missing children in a single batch
+        if missing:
+            remote_manifests = await self.remote_loader.load_manifests(list(missing.values()))
+            for name, entry_id in missing.items():
+                if entry_id not in remote_manifests:
+                    continue
+                async with self.local_storage.lock_entry_id(entry_id):
+                    # The manifest might have been stored in the meantime
+                    try:
+                        children[name] = await self.local_storage.get_manifest(entry_id)
+                    except FSLocalMissError:
+                        children[name] = LocalManifest.from_remote(remote_manifests[entry_id])
+                        await self.local_storage.set_manifest(entry_id, children[name])
+
+        return {
+            name: self._get_stats(child)
+            if child is not None
+            else {"type": "inconsistency", "id": manifest.children[name]}
+            for name, child in children.items()
+        }
+
+    def _get_stats(self, manifest: LocalManifest) -> dict:
         # General stats
         stats = {
             "id": manifest.id,
@@ -191,9 +420,9 @@ class EntryTransactions(FileTransactions):
         if destination.is_root():
             raise FSPermissionError(filename=destination)
 
-        # Cross-directory renaming is not supported
+        # Cross-directory renaming
         if source.parent != destination.parent:
-            raise FSCrossDeviceError(filename=source, filename2=destination)
+            return await self._entry_move(source, destination, overwrite)
 
         # Pre-fetch the source if necessary
         if overwrite:
@@ -218,24 +447,7 @@ class EntryTransactions(FileTransactions):
             # Overwrite logic
             if overwrite and child is not None:
                 source_manifest = await self._get_manifest(source_entry_id)
-
-                # Overwrite a file
-                if is_file_manifest(source_manifest):
-
-                    # Destination is a folder
-                    if is_folder_manifest(child):
-                        raise FSIsADirectoryError(filename=destination)
-
-                # Overwrite a folder
-                if is_folder_manifest(source_manifest):
-
-                    # Destination is not a folder
-                    if is_file_manifest(child):
-                        raise FSNotADirectoryError(filename=destination)
-
-                    # Destination is not empty
-                    if child.children:
-                        raise FSDirectoryNotEmptyError(filename=destination)
+                self._check_overwrite(source_manifest, child, destination)
 
             # Create new manifest
             new_parent = parent.evolve_children_and_mark_updated(
@@ -244,6 +456,7 @@ class EntryTransactions(FileTransactions):
 
             # Atomic change
             await self.local_storage.set_manifest(parent.id, new_parent)
+            self._invalidate_dentries(parent.id)
 
         # Send event
         self._send_event("fs.entry.updated", id=parent.id)
@@ -275,6 +488,7 @@ class EntryTransactions(FileTransactions):
 
             # Atomic change
             await self.local_storage.set_manifest(parent.id, new_parent)
+            self._invalidate_dentries(parent.id)
 
         # Send event
         self._send_event("fs.entry.updated", id=parent.id)
@@ -302,6 +516,12 @@ class EntryTransactions(FileTransactions):
 
             # Atomic change
             await self.local_storage.set_manifest(parent.id, new_parent)
+            self._invalidate_dentries(parent.id)
+
+            # The content written to the unlinked file is not kept in memory
+            new_child = self._drop_write_buffers(child)
+            if new_child is not child:
+                await self.local_storage.set_manifest(child.id, new_child, cache_only=True)
 
         # Send event
         self._send_event("fs.entry.updated", id=parent.id)
@@ -329,6 +549,7 @@ class EntryTransactions(FileTransactions):
             # ~ Atomic change
             await self.local_storage.set_manifest(child.id, child, check_lock_status=False)
             await self.local_storage.set_manifest(parent.id, new_parent)
+            self._invalidate_dentries(parent.id)
 
         # Send events
         self._send_event("fs.entry.updated", id=parent.id)
@@ -357,6 +578,7 @@ class EntryTransactions(FileTransactions):
             # ~ Atomic change
             await self.local_storage.set_manifest(child.id, child, check_lock_status=False)
             await self.local_storage.set_manifest(parent.id, new_parent)
+            self._invalidate_dentries(parent.id)
             fd = self.local_storage.create_file_descriptor(child) if open else None
 
         # Send events
@@ -366,6 +588,82 @@ class EntryTransactions(FileTransactions):
         # Return the entry id of the created file and the file descriptor
         return child.id, fd
 
+    async def file_copy(
+        self, source: FsPath, destination: FsPath, exist_ok: bool = False
+    ) -> EntryID:
+        # Check read and write rights
+        self.check_read_rights(source)
+        self.check_write_rights(destination)
+
+        # Build the new blocks while the source is locked
+        async with self._lock_manifest_from_path(source, shared=True) as manifest:
+
+            # Not a file
+            if not is_file_manifest(manifest):
+                raise FSIsADirectoryError(filename=source)
+
+            new_blocks = await self._manifest_copy_blocks(manifest)
+
+        # The duplicated chunks must be cleaned up if the copy fails
+        duplicated_ids = chunk_id_set(chunk for chunks in new_blocks for chunk in chunks)
+        duplicated_ids -= chunk_id_set(chunk for chunks in manifest.blocks for chunk in chunks)
+
+        try:
+            # Lock parent in write mode
+            async with self._lock_parent_manifest_from_path(destination) as (parent, child):
+
+                # Destination already exists
+                if child is not None and not exist_ok:
+                    raise FSFileExistsError(filename=destination)
+
+                # Destination is a folder
+                if child is not None and not is_file_manifest(child):
+                    raise FSIsADirectoryError(filename=destination)
+
+                # Copy to itself
+                if child is not None and child.id == manifest.id:
+                    raise FSInvalidArgumentError(filename=source, filename2=destination)
+
+                # Create file
+                if child is None:
+                    new_child = LocalFileManifest.new_placeholder(
+                        parent=parent.id, blocksize=manifest.blocksize
+                    ).evolve(size=manifest.size, blocks=new_blocks)
+                    new_parent = parent.evolve_children_and_mark_updated(
+                        {destination.name: new_child.id}
+                    )
+
+                    # ~ Atomic change
+                    await self.local_storage.set_manifest(
+                        new_child.id, new_child, check_lock_status=False
+                    )
+                    await self.local_storage.set_manifest(parent.id, new_parent)
+                    self._invalidate_dentries(parent.id)
+
+                # Replace the content of the existing file
+                else:
+                    new_child = child.evolve_and_mark_updated(
+                        size=manifest.size, blocksize=manifest.blocksize, blocks=new_blocks
+                    )
+                    removed_ids = chunk_id_set(chunk for chunks in child.blocks for chunk in chunks)
+                    removed_ids -= chunk_id_set(chunk for chunks in new_blocks for chunk in chunks)
+                    await self.local_storage.set_manifest(
+                        child.id, new_child, removed_ids=removed_ids
+                    )
+
+        except Exception:
+            for chunk_id in duplicated_ids:
+                await self.local_storage.clear_chunk(chunk_id, miss_ok=True)
+            raise
+
+        # Send events
+        if child is None:
+            self._send_event("fs.entry.updated", id=parent.id)
+        self._send_event("fs.entry.updated", id=new_child.id)
+
+        # Return the entry id of the copy
+        return new_child.id
+
     async def file_open(self, path: FsPath, mode="rw") -> Tuple[EntryID, FileDescriptor]:
         # Check read and write rights
         if "w" in mode:
@@ -374,7 +672,7 @@ class EntryTransactions(FileTransactions):
             self.check_read_rights(path)
 
         # Lock path in read mode
-        async with self._lock_manifest_from_path(path) as manifest:
+        async with self._lock_manifest_from_path(path, shared=True) as manifest:
 
             # Not a file
             if not is_file_manifest(manifest):
@@ -399,3 +697,36 @@ class EntryTransactions(FileTransactions):
 
             # Return entry id
             return manifest.id
+
+    async def entry_offline_content(
+        self, entry_id: EntryID, missing_only: bool = False
+    ) -> Tuple[List[EntryID], List[BlockAccess]]:
+        """Return the children and the remote blocks of the given entry.
+
+        The manifest is downloaded and stored locally if necessary. With
+        `missing_only`, only the children that are not available locally
+        are returned.
+        """
+        manifest = await self._load_manifest(entry_id)
+
+        # File manifest
+        if is_file_manifest(manifest):
+            accesses = {
+                chunk.access.id: chunk.access
+                for chunks in manifest.blocks
+                for chunk in chunks
+                if chunk.access is not None
+            }
+            return [], list(accesses.values())
+
+        # Folderish manifest
+        children = []
+        for child_id in manifest.children.values():
+            if missing_only:
+                try:
+                    await self.local_storage.get_manifest(child_id)
+                    continue
+                except FSLocalMissError:
+                    pass
+            children.append(child_id)
+        return children, []
@@ -38,7 +38,8 @@ def index_of_chunk_after_stop(chunks: Chunks, stop: int) -> int:
 
 
 def chunk_id_set(chunks):
-    return {chunk.id for chunk in chunks}
+    # Holes are not stored
+    return {chunk.id for chunk in chunks if not chunk.is_hole}
 
 
 # Read functions
@@ -135,28 +136,32 @@ def prepare_write(
     manifest: LocalFileManifest, size: int, offset: int
 ) -> Tuple[LocalFileManifest, List[Tuple[Chunk, int]], Set[BlockID]]:
     # Prepare
-    padding = 0
     removed_ids: Set[BlockID] = set()
     write_operations: List[Tuple[Chunk, int]] = []
+    block_operations: List[Tuple[int, int, int, Chunk]] = []
 
-    # Padding
+    # Padding is represented as holes
     if offset > manifest.size:
         padding = offset - manifest.size
-        size += padding
-        offset = manifest.size
+        for block, subsize, start, _ in split_write(padding, manifest.size, manifest.blocksize):
+            new_chunk = Chunk.new_hole(start, start + subsize)
+            block_operations.append((block, subsize, start, new_chunk))
+
+    # Prepare new chunks
+    if size:
+        for block, subsize, start, content_offset in split_write(size, offset, manifest.blocksize):
+            new_chunk = Chunk.new(start, start + subsize)
+            write_operations.append((new_chunk, content_offset))
+            block_operations.append((block, subsize, start, new_chunk))
 
     # Copy buffers
     blocks = list(manifest.blocks)
 
     # Loop over blocks
-    for block, subsize, start, content_offset in split_write(size, offset, manifest.blocksize):
-
-        # Prepare new chunk
-        new_chunk = Chunk.new(start, start + subsize)
-        write_operations.append((new_chunk, content_offset - padding))
+    for block, subsize, start, new_chunk in block_operations:
 
         # Lazy block write
-        chunks = manifest.get_chunks(block)
+        chunks = blocks[block] if block < len(blocks) else ()
         new_chunks, more_removed_ids = block_write(chunks, subsize, start, new_chunk)
 
         # Update data structures
@@ -233,13 +238,19 @@ def prepare_reshape(
     # Loop over blocks
     for block, chunks in enumerate(manifest.blocks):
 
-        # Already a block
-        if len(chunks) == 1 and chunks[0].is_block:
+        # Already a block or a hole
+        if len(chunks) == 1 and (chunks[0].is_block or chunks[0].is_hole):
             continue
 
         # Update callback
         block_update = partial(update_manifest, block)
 
+        # Only holes
+        if all(chunk.is_hole for chunk in chunks):
+            start, stop = chunks[0].start, chunks[-1].stop
+            yield (chunks, Chunk.new_hole(start, stop), block_update, set())
+            continue
+
         # Already a pseudo-block
         if len(chunks) == 1 and chunks[0].is_pseudo_block:
             yield (chunks, chunks[0], block_update, set())
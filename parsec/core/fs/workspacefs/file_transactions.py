@@ -1,18 +1,34 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) AGPLv3 2019 Scille SAS
 
-from typing import Tuple, List, Callable
-
+import attr
+import trio
+from typing import Tuple, List, Callable, Optional, Dict
+from structlog import get_logger
 from collections import defaultdict
 from async_generator import asynccontextmanager
 
+from parsec.utils import run_cpu_bound
 from parsec.event_bus import EventBus
 from parsec.core.types import FileDescriptor, EntryID, LocalDevice
 
 from parsec.core.fs.remote_loader import RemoteLoader
 from parsec.core.fs.storage import WorkspaceStorage
-from parsec.core.fs.exceptions import FSLocalMissError, FSInvalidFileDescriptor, FSEndOfFileError
-from parsec.core.types import Chunk, BlockID, LocalFileManifest
+from parsec.core.fs.exceptions import (
+    FSError,
+    FSLocalMissError,
+    FSInvalidFileDescriptor,
+    FSEndOfFileError,
+)
+from parsec.core.types import (
+    Chunk,
+    ChunkID,
+    BlockID,
+    BlockAccess,
+    LocalFileManifest,
+    DEFAULT_BLOCK_SIZE,
+)
 from parsec.core.fs.workspacefs.file_operations import (
+    locate,
     prepare_read,
     prepare_write,
     prepare_resize,
@@ -22,6 +38,16 @@ from parsec.core.fs.workspacefs.file_operations import (
 __all__ = ("FSInvalidFileDescriptor", "FileTransactions")
 
 
+logger = get_logger()
+
+# Readahead window, doubled on each sequential read up to the maximum
+READAHEAD_MIN_SIZE = DEFAULT_BLOCK_SIZE
+READAHEAD_MAX_SIZE = 16 * DEFAULT_BLOCK_SIZE
+
+# Memory limit for the data written but not yet stored in the local storage
+WRITE_BUFFER_MAX_SIZE = 16 * DEFAULT_BLOCK_SIZE
+
+
 # Helpers
 
 
@@ -42,6 +68,35 @@ def padded_data(data: bytes, start: int, stop: int) -> bytes:
     return b"\x00" * (0 - start) + data[0:stop]
 
 
+@attr.s(slots=True, auto_attribs=True)
+class ReadPattern:
+    """Access pattern of the reads performed through a file descriptor."""
+
+    next_offset: int = 0
+    window: int = 0
+    prefetched_until: int = 0
+
+
+@attr.s(slots=True, auto_attribs=True)
+class WriteBuffer:
+    """Data written through a file descriptor and not yet in the chunk storage.
+
+    The data corresponds to the last chunk of an incomplete block. This chunk is
+    extended in place by the contiguous writes until its block is complete. The
+    data is registered as a chunk buffer in the local storage, which writes it to
+    the chunk storage before persisting a manifest referencing it.
+    """
+
+    entry_id: EntryID
+    chunk_id: ChunkID
+    start: int
+    data: bytearray
+
+    @property
+    def stop(self) -> int:
+        return self.start + len(self.data)
+
+
 class FileTransactions:
     """A stateless class to centralize all file transactions.
 
@@ -62,6 +117,10 @@ class FileTransactions:
     - truncate -> affects file size and possibly file content
     - read     -> no side effect
     - flush    -> no-op
+
+    Small contiguous writes are assembled in memory (see `WriteBuffer`) and only
+    reach the local storage once their block is complete, the file descriptor is
+    flushed or closed, or the memory limit is reached.
     """
 
     def __init__(
@@ -72,6 +131,7 @@ class FileTransactions:
         local_storage: WorkspaceStorage,
         remote_loader: RemoteLoader,
         event_bus: EventBus,
+        prefetch_nursery: Optional[trio.Nursery] = None,
     ):
         self.workspace_id = workspace_id
         self.get_workspace_entry = get_workspace_entry
@@ -79,7 +139,10 @@ class FileTransactions:
         self.local_storage = local_storage
         self.remote_loader = remote_loader
         self.event_bus = event_bus
+        self.prefetch_nursery = prefetch_nursery
         self._write_count = defaultdict(int)
+        self._read_patterns: Dict[FileDescriptor, ReadPattern] = {}
+        self._write_buffers: Dict[FileDescriptor, WriteBuffer] = {}
 
     # Event helper
 
@@ -88,10 +151,6 @@ class FileTransactions:
 
     # Helper
 
-    async def _read_chunk(self, chunk: Chunk) -> bytes:
-        data = await self.local_storage.get_chunk(chunk.id)
-        return data[chunk.start - chunk.raw_offset : chunk.stop - chunk.raw_offset]
-
     async def _write_chunk(self, chunk: Chunk, content: bytes, offset: int = 0) -> None:
         data = padded_data(content, offset, offset + chunk.stop - chunk.start)
         await self.local_storage.set_chunk(chunk.id, data)
@@ -102,24 +161,108 @@ class FileTransactions:
         if not chunks:
             return bytearray(), []
 
+        # Fetch all the chunks at once (the buffered ones are read from memory)
+        raw_chunks = {}
+        chunk_ids = [chunk.id for chunk in chunks if not chunk.is_hole]
+        if chunk_ids:
+            raw_chunks, _ = await self.local_storage.get_chunks(chunk_ids)
+
         # Build byte array
         missing = []
         start, stop = chunks[0].start, chunks[-1].stop
         result = bytearray(stop - start)
         for chunk in chunks:
+            # Holes read as zeros
+            if chunk.is_hole:
+                continue
             try:
-                result[chunk.start - start : chunk.stop - start] = await self._read_chunk(chunk)
-            except FSLocalMissError:
+                data = raw_chunks[chunk.id]
+            except KeyError:
                 assert chunk.access is not None
                 missing.append(chunk.access)
+                continue
+            result[chunk.start - start : chunk.stop - start] = data[
+                chunk.start - chunk.raw_offset : chunk.stop - chunk.raw_offset
+            ]
 
         # Return byte array
         return result, missing
 
+    # Write buffer helpers
+
+    def _extend_write_buffer(
+        self, fd: FileDescriptor, manifest: LocalFileManifest, content: bytes, offset: int
+    ) -> Optional[LocalFileManifest]:
+        """Append the content to the buffered chunk of the file descriptor.
+
+        Return the updated manifest, or None if the write is not contiguous to
+        the buffered chunk or does not fit in its block.
+        """
+        # Not contiguous
+        buffer = self._write_buffers.get(fd)
+        if buffer is None or buffer.stop != offset:
+            return None
+
+        # The local storage has flushed or dropped the chunk buffer in the meantime
+        if self.local_storage.get_chunk_buffer(buffer.chunk_id) is not buffer.data:
+            del self._write_buffers[fd]
+            return None
+
+        # The buffered chunk must still be at the end of its block
+        block, _ = locate(buffer.start, manifest.blocksize)
+        chunks = manifest.get_chunks(block)
+        if not chunks or chunks[-1].id != buffer.chunk_id or chunks[-1].stop != offset:
+            return None
+
+        # Crossing the block boundary
+        stop = offset + len(content)
+        if stop > (block + 1) * manifest.blocksize:
+            return None
+
+        # Extend the chunk in place
+        buffer.data += content
+        new_chunk = chunks[-1].evolve(stop=stop, raw_size=len(buffer.data))
+        blocks = list(manifest.blocks)
+        blocks[block] = (*chunks[:-1], new_chunk)
+        return manifest.evolve_and_mark_updated(size=max(manifest.size, stop), blocks=tuple(blocks))
+
+    async def _flush_write_buffer(self, fd: FileDescriptor) -> None:
+        buffer = self._write_buffers.pop(fd, None)
+        if buffer is not None:
+            await self.local_storage.flush_chunk_buffer(buffer.chunk_id)
+
+    async def _flush_write_buffers(self, entry_id: EntryID) -> None:
+        """This internal helper does not perform any locking."""
+        for fd, buffer in list(self._write_buffers.items()):
+            if buffer.entry_id == entry_id:
+                del self._write_buffers[fd]
+        await self.local_storage.flush_chunk_buffers(entry_id)
+
+    def _drop_write_buffers(self, manifest: LocalFileManifest) -> LocalFileManifest:
+        """This internal helper does not perform any locking.
+
+        Discard the buffered data of the file and return its manifest with the
+        corresponding chunks turned into holes.
+        """
+        for fd, buffer in list(self._write_buffers.items()):
+            if buffer.entry_id == manifest.id:
+                del self._write_buffers[fd]
+        dropped = self.local_storage.drop_chunk_buffers(manifest.id)
+        if not dropped:
+            return manifest
+        blocks = tuple(
+            tuple(
+                Chunk.new_hole(chunk.start, chunk.stop) if chunk.id in dropped else chunk
+                for chunk in chunks
+            )
+            for chunks in manifest.blocks
+        )
+        return manifest.evolve(blocks=blocks)
+
     # Locking helper
 
     @asynccontextmanager
-    async def _load_and_lock_file(self, fd: FileDescriptor):
+    async def _load_and_lock_file(self, fd: FileDescriptor, shared: bool = False):
         # The FSLocalMissError exception is not considered here.
         # This is because we should be able to assume that the manifest
         # corresponding to valid file descriptor is always available locally
@@ -128,7 +271,7 @@ class FileTransactions:
         manifest = await self.local_storage.load_file_descriptor(fd)
 
         # Lock the entry_id
-        async with self.local_storage.lock_manifest(manifest.id):
+        async with self.local_storage.lock_manifest(manifest.id, shared=shared):
             yield await self.local_storage.load_file_descriptor(fd)
 
     # Atomic transactions
@@ -138,13 +281,15 @@ class FileTransactions:
         async with self._load_and_lock_file(fd) as manifest:
 
             # Force writing to disk
+            await self._flush_write_buffers(manifest.id)
             await self.local_storage.ensure_manifest_persistent(manifest.id)
 
             # Atomic change
             self.local_storage.remove_file_descriptor(fd)
 
-            # Clear write count
+            # Clear write count and read pattern
             self._write_count.pop(fd, None)
+            self._read_patterns.pop(fd, None)
 
     async def fd_write(
         self, fd: FileDescriptor, content: bytes, offset: int, constrained: bool = False
@@ -162,18 +307,52 @@ class FileTransactions:
             if not content:
                 return 0
 
-            # Prepare
+            # Normalize
             offset = normalize_argument(offset, manifest)
-            manifest, write_operations, removed_ids = prepare_write(manifest, len(content), offset)
 
-            # Writing
-            for chunk, offset in write_operations:
-                self._write_count[fd] += await self._write_chunk(chunk, content, offset)
+            # Coalesce with the previous write
+            new_manifest = self._extend_write_buffer(fd, manifest, content, offset)
+            if new_manifest is not None:
+                manifest = new_manifest
+                self._write_count[fd] += len(content)
+                await self.local_storage.set_manifest(manifest.id, manifest, cache_only=True)
 
-            # Atomic change
-            await self.local_storage.set_manifest(
-                manifest.id, manifest, cache_only=True, removed_ids=removed_ids
-            )
+            else:
+                # Prepare
+                await self._flush_write_buffers(manifest.id)
+                manifest, write_operations, removed_ids = prepare_write(
+                    manifest, len(content), offset
+                )
+
+                # Writing
+                buffer = None
+                for chunk, chunk_offset in write_operations:
+                    data = padded_data(
+                        content, chunk_offset, chunk_offset + chunk.stop - chunk.start
+                    )
+                    self._write_count[fd] += len(data)
+                    # The chunk of an incomplete block is kept in memory for the next writes
+                    if chunk.stop % manifest.blocksize:
+                        buffer = WriteBuffer(manifest.id, chunk.id, chunk.start, bytearray(data))
+                    else:
+                        await self.local_storage.set_chunk(chunk.id, data)
+
+                # Atomic change (the buffered chunk is registered first so the
+                # manifest referencing it is never persisted without it)
+                if buffer is not None:
+                    self.local_storage.set_chunk_buffer(manifest.id, buffer.chunk_id, buffer.data)
+                    self._write_buffers[fd] = buffer
+                await self.local_storage.set_manifest(
+                    manifest.id, manifest, cache_only=True, removed_ids=removed_ids
+                )
+
+            # Flush the buffer once its block is complete or the memory limit is reached
+            buffer = self._write_buffers.get(fd)
+            if buffer is not None and (
+                buffer.stop % manifest.blocksize == 0
+                or sum(len(x.data) for x in self._write_buffers.values()) > WRITE_BUFFER_MAX_SIZE
+            ):
+                await self._flush_write_buffer(fd)
 
             # Reshaping
             if self._write_count[fd] >= manifest.blocksize:
@@ -206,8 +385,8 @@ class FileTransactions:
             # Load missing blocks
             await self.remote_loader.load_blocks(missing)
 
-            # Fetch and lock
-            async with self._load_and_lock_file(fd) as manifest:
+            # Fetch and lock (reads only require the shared lock)
+            async with self._load_and_lock_file(fd, shared=True) as manifest:
 
                 # End of file
                 if raise_eof and offset >= manifest.size:
@@ -227,8 +406,64 @@ class FileTransactions:
 
                 # Return the data
                 if not missing:
+                    await self._readahead(fd, manifest, offset, len(data))
                     return data
 
+    # Readahead helpers
+
+    async def _readahead(
+        self, fd: FileDescriptor, manifest: LocalFileManifest, offset: int, size: int
+    ) -> None:
+        """Prefetch the blocks following a sequential read in the background.
+
+        The readahead window grows as long as the reads are sequential. It is
+        reset by any other access pattern, and is limited to a quarter of the
+        block cache so the prefetched blocks do not evict each other.
+        """
+        # Readahead is disabled
+        if self.prefetch_nursery is None:
+            return
+
+        # Random access
+        pattern = self._read_patterns.setdefault(fd, ReadPattern())
+        sequential = offset == pattern.next_offset
+        pattern.next_offset = offset + size
+        if not sequential:
+            pattern.window = 0
+            pattern.prefetched_until = 0
+            return
+
+        # Grow the window
+        max_window = min(READAHEAD_MAX_SIZE, self.local_storage.block_storage.cache_size // 4)
+        pattern.window = min(max(2 * pattern.window, READAHEAD_MIN_SIZE), max_window)
+
+        # Nothing new to prefetch (whole blocks are prefetched)
+        start = max(pattern.next_offset, pattern.prefetched_until)
+        stop = pattern.next_offset + pattern.window
+        stop = min(-(-stop // manifest.blocksize) * manifest.blocksize, manifest.size)
+        if start >= stop:
+            return
+        pattern.prefetched_until = stop
+
+        # Only prefetch the blocks that are not available locally
+        accesses = []
+        for chunk in prepare_read(manifest, stop - start, start):
+            if chunk.access is None or chunk.access in accesses:
+                continue
+            if await self.local_storage.is_chunk(chunk.id):
+                continue
+            accesses.append(chunk.access)
+        if accesses:
+            self.prefetch_nursery.start_soon(self._prefetch, accesses)
+
+    async def _prefetch(self, accesses: List[BlockAccess]) -> None:
+        # Readahead is only an optimization, errors are simply ignored
+        # and will surface again if the blocks are actually read
+        try:
+            await self.remote_loader.load_blocks(accesses)
+        except FSError as exc:
+            logger.info("Block prefetch has failed", workspace_id=self.workspace_id, exc_info=exc)
+
     async def fd_flush(self, fd: FileDescriptor) -> None:
         async with self._load_and_lock_file(fd) as manifest:
             await self._manifest_reshape(manifest)
@@ -243,6 +478,7 @@ class FileTransactions:
             return
 
         # Prepare
+        await self._flush_write_buffers(manifest.id)
         manifest, write_operations, removed_ids = prepare_resize(manifest, length)
 
         # Writing
@@ -252,6 +488,35 @@ class FileTransactions:
         # Atomic change
         await self.local_storage.set_manifest(manifest.id, manifest, removed_ids=removed_ids)
 
+    async def _manifest_copy_blocks(self, manifest: LocalFileManifest) -> Tuple[Tuple[Chunk], ...]:
+        """This internal helper does not perform any locking.
+
+        Return the blocks of a copy of the given manifest. The chunks already
+        uploaded are immutable and shared within the realm, so the copy simply
+        references them. Dirty chunks get removed from the local storage once their
+        manifest no longer references them, so those are duplicated.
+        """
+        await self._flush_write_buffers(manifest.id)
+        new_blocks = []
+        for chunks in manifest.blocks:
+            new_chunks = []
+            for chunk in chunks:
+                # Holes have no data
+                if chunk.is_hole:
+                    new_chunks.append(chunk)
+                    continue
+                try:
+                    data = await self.local_storage.get_dirty_chunk(chunk.id)
+                except FSLocalMissError:
+                    new_chunks.append(chunk)
+                    continue
+                # The block access is computed again when reshaping the copy
+                new_chunk = chunk.evolve(id=ChunkID(), access=None)
+                await self.local_storage.set_chunk(new_chunk.id, data)
+                new_chunks.append(new_chunk)
+            new_blocks.append(tuple(new_chunks))
+        return tuple(new_blocks)
+
     async def _manifest_reshape(
         self, manifest: LocalFileManifest, cache_only: bool = False
     ) -> List[BlockID]:
@@ -259,10 +524,17 @@ class FileTransactions:
 
         # Prepare data structures
         missing = []
+        await self._flush_write_buffers(manifest.id)
 
         # Perform operations
         for source, destination, update, removed_ids in prepare_reshape(manifest):
 
+            # Holes are merged without any data
+            if destination.is_hole:
+                manifest = update(manifest, destination)
+                await self.local_storage.set_manifest(manifest.id, manifest, cache_only=True)
+                continue
+
             # Build data block
             data, extra_missing = await self._build_data(source)
 
@@ -271,8 +543,8 @@ class FileTransactions:
                 missing += extra_missing
                 continue
 
-            # Write data if necessary
-            new_chunk = destination.evolve_as_block(data)
+            # Write data if necessary (hashing a full block is done in a worker thread)
+            new_chunk = await run_cpu_bound(destination.evolve_as_block, data, size=len(data))
             if source != (destination,):
                 await self._write_chunk(new_chunk, data)
 
@@ -7,7 +7,6 @@ from pendulum import now as pendulum_now
 from parsec.api.protocol import DeviceID
 from parsec.api.data import Manifest as RemoteManifest
 from parsec.core.types import (
-    Chunk,
     EntryID,
     EntryName,
     LocalManifest,
@@ -22,7 +21,7 @@ from parsec.core.fs.exceptions import (
     FSLocalMissError,
 )
 
-from parsec.core.fs.utils import is_file_manifest
+from parsec.core.fs.utils import is_file_manifest, is_folderish_manifest
 
 __all__ = "SyncTransactions"
 
@@ -252,6 +251,8 @@ class SyncTransactions(EntryTransactions):
             # Set the new base manifest
             if base_version != remote_version or new_local_manifest.need_sync:
                 await self.local_storage.set_manifest(entry_id, new_local_manifest)
+                if is_folderish_manifest(new_local_manifest):
+                    self._invalidate_dentries(entry_id)
 
             # Send downsynced event
             if base_version != new_base_version and remote_author != self.local_author:
@@ -304,27 +305,21 @@ class SyncTransactions(EntryTransactions):
                 if filename is None:
                     return
 
-                # Copy blocks
-                new_blocks = []
-                for chunks in current_manifest.blocks:
-                    new_chunks = []
-                    for chunk in chunks:
-                        data = await self.local_storage.get_chunk(chunk.id)
-                        new_chunk = Chunk.new(chunk.start, chunk.stop)
-                        await self.local_storage.set_chunk(new_chunk.id, data)
-                        if len(chunks) == 1:
-                            new_chunk = new_chunk.evolve_as_block(data)
-                        new_chunks.append(chunk)
-                    new_blocks.append(tuple(new_chunks))
-                new_blocks = tuple(new_blocks)
+                # The buffered writes are part of the local version
+                await self._flush_write_buffers(entry_id)
+
+                # The current entry is about to be replaced by the remote version,
+                # so its chunks are simply handed over to the backup file: the
+                # uploaded blocks are shared and the dirty chunks change owner
+                new_blocks = current_manifest.blocks
 
                 # Prepare
                 new_name = get_conflict_filename(
                     filename, list(parent_manifest.children), remote_manifest.author
                 )
-                new_manifest = LocalFileManifest.new_placeholder(parent=parent_id).evolve(
-                    size=current_manifest.size, blocks=new_blocks
-                )
+                new_manifest = LocalFileManifest.new_placeholder(
+                    parent=parent_id, blocksize=current_manifest.blocksize
+                ).evolve(size=current_manifest.size, blocks=new_blocks)
                 new_parent_manifest = parent_manifest.evolve_children_and_mark_updated(
                     {new_name: new_manifest.id}
                 )
@@ -335,6 +330,7 @@ class SyncTransactions(EntryTransactions):
                     new_manifest.id, new_manifest, check_lock_status=False
                 )
                 await self.local_storage.set_manifest(parent_id, new_parent_manifest)
+                self._invalidate_dentries(parent_id)
                 await self.local_storage.set_manifest(entry_id, other_manifest)
 
                 self._send_event("fs.entry.updated", id=new_manifest.id)
@@ -1,9 +1,11 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) AGPLv3 2019 Scille SAS
 
+import math
 import attr
 import trio
+from itertools import chain
 from collections import defaultdict
-from typing import Union, Iterator, Dict, Tuple
+from typing import Union, Iterator, Iterable, Dict, Tuple, Optional, List
 from pendulum import Pendulum, now as pendulum_now
 
 from parsec.api.data import Manifest as RemoteManifest
@@ -11,10 +13,12 @@ from parsec.api.protocol import UserID
 from parsec.core.types import (
     FsPath,
     EntryID,
+    EntryName,
     LocalDevice,
     WorkspaceRole,
     LocalFolderishManifests,
     LocalFileManifest,
+    BlockAccess,
     DEFAULT_BLOCK_SIZE,
 )
 from parsec.core.remote_devices_manager import (
@@ -22,7 +26,14 @@ from parsec.core.remote_devices_manager import (
     RemoteDevicesManagerError,
 )
 from parsec.core.fs.exceptions import FSError, FSBackendOfflineError
-from parsec.core.fs.remote_loader import RemoteLoader
+from parsec.core.fs.remote_loader import (
+    RemoteLoader,
+    DEFAULT_MAX_CONCURRENT_DOWNLOADS,
+    DEFAULT_MAX_CONCURRENT_UPLOADS,
+    BLOCK_BATCH_ITEM_MAX_SIZE,
+    BLOCK_BATCH_MAX_BYTES,
+    BLOCK_BATCH_MAX_COUNT,
+)
 from parsec.core.fs import workspacefs  # Needed to break cyclic import with WorkspaceFSTimestamped
 from parsec.core.fs.workspacefs.sync_transactions import SyncTransactions
 from parsec.core.fs.workspacefs.versioning_helpers import VersionLister
@@ -41,6 +52,13 @@ from parsec.core.fs.exceptions import (
     FSNotADirectoryError,
 )
 
+# Amount of block data read from the local storage and not yet uploaded
+DEFAULT_UPLOAD_MAX_IN_FLIGHT_BYTES = 8 * DEFAULT_BLOCK_SIZE
+
+# Blocks to make available offline are downloaded and pinned by batches,
+# so they do not get evicted from the block cache in the meantime
+OFFLINE_BATCH_SIZE = 16
+
 AnyPath = Union[FsPath, str]
 
 
@@ -64,6 +82,10 @@ class WorkspaceFS:
         backend_cmds,
         event_bus,
         remote_device_manager,
+        max_concurrent_downloads: int = DEFAULT_MAX_CONCURRENT_DOWNLOADS,
+        max_concurrent_uploads: int = DEFAULT_MAX_CONCURRENT_UPLOADS,
+        upload_max_in_flight_bytes: int = DEFAULT_UPLOAD_MAX_IN_FLIGHT_BYTES,
+        prefetch_nursery: Optional[trio.Nursery] = None,
     ):
         self.workspace_id = workspace_id
         self.get_workspace_entry = get_workspace_entry
@@ -73,6 +95,8 @@ class WorkspaceFS:
         self.event_bus = event_bus
         self.remote_device_manager = remote_device_manager
         self.sync_locks = defaultdict(trio.Lock)
+        self.max_concurrent_uploads = max(max_concurrent_uploads, 1)
+        self.upload_max_in_flight_bytes = upload_max_in_flight_bytes
 
         self.remote_loader = RemoteLoader(
             self.device,
@@ -81,6 +105,7 @@ class WorkspaceFS:
             self.backend_cmds,
             self.remote_device_manager,
             self.local_storage,
+            max_concurrent_downloads=max_concurrent_downloads,
         )
         self.transactions = SyncTransactions(
             self.workspace_id,
@@ -89,6 +114,7 @@ class WorkspaceFS:
             self.local_storage,
             self.remote_loader,
             self.event_bus,
+            prefetch_nursery=prefetch_nursery,
         )
 
     def __repr__(self):
@@ -264,6 +290,15 @@ class WorkspaceFS:
         """
         return [child async for child in self.iterdir(path)]
 
+    async def scandir(self, path: AnyPath) -> Dict[EntryName, dict]:
+        """
+        Return the stats of all the children of a folder (see `path_info`).
+
+        Raises:
+            FSError
+        """
+        return await self.transactions.entry_scandir(FsPath(path))
+
     async def rename(self, source: AnyPath, destination: AnyPath, overwrite: bool = True) -> None:
         """
         Raises:
@@ -385,19 +420,10 @@ class WorkspaceFS:
         except FileNotFoundError:
             pass
 
-        # Rename if possible
-        if source.parent == real_destination.parent:
-            return await self.rename(source, real_destination)
-
-        # Copy directory
-        if await self.is_dir(source):
-            await self.copytree(source, real_destination)
-            await self.rmtree(source)
-            return
-
-        # Copy file
-        await self.copyfile(source, real_destination)
-        await self.unlink(source)
+        # Renaming is a metadata-only operation, even across directories.
+        # Note that moving to another directory never replaces an existing entry
+        overwrite = source.parent == real_destination.parent
+        await self.rename(source, real_destination, overwrite=overwrite)
 
     async def copytree(self, source_path: AnyPath, target_path: AnyPath):
         source_path = FsPath(source_path)
@@ -418,18 +444,17 @@ class WorkspaceFS:
         length=DEFAULT_BLOCK_SIZE,
         exist_ok: bool = False,
     ):
-        """
+        """Copy a file without transferring its data.
+
+        The copy references the blocks of the source, so only the new manifest
+        has to be synchronized. The `length` argument is kept for compatibility.
+
         Raises:
             FSError
         """
-        await self.touch(target_path, exist_ok=exist_ok)
-        offset = 0
-        while True:
-            buff = await self.read_bytes(source_path, length, offset * length)
-            if not buff:
-                break
-            await self.write_bytes(target_path, buff, offset * length)
-            offset += 1
+        source_path = FsPath(source_path)
+        target_path = FsPath(target_path)
+        await self.transactions.file_copy(source_path, target_path, exist_ok=exist_ok)
 
     async def rmtree(self, path: AnyPath):
         """
@@ -444,6 +469,88 @@ class WorkspaceFS:
                 await self.unlink(child)
         await self.rmdir(path)
 
+    # Offline availability
+
+    async def pin(self, path: AnyPath) -> None:
+        """Make a file or a folder, including all its children, available offline.
+
+        The entry remains pinned until `unpin` is called: the changes coming from
+        the remote are downloaded as they get synchronized.
+
+        Raises:
+            FSError
+        """
+        entry_id = await self.path_id(path)
+        await self.local_storage.set_entry_pinned(entry_id, True)
+        await self._set_offline(entry_id, True)
+
+    async def unpin(self, path: AnyPath) -> None:
+        """
+        Raises:
+            FSError
+        """
+        entry_id = await self.path_id(path)
+        await self.local_storage.set_entry_pinned(entry_id, False)
+
+        # The entry might still be pinned through one of its parents
+        if await self._is_entry_pinned(entry_id):
+            return
+        await self._set_offline(entry_id, False)
+
+    async def is_pinned(self, path: AnyPath) -> bool:
+        """
+        Raises:
+            FSError
+        """
+        entry_id = await self.path_id(path)
+        return await self._is_entry_pinned(entry_id)
+
+    async def _is_entry_pinned(self, entry_id: EntryID) -> bool:
+        pinned_entries = self.local_storage.get_pinned_entries()
+        if not pinned_entries:
+            return False
+
+        # Walk up to the workspace root
+        while entry_id not in pinned_entries:
+            if entry_id == self.workspace_id:
+                return False
+            try:
+                manifest = await self.local_storage.get_manifest(entry_id)
+            except FSLocalMissError:
+                return False
+            entry_id = manifest.parent
+        return True
+
+    async def _set_offline(self, entry_id: EntryID, offline: bool, recursive: bool = True):
+        # When not recursive, only the missing children of a folder are considered
+        pinned_entries = self.local_storage.get_pinned_entries()
+
+        async def _walk(entry_id, recursive=True):
+            children, accesses = await self.transactions.entry_offline_content(
+                entry_id, missing_only=not recursive
+            )
+            for child_id in children:
+                # Pinned children are left as is when unpinning
+                if offline or child_id not in pinned_entries:
+                    nursery.start_soon(_walk, child_id)
+            for i in range(0, len(accesses), OFFLINE_BATCH_SIZE):
+                await self._set_blocks_offline(accesses[i : i + OFFLINE_BATCH_SIZE], offline)
+
+        async with trio.open_service_nursery() as nursery:
+            nursery.start_soon(_walk, entry_id, recursive)
+
+    async def _set_blocks_offline(self, accesses: List[BlockAccess], offline: bool) -> None:
+        block_ids = [access.id for access in accesses]
+        missing = await self.local_storage.set_clean_blocks_offline(block_ids, offline)
+        if not offline:
+            return
+
+        # Download the missing blocks and pin them
+        accesses = {access.id: access for access in accesses}
+        while missing:
+            await self.remote_loader.load_blocks([accesses[block_id] for block_id in missing])
+            missing = await self.local_storage.set_clean_blocks_offline(missing, offline)
+
     # Sync helpers
 
     async def _synchronize_placeholders(self, manifest: LocalFolderishManifests) -> None:
@@ -451,12 +558,130 @@ class WorkspaceFS:
             await self.minimal_sync(child)
 
     async def _upload_blocks(self, manifest: LocalFileManifest) -> None:
-        for access in manifest.blocks:
+        # The dirty blocks are read in order and handed over to a pool of uploaders,
+        # the amount of data waiting to be uploaded being bounded. Blocks that are
+        # not dirty have already been uploaded and simply count as progress.
+        total_bytes = sum(access.size for access in manifest.blocks)
+        uploaded_bytes = 0
+        in_flight_bytes = 0
+        in_flight_released = trio.Condition()
+        send_channel, receive_channel = trio.open_memory_channel(math.inf)
+
+        async def _reserve(size):
+            nonlocal in_flight_bytes
+            async with in_flight_released:
+                while in_flight_bytes and in_flight_bytes + size > self.upload_max_in_flight_bytes:
+                    await in_flight_released.wait()
+                in_flight_bytes += size
+
+        async def _release(size):
+            nonlocal in_flight_bytes, uploaded_bytes
+            async with in_flight_released:
+                in_flight_bytes -= size
+                in_flight_released.notify_all()
+            uploaded_bytes += size
+
+        async def _read_blocks():
+            async with send_channel:
+                for access in manifest.blocks:
+                    await _reserve(access.size)
+                    try:
+                        data = await self.local_storage.get_dirty_block(access.id)
+                    except FSLocalMissError:
+                        await _release(access.size)
+                        continue
+                    await send_channel.send((access, data))
+
+        async def _upload_blocks():
+            # Block received but left out of the previous batch
+            pending = None
+            while True:
+                if pending is None:
+                    try:
+                        pending = await receive_channel.receive()
+                    except trio.EndOfChannel:
+                        return
+                blocks = [pending]
+                size = pending[0].size
+                pending = None
+
+                # Small blocks already queued are uploaded along with a small one
+                while (
+                    blocks[0][0].size <= BLOCK_BATCH_ITEM_MAX_SIZE
+                    and len(blocks) < BLOCK_BATCH_MAX_COUNT
+                ):
+                    try:
+                        item = receive_channel.receive_nowait()
+                    except (trio.WouldBlock, trio.EndOfChannel):
+                        break
+                    access, _ = item
+                    if (
+                        access.size > BLOCK_BATCH_ITEM_MAX_SIZE
+                        or size + access.size > BLOCK_BATCH_MAX_BYTES
+                    ):
+                        pending = item
+                        break
+                    blocks.append(item)
+                    size += access.size
+
+                await self.remote_loader.upload_blocks(blocks)
+                await _release(size)
+                self.event_bus.send(
+                    "fs.entry.upload_progress",
+                    workspace_id=self.workspace_id,
+                    id=manifest.id,
+                    uploaded_bytes=uploaded_bytes,
+                    total_bytes=total_bytes,
+                )
+
+        async with trio.open_service_nursery() as nursery:
+            nursery.start_soon(_read_blocks)
+            for _ in range(self.max_concurrent_uploads):
+                nursery.start_soon(_upload_blocks)
+
+    async def upload_dirty_blocks(self, entry_ids: Iterable[EntryID]) -> None:
+        """
+        Upload the small dirty blocks of the given files altogether, so that the
+        blocks of different files share the same batch requests. The files are
+        reshaped if needed, and their synchronization then finds these blocks
+        already uploaded. The bigger blocks are left to the synchronization.
+
+        Raises:
+            FSError
+        """
+        blocks = []
+        size = 0
+        for entry_id in entry_ids:
             try:
-                data = await self.local_storage.get_dirty_block(access.id)
+                manifest = await self.local_storage.get_manifest(entry_id)
             except FSLocalMissError:
                 continue
-            await self.remote_loader.upload_block(access, data)
+            if not is_file_manifest(manifest) or not manifest.need_sync:
+                continue
+
+            # The blocks are only known once the file is reshaped
+            if not manifest.is_reshaped():
+                await self.transactions.file_reshape(entry_id)
+                manifest = await self.local_storage.get_manifest(entry_id)
+
+            for chunk in chain.from_iterable(manifest.blocks):
+                if not chunk.is_block or chunk.access.size > BLOCK_BATCH_ITEM_MAX_SIZE:
+                    continue
+                try:
+                    data = await self.local_storage.get_dirty_block(chunk.access.id)
+                except FSLocalMissError:
+                    continue
+                blocks.append((chunk.access, data))
+                size += len(data)
+
+                # Bound the amount of data read ahead of the upload
+                if size >= BLOCK_BATCH_MAX_BYTES or len(blocks) >= BLOCK_BATCH_MAX_COUNT:
+                    await self.remote_loader.upload_blocks(blocks)
+                    blocks = []
+                    size = 0
+
+        if blocks:
+            await self.remote_loader.upload_blocks(blocks)
 
     async def minimal_sync(self, entry_id: EntryID) -> None:
         """
@@ -600,11 +825,17 @@ class WorkspaceFS:
             await self.transactions.file_conflict(entry_id, local_manifest, remote_manifest)
             return await self.sync_by_id(local_manifest.parent)
 
+        # Keep the pinned entries available offline: download the new blocks
+        # of a file, or the new children of a folder
+        if remote_changed and await self._is_entry_pinned(entry_id):
+            await self._set_offline(entry_id, True, recursive=False)
+
         # Non-recursive
         if not recursive or is_file_manifest(manifest):
             return
 
-        # Synchronize children
+        # Synchronize children, their small blocks being uploaded altogether first
+        await self.upload_dirty_blocks(manifest.children.values())
         for name, entry_id in manifest.children.items():
             await self.sync_by_id(entry_id, remote_changed=remote_changed, recursive=True)
 
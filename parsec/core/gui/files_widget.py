@@ -12,11 +12,7 @@ from PyQt5.QtWidgets import QFileDialog, QWidget
 
 from parsec.core.types import FsPath, WorkspaceEntry, WorkspaceRole, BackendOrganizationFileLinkAddr
 from parsec.core.fs import WorkspaceFS, WorkspaceFSTimestamped
-from parsec.core.fs.exceptions import (
-    FSRemoteManifestNotFound,
-    FSInvalidArgumentError,
-    FSFileNotFoundError,
-)
+from parsec.core.fs.exceptions import FSInvalidArgumentError, FSFileNotFoundError
 
 from parsec.core.gui.trio_thread import JobResultError, ThreadSafeQtSignal, QtToTrioJob
 from parsec.core.gui import desktop
@@ -67,14 +63,8 @@ async def _do_delete(workspace_fs, files, silent=False):
 
 
 async def _do_folder_stat(workspace_fs, path, default_selection):
-    stats = {}
     dir_stat = await workspace_fs.path_info(path)
-    for child in dir_stat["children"]:
-        try:
-            child_stat = await workspace_fs.path_info(path / child)
-        except FSRemoteManifestNotFound as exc:
-            child_stat = {"type": "inconsistency", "id": exc.args[0]}
-        stats[child] = child_stat
+    stats = await workspace_fs.scandir(path)
     return path, dir_stat["id"], stats, default_selection
 
 
@@ -55,12 +55,24 @@ async def logged_core_factory(
         max_cooldown=config.backend_max_cooldown,
         max_pool=config.backend_max_connections,
         keepalive=config.backend_connection_keepalive,
+        max_pipelined_requests=config.backend_max_pipelined_requests,
+    )
+    # Keep a connection available for the event listener
+    max_concurrent_transfers = max(
+        config.backend_max_connections - 1, config.backend_max_pipelined_requests
     )
 
     path = config.data_base_dir / device.slug
     remote_devices_manager = RemoteDevicesManager(backend_conn.cmds, device.root_verify_key)
     async with UserFS.run(
-        device, path, backend_conn.cmds, remote_devices_manager, event_bus
+        device,
+        path,
+        backend_conn.cmds,
+        remote_devices_manager,
+        event_bus,
+        max_concurrent_downloads=max_concurrent_transfers,
+        max_concurrent_uploads=max_concurrent_transfers,
+        block_cache_size=config.block_cache_size,
     ) as user_fs:
 
         backend_conn.register_monitor(partial(monitor_messages, user_fs, event_bus))
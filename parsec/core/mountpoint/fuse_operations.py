@@ -31,6 +31,31 @@ def is_banned(name):
     return any(name.startswith(prefix) for prefix in BANNED_PREFIXES)
 
 
+def stat_to_fuse_attributes(stat):
+    fuse_stat = {}
+    # Set it to 777 access
+    fuse_stat["st_mode"] = 0
+    if stat["type"] == "folder":
+        fuse_stat["st_mode"] |= S_IFDIR
+        fuse_stat["st_size"] = 4096  # Because why not ?
+        fuse_stat["st_nlink"] = 2
+    else:
+        fuse_stat["st_mode"] |= S_IFREG
+        fuse_stat["st_size"] = stat["size"]
+        fuse_stat["st_nlink"] = 1
+    fuse_stat["st_blocks"] = fuse_stat["st_size"] // 512
+    if fuse_stat["st_size"] % 512:
+        fuse_stat["st_blocks"] += 1
+    fuse_stat["st_mode"] |= S_IRWXU | S_IRWXG | S_IRWXO
+    fuse_stat["st_ctime"] = stat["created"].timestamp()  # TODO change to local timezone
+    fuse_stat["st_mtime"] = stat["updated"].timestamp()
+    fuse_stat["st_atime"] = stat["updated"].timestamp()  # TODO not supported ?
+    uid, gid, _ = fuse_get_context()
+    fuse_stat["st_uid"] = uid
+    fuse_stat["st_gid"] = gid
+    return fuse_stat
+
+
 @contextmanager
 def translate_error(event_bus, operation, path):
     try:
@@ -83,37 +108,17 @@ class FuseOperations(LoggingMixIn, Operations):
             fuse_exit()
 
         stat = self.fs_access.entry_info(path)
-
-        fuse_stat = {}
-        # Set it to 777 access
-        fuse_stat["st_mode"] = 0
-        if stat["type"] == "folder":
-            fuse_stat["st_mode"] |= S_IFDIR
-            fuse_stat["st_size"] = 4096  # Because why not ?
-            fuse_stat["st_nlink"] = 2
-        else:
-            fuse_stat["st_mode"] |= S_IFREG
-            fuse_stat["st_size"] = stat["size"]
-            fuse_stat["st_nlink"] = 1
-        fuse_stat["st_blocks"] = fuse_stat["st_size"] // 512
-        if fuse_stat["st_size"] % 512:
-            fuse_stat["st_blocks"] += 1
-        fuse_stat["st_mode"] |= S_IRWXU | S_IRWXG | S_IRWXO
-        fuse_stat["st_ctime"] = stat["created"].timestamp()  # TODO change to local timezone
-        fuse_stat["st_mtime"] = stat["updated"].timestamp()
-        fuse_stat["st_atime"] = stat["updated"].timestamp()  # TODO not supported ?
-        uid, gid, _ = fuse_get_context()
-        fuse_stat["st_uid"] = uid
-        fuse_stat["st_gid"] = gid
-        return fuse_stat
+        return stat_to_fuse_attributes(stat)
 
     def readdir(self, path: FsPath, fh: int):
-        stat = self.fs_access.entry_info(path)
-
-        if stat["type"] == "file":
-            raise FuseOSError(errno.ENOTDIR)
-
-        return [".", ".."] + list(stat["children"])
+        # The stats of the children are provided along with their names
+        entries = [".", ".."]
+        for name, stat in self.fs_access.entry_scandir(path).items():
+            if stat["type"] == "inconsistency":
+                entries.append(name)
+            else:
+                entries.append((name, stat_to_fuse_attributes(stat), 0))
+        return entries
 
     def create(self, path: FsPath, mode: int):
         if is_banned(path.name):
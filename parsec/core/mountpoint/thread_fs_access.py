@@ -27,6 +27,9 @@ class ThreadFSAccess:
     def entry_info(self, path):
         return self._run(self.workspace_fs.transactions.entry_info, path)
 
+    def entry_scandir(self, path):
+        return self._run(self.workspace_fs.transactions.entry_scandir, path)
+
     def entry_rename(self, source, destination, *, overwrite):
         return self._run(
             self.workspace_fs.transactions.entry_rename, source, destination, overwrite
@@ -316,7 +316,8 @@ class WinFSPOperations(BaseFileSystemOperations):
         # NOTE: we *do not* rely on alphabetically sorting to compare the
         # marker given `..` is always the first element event if we could
         # have children name before it (`.-foo` for instance)
-        iter_children_names = iter(stat["children"])
+        children_stats = self.fs_access.entry_scandir(file_context.path)
+        iter_children_names = iter(children_stats)
         if marker is not None:
             for child_name in iter_children_names:
                 if child_name == marker:
@@ -325,7 +326,9 @@ class WinFSPOperations(BaseFileSystemOperations):
         # All remaining children are located after the marker
         for child_name in iter_children_names:
             name = winify_entry_name(child_name)
-            child_stat = self.fs_access.entry_info(file_context.path / child_name)
+            child_stat = children_stats[child_name]
+            if child_stat["type"] == "inconsistency":
+                child_stat = self.fs_access.entry_info(file_context.path / child_name)
             entry = {"file_name": name, **stat_to_winfsp_attributes(child_stat)}
             entries.append(entry)
 
@@ -3,6 +3,7 @@
 import trio
 from trio.hazmat import current_clock
 import math
+from typing import List
 from structlog import get_logger
 
 from parsec.core.types import EntryID, WorkspaceRole
@@ -38,11 +39,12 @@ def timestamp():
 
 
 class LocalChange:
-    __slots__ = ("first_changed_on", "last_changed_on", "due_time")
+    __slots__ = ("first_changed_on", "last_changed_on", "due_time", "blocks_uploaded")
 
     def __init__(self, now):
         self.first_changed_on = self.last_changed_on = now
         self.due_time = self._compute_due_time()
+        self.blocks_uploaded = False
 
     def _compute_due_time(self):
         return min(self.last_changed_on + MIN_WAIT, self.first_changed_on + MAX_WAIT)
@@ -50,6 +52,7 @@ class LocalChange:
     def changed(self, changed_on) -> float:
         self.last_changed_on = changed_on
         self.due_time = self._compute_due_time()
+        self.blocks_uploaded = False
         return self.due_time
 
 
@@ -76,6 +79,10 @@ class SyncContext:
     def _sync(self, entry_id: EntryID):
         raise NotImplementedError
 
+    async def _upload_blocks(self, entry_ids: List[EntryID]):
+        # Blocks are uploaded along with their entry by default
+        pass
+
     def _get_backend_cmds(self):
         raise NotImplementedError
 
@@ -161,6 +168,13 @@ class SyncContext:
         self.due_time = timestamp()
         return True
 
+    def set_remote_changes_missed(self) -> bool:
+        # Some `realm.vlobs_updated` events have been lost, fetch the changes
+        # from the realm checkpoint again on next tick
+        self._changes_loaded = False
+        self.due_time = timestamp()
+        return True
+
     def _compute_due_time(self, now=None, min_due_time=None):
         if self._remote_changes:
             self.due_time = now or timestamp()
@@ -227,8 +241,19 @@ class SyncContext:
                 None,
             )
             if entry_id:
+                # The blocks of all the due entries are uploaded at once, so
+                # the small blocks of different files share the same requests
+                to_upload = {
+                    due_id: change_info
+                    for due_id, change_info in self._local_changes.items()
+                    if change_info.due_time <= now and not change_info.blocks_uploaded
+                }
                 del self._local_changes[entry_id]
                 try:
+                    if to_upload:
+                        await self._upload_blocks(list(to_upload))
+                        for change_info in to_upload.values():
+                            change_info.blocks_uploaded = True
                     await self._sync(entry_id)
                 except FSBackendOfflineError as exc:
                     raise BackendNotAvailable from exc
@@ -265,6 +290,9 @@ class WorkspaceSyncContext(SyncContext):
         # (remotely or locally) should get synchronized
         await self.workspace.sync_by_id(entry_id, recursive=False)
 
+    async def _upload_blocks(self, entry_ids: List[EntryID]):
+        await self.workspace.upload_dirty_blocks(entry_ids)
+
     def _get_backend_cmds(self):
         return self.workspace.backend_cmds
 
@@ -345,6 +373,11 @@ async def monitor_sync(user_fs, event_bus, task_status):
         if ctx and ctx.set_remote_change(src_id):
             _trigger_early_wakeup()
 
+    def _on_events_overflow(event):
+        for ctx in ctxs.iter():
+            ctx.set_remote_changes_missed()
+        _trigger_early_wakeup()
+
     def _on_sharing_updated(sender, new_entry, previous_entry):
         # If role have changed we have to reset the sync context given
         # behavior could have changed a lot (e.g. switching to/from read-only)
@@ -377,6 +410,7 @@ async def monitor_sync(user_fs, event_bus, task_status):
     with event_bus.connect_in_context(
         ("fs.entry.updated", _on_entry_updated),
         ("backend.realm.vlobs_updated", _on_realm_vlobs_updated),
+        ("backend.events.overflow", _on_events_overflow),
         ("sharing.updated", _on_sharing_updated),
     ):
         due_times = []
@@ -66,6 +66,9 @@ class Chunk(BaseData):
 
     Access is an optional block access that can be used to produce a remote manifest
     when the chunk corresponds to an actual block within the context of this manifest.
+
+    A hole is a chunk without raw data: it reads as zeros, is never stored in the
+    local storage and is never uploaded as a block.
     """
 
     class SCHEMA_CLS(BaseSchema):
@@ -75,6 +78,8 @@ class Chunk(BaseData):
         raw_offset = fields.Integer(required=True, validate=validate.Range(min=0))
         raw_size = fields.Integer(required=True, validate=validate.Range(min=1))
         access = fields.Nested(BlockAccess.SCHEMA_CLS, required=True, allow_none=True)
+        # Not required for compatibility with chunks stored before holes were supported
+        is_hole = fields.Boolean(missing=False)
 
         @post_load
         def make_obj(self, data):
@@ -86,6 +91,7 @@ class Chunk(BaseData):
     raw_offset: int
     raw_size: int
     access: Optional[BlockAccess]
+    is_hole: bool = False
 
     # Ordering
 
@@ -143,6 +149,19 @@ class Chunk(BaseData):
             access=None,
         )
 
+    @classmethod
+    def new_hole(cls, start: int, stop: int) -> "Chunk":
+        assert start < stop
+        return cls(
+            id=ChunkID(),
+            start=start,
+            stop=stop,
+            raw_offset=start,
+            raw_size=stop - start,
+            access=None,
+            is_hole=True,
+        )
+
     @classmethod
     def from_block_acess(cls, block_access: BlockAccess):
         return cls(
@@ -161,6 +180,10 @@ class Chunk(BaseData):
         if self.is_block:
             return self
 
+        # Holes have no data
+        if self.is_hole:
+            raise TypeError("This chunk is a hole")
+
         # Check alignement
         if self.raw_offset != self.start:
             raise TypeError("This chunk is not aligned")
@@ -260,8 +283,6 @@ class LocalManifest(BaseLocalData):
         dct.pop("base")
         for name in "base_version", "is_placeholder", "created":
             dct[name] = getattr(self, name)
-        if hasattr(self.base, "parent"):
-            dct["parent"] = self.parent
         return dct
 
 
@@ -269,6 +290,9 @@ class LocalFileManifest(LocalManifest):
     class SCHEMA_CLS(BaseSchema):
         type = fields.CheckedConstant("local_file_manifest", required=True)
         base = fields.Nested(RemoteFileManifest.SCHEMA_CLS, required=True)
+        # Not required for compatibility with manifests stored before
+        # the entries could be moved to another folder
+        parent = EntryIDField(required=False)
         need_sync = fields.Boolean(required=True)
         updated = fields.DateTime(required=True)
         size = fields.Integer(required=True, validate=validate.Range(min=0))
@@ -280,9 +304,11 @@ class LocalFileManifest(LocalManifest):
         @post_load
         def make_obj(self, data):
             data.pop("type")
+            data.setdefault("parent", data["base"].parent)
             return LocalFileManifest(**data)
 
     base: RemoteFileManifest
+    parent: EntryID
     need_sync: bool
     updated: Pendulum
     size: int
@@ -308,6 +334,7 @@ class LocalFileManifest(LocalManifest):
                 size=0,
                 blocks=blocks,
             ),
+            parent=parent,
             need_sync=True,
             updated=now,
             blocksize=blocksize,
@@ -315,12 +342,6 @@ class LocalFileManifest(LocalManifest):
             blocks=blocks,
         )
 
-    # Properties
-
-    @property
-    def parent(self):
-        return self.base.parent
-
     # Helper methods
 
     def get_chunks(self, block: int) -> Tuple[Chunk]:
@@ -333,7 +354,7 @@ class LocalFileManifest(LocalManifest):
         for chunks in self.blocks:
             if len(chunks) != 1:
                 return False
-            if not chunks[0].is_block:
+            if not chunks[0].is_block and not chunks[0].is_hole:
                 return False
         return True
 
@@ -356,13 +377,23 @@ class LocalFileManifest(LocalManifest):
 
     @classmethod
     def from_remote(cls, remote: RemoteFileManifest) -> "LocalFileManifest":
+        # The holes are the blocks missing from the remote manifest
+        accesses = {block_access.offset: block_access for block_access in remote.blocks}
+        blocks = []
+        for start in range(0, remote.size, remote.blocksize):
+            try:
+                chunk = Chunk.from_block_acess(accesses[start])
+            except KeyError:
+                chunk = Chunk.new_hole(start, min(start + remote.blocksize, remote.size))
+            blocks.append((chunk,))
         return cls(
             base=remote,
+            parent=remote.parent,
             need_sync=False,
             updated=remote.updated,
             size=remote.size,
             blocksize=remote.blocksize,
-            blocks=tuple((Chunk.from_block_acess(block_access),) for block_access in remote.blocks),
+            blocks=tuple(blocks),
         )
 
     def to_remote(self, author: DeviceID, timestamp: Pendulum = None) -> RemoteFileManifest:
@@ -370,8 +401,10 @@ class LocalFileManifest(LocalManifest):
         self.assert_integrity()
         assert self.is_reshaped()
 
-        # Blocks
-        blocks = tuple(chunks[0].get_block_access() for chunks in self.blocks)
+        # Blocks (holes are not part of the remote manifest, making it a sparse one)
+        blocks = tuple(
+            chunks[0].get_block_access() for chunks in self.blocks if not chunks[0].is_hole
+        )
 
         return RemoteFileManifest(
             author=author,
@@ -396,6 +429,9 @@ class LocalFolderManifest(LocalManifest):
     class SCHEMA_CLS(BaseSchema):
         type = fields.CheckedConstant("local_folder_manifest", required=True)
         base = fields.Nested(RemoteFolderManifest.SCHEMA_CLS, required=True)
+        # Not required for compatibility with manifests stored before
+        # the entries could be moved to another folder
+        parent = EntryIDField(required=False)
         need_sync = fields.Boolean(required=True)
         updated = fields.DateTime(required=True)
         children = fields.FrozenMap(EntryNameField(), EntryIDField(required=True), required=True)
@@ -403,9 +439,11 @@ class LocalFolderManifest(LocalManifest):
         @post_load
         def make_obj(self, data):
             data.pop("type")
+            data.setdefault("parent", data["base"].parent)
             return LocalFolderManifest(**data)
 
     base: RemoteFolderManifest
+    parent: EntryID
     need_sync: bool
     updated: Pendulum
     children: FrozenDict[EntryName, EntryID]
@@ -425,17 +463,12 @@ class LocalFolderManifest(LocalManifest):
                 updated=now,
                 children=children,
             ),
+            parent=parent,
             need_sync=True,
             updated=now,
             children=children,
         )
 
-    # Properties
-
-    @property
-    def parent(self):
-        return self.base.parent
-
     # Evolve methods
 
     def evolve_children_and_mark_updated(self, data) -> "LocalFolderManifest":
@@ -452,7 +485,13 @@ class LocalFolderManifest(LocalManifest):
 
     @classmethod
     def from_remote(cls, remote: RemoteFolderManifest) -> "LocalFolderManifest":
-        return cls(base=remote, need_sync=False, updated=remote.updated, children=remote.children)
+        return cls(
+            base=remote,
+            parent=remote.parent,
+            need_sync=False,
+            updated=remote.updated,
+            children=remote.children,
+        )
 
     def to_remote(self, author: DeviceID, timestamp: Pendulum = None) -> RemoteFolderManifest:
         return RemoteFolderManifest(
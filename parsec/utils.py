@@ -1,8 +1,11 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) AGPLv3 2019 Scille SAS
 
+import os
+from concurrent.futures import ThreadPoolExecutor
 
 import attr
 import trio
+import outcome
 from pendulum import Pendulum
 from structlog import get_logger
 from async_generator import asynccontextmanager
@@ -16,6 +19,7 @@ __all__ = [
     "trio_run",
     "open_service_nursery",
     "split_multi_error",
+    "run_cpu_bound",
 ]
 
 logger = get_logger()
@@ -112,6 +116,53 @@ def trio_run(async_fn, *args, use_asyncio=False):
     return trio.run(async_fn, *args, instruments=instruments)
 
 
+# CPU-bound operations
+
+# Below this size (in bytes), the cost of the thread hop outweighs the cost
+# of the operation itself and the work is performed inline
+CPU_OFFLOAD_THRESHOLD = 64 * 1024
+
+_cpu_executor = None
+
+
+def _get_cpu_executor():
+    global _cpu_executor
+    if _cpu_executor is None:
+        _cpu_executor = ThreadPoolExecutor(
+            max_workers=os.cpu_count() or 1, thread_name_prefix="parsec-cpu"
+        )
+    return _cpu_executor
+
+
+async def run_cpu_bound(fn, *args, size=None):
+    """Run a CPU-bound function (encryption, hashing, serialization) in a worker thread.
+
+    The worker threads are shared by the whole process and live as long as it does,
+    which avoids spawning a new thread for each call. If `size` is provided and is
+    smaller than `CPU_OFFLOAD_THRESHOLD`, the function is simply called inline.
+
+    Note that cancelling the caller does not interrupt the function: its result
+    is discarded once it completes.
+    """
+    if size is not None and size < CPU_OFFLOAD_THRESHOLD:
+        return fn(*args)
+
+    trio_token = trio.hazmat.current_trio_token()
+    send_channel, receive_channel = trio.open_memory_channel(1)
+
+    def target():
+        result = outcome.capture(fn, *args)
+        try:
+            trio.from_thread.run_sync(send_channel.send_nowait, result, trio_token=trio_token)
+        # The trio loop is gone, nobody is waiting for the result
+        except trio.RunFinishedError:
+            pass
+
+    _get_cpu_executor().submit(target)
+    result = await receive_channel.receive()
+    return result.unwrap()
+
+
 # MultiError handling
 
 
@@ -112,6 +112,55 @@ def test_good_administration_handshake():
     assert sh.client_api_version == API_VERSION
 
 
+@pytest.mark.parametrize(
+    "client_pipelining,backend_max_pipelining,expected",
+    [(0, 16, 0), (8, 16, 8), (32, 16, 16), (8, 0, 0)],
+)
+def test_pipelining_negotiation(alice, client_pipelining, backend_max_pipelining, expected):
+    sh = ServerHandshake()
+    ch = AuthenticatedClientHandshake(
+        alice.organization_id,
+        alice.device_id,
+        alice.signing_key,
+        alice.root_verify_key,
+        pipelining=client_pipelining,
+    )
+
+    challenge_req = sh.build_challenge_req()
+    answer_req = ch.process_challenge_req(challenge_req)
+    sh.process_answer_req(answer_req)
+    assert "pipelining" not in sh.answer_data
+    result_req = sh.build_result_req(alice.verify_key, max_pipelining=backend_max_pipelining)
+    ch.process_result_req(result_req)
+
+    assert sh.pipelining == expected
+    assert ch.pipelining == expected
+    if not expected:
+        assert "pipelining" not in unpackb(result_req)
+
+
+def test_no_pipelining_with_older_backend(alice, monkeypatch):
+    monkeypatch.setattr(ServerHandshake, "supported_api_versions", [ApiVersion(1, 2)])
+    sh = ServerHandshake()
+    ch = AuthenticatedClientHandshake(
+        alice.organization_id,
+        alice.device_id,
+        alice.signing_key,
+        alice.root_verify_key,
+        pipelining=8,
+    )
+
+    challenge_req = sh.build_challenge_req()
+    answer_req = ch.process_challenge_req(challenge_req)
+    assert "pipelining" not in unpackb(answer_req)
+    sh.process_answer_req(answer_req)
+    result_req = sh.build_result_req(alice.verify_key, max_pipelining=16)
+    ch.process_result_req(result_req)
+
+    assert sh.pipelining == 0
+    assert ch.pipelining == 0
+
+
 # 1) Server build challenge (nothing more to test...)
 
 
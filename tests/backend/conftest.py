@@ -8,7 +8,9 @@ from parsec.api.data import RealmRoleCertificateContent
 from parsec.api.protocol import (
     RealmRole,
     block_create_serializer,
+    block_create_batch_serializer,
     block_read_serializer,
+    block_read_batch_serializer,
     realm_create_serializer,
     realm_status_serializer,
     realm_get_role_certificates_serializer,
@@ -17,6 +19,7 @@ from parsec.api.protocol import (
     realm_finish_reencryption_maintenance_serializer,
     vlob_create_serializer,
     vlob_read_serializer,
+    vlob_read_batch_serializer,
     vlob_update_serializer,
     vlob_list_versions_serializer,
     vlob_poll_changes_serializer,
@@ -44,12 +47,34 @@ async def block_create(sock, block_id, realm_id, block, check_rep=True):
     return rep
 
 
+async def block_create_batch(sock, realm_id, blocks):
+    await sock.send(
+        block_create_batch_serializer.req_dumps(
+            {
+                "cmd": "block_create_batch",
+                "realm_id": realm_id,
+                "blocks": [{"block_id": block_id, "block": block} for block_id, block in blocks],
+            }
+        )
+    )
+    raw_rep = await sock.recv()
+    return block_create_batch_serializer.rep_loads(raw_rep)
+
+
 async def block_read(sock, block_id):
     await sock.send(block_read_serializer.req_dumps({"cmd": "block_read", "block_id": block_id}))
     raw_rep = await sock.recv()
     return block_read_serializer.rep_loads(raw_rep)
 
 
+async def block_read_batch(sock, block_ids):
+    await sock.send(
+        block_read_batch_serializer.req_dumps({"cmd": "block_read_batch", "block_ids": block_ids})
+    )
+    raw_rep = await sock.recv()
+    return block_read_batch_serializer.rep_loads(raw_rep)
+
+
 async def realm_create(sock, role_certificate, check_rep=True):
     raw_rep = await sock.send(
         realm_create_serializer.req_dumps(
@@ -177,6 +202,23 @@ async def vlob_read(sock, vlob_id, version=None, timestamp=None, encryption_revi
     return vlob_read_serializer.rep_loads(raw_rep)
 
 
+async def vlob_read_batch(sock, items, encryption_revision=1):
+    await sock.send(
+        vlob_read_batch_serializer.req_dumps(
+            {
+                "cmd": "vlob_read_batch",
+                "items": [
+                    {"vlob_id": vlob_id, "version": version, "timestamp": timestamp}
+                    for vlob_id, version, timestamp in items
+                ],
+                "encryption_revision": encryption_revision,
+            }
+        )
+    )
+    raw_rep = await sock.recv()
+    return vlob_read_batch_serializer.rep_loads(raw_rep)
+
+
 async def vlob_update(
     sock, vlob_id, version, blob, encryption_revision=1, timestamp=None, check_rep=True
 ):
@@ -1,5 +1,6 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) AGPLv3 2019 Scille SAS
 
+import math
 import trio
 import pytest
 from unittest.mock import ANY
@@ -8,15 +9,21 @@ from uuid import UUID, uuid4
 from hypothesis import given, strategies as st
 
 from parsec.backend.block import BlockTimeoutError
+from parsec.backend.blockstore import NodesLatencyTracker, BLOCK_BATCH_MAX_CONCURRENCY
 from parsec.backend.realm import RealmGrantedRole
 from parsec.backend.raid5_blockstore import (
     split_block_in_chunks,
     generate_checksum_chunk,
     rebuild_block_from_chunks,
 )
+from parsec.backend.erasure_coding_blockstore import (
+    split_block_in_shards,
+    generate_parity_shards,
+    rebuild_block_from_shards,
+)
 from parsec.api.protocol import block_create_serializer, block_read_serializer, packb, RealmRole
 
-from tests.backend.conftest import block_create, block_read
+from tests.backend.conftest import block_create, block_read, block_create_batch, block_read_batch
 
 
 BLOCK_ID = UUID("00000000000000000000000000000001")
@@ -102,6 +109,95 @@ async def test_block_create_and_read(alice_backend_sock, realm):
     assert rep == {"status": "not_found"}
 
 
+@pytest.mark.trio
+async def test_block_create_and_read_batch(alice_backend_sock, realm, block):
+    blocks = [(uuid4(), f"block {i}".encode()) for i in range(3)]
+    rep = await block_create_batch(alice_backend_sock, realm, [*blocks, (block, b"other")])
+    assert rep == {"status": "ok", "items": [{"status": "ok"}] * 3 + [{"status": "already_exists"}]}
+
+    dummy_id = UUID("00000000000000000000000000000002")
+    rep = await block_read_batch(
+        alice_backend_sock, [blocks[2][0], dummy_id, block, blocks[0][0], blocks[1][0]]
+    )
+    assert rep == {
+        "status": "ok",
+        "items": [
+            {"status": "ok", "block": b"block 2"},
+            {"status": "not_found", "block": None},
+            {"status": "ok", "block": BLOCK_DATA},
+            {"status": "ok", "block": b"block 0"},
+            {"status": "ok", "block": b"block 1"},
+        ],
+    }
+
+
+@pytest.mark.trio
+async def test_block_batch_bounded_concurrency(alice_backend_sock, backend, realm):
+    running = 0
+    max_running = 0
+
+    def _track(fn):
+        async def wrapper(*args):
+            nonlocal running, max_running
+            running += 1
+            max_running = max(max_running, running)
+            try:
+                await trio.sleep(0.001)
+                return await fn(*args)
+            finally:
+                running -= 1
+
+        return wrapper
+
+    blockstore = backend.blockstore
+    blockstore.create = _track(blockstore.create)
+    blockstore.read = _track(blockstore.read)
+
+    blocks = [(uuid4(), f"block {i}".encode()) for i in range(3 * BLOCK_BATCH_MAX_CONCURRENCY)]
+    rep = await block_create_batch(alice_backend_sock, realm, blocks)
+    assert rep == {"status": "ok", "items": [{"status": "ok"}] * len(blocks)}
+    assert max_running == BLOCK_BATCH_MAX_CONCURRENCY
+
+    max_running = 0
+    rep = await block_read_batch(alice_backend_sock, [block_id for block_id, _ in blocks])
+    assert rep == {
+        "status": "ok",
+        "items": [{"status": "ok", "block": block} for _, block in blocks],
+    }
+    assert max_running == BLOCK_BATCH_MAX_CONCURRENCY
+
+
+@pytest.mark.trio
+async def test_block_batch_check_access_rights(backend, alice, bob, bob_backend_sock, realm, block):
+    # User not part of the realm
+    rep = await block_create_batch(bob_backend_sock, realm, [(uuid4(), BLOCK_DATA)])
+    assert rep == {"status": "not_allowed"}
+    rep = await block_read_batch(bob_backend_sock, [block])
+    assert rep == {"status": "ok", "items": [{"status": "not_allowed", "block": None}]}
+
+    # Reader can only read
+    await backend.realm.update_roles(
+        alice.organization_id,
+        RealmGrantedRole(
+            certificate=b"<dummy>",
+            realm_id=realm,
+            user_id=bob.user_id,
+            role=RealmRole.READER,
+            granted_by=alice.device_id,
+        ),
+    )
+    rep = await block_create_batch(bob_backend_sock, realm, [(uuid4(), BLOCK_DATA)])
+    assert rep == {"status": "not_allowed"}
+    rep = await block_read_batch(bob_backend_sock, [block])
+    assert rep == {"status": "ok", "items": [{"status": "ok", "block": BLOCK_DATA}]}
+
+
+@pytest.mark.trio
+@pytest.mark.raid1_blockstore
+async def test_raid1_block_create_and_read_batch(alice_backend_sock, realm, block):
+    await test_block_create_and_read_batch(alice_backend_sock, realm, block)
+
+
 @pytest.mark.trio
 @pytest.mark.raid1_blockstore
 async def test_raid1_block_create_and_read(alice_backend_sock, realm):
@@ -286,6 +382,132 @@ async def test_raid5_block_read_multiple_failure(
     )
 
 
+@pytest.mark.trio
+@pytest.mark.erasure_coding_blockstore
+async def test_erasure_coding_block_create_and_read(alice_backend_sock, realm):
+    await test_block_create_and_read(alice_backend_sock, realm)
+
+
+@pytest.mark.trio
+@pytest.mark.erasure_coding_blockstore
+@pytest.mark.parametrize(
+    "failing_blockstores,read_blockstores",
+    [
+        # Data shards are fetched first, then one parity shard per failure
+        ((), [0, 1, 2]),
+        ((0,), [0, 1, 2, 3]),
+        ((1, 2), [0, 1, 2, 3, 4]),
+        ((0, 3), [0, 1, 2, 3, 4]),
+        ((3, 4), [0, 1, 2]),
+    ],
+)
+async def test_erasure_coding_block_read_partial_failure(
+    caplog, alice_backend_sock, alice, backend, block, failing_blockstores, read_blockstores
+):
+    reads = []
+
+    def _mock_read(blockstore_index, read):
+        async def mock_read(organization_id, id):
+            reads.append(blockstore_index)
+            await trio.sleep(0)
+            if blockstore_index in failing_blockstores:
+                raise BlockTimeoutError()
+            return await read(organization_id, id)
+
+        return mock_read
+
+    for i, blockstore in enumerate(backend.blockstore.blockstores):
+        blockstore.read = _mock_read(i, blockstore.read)
+    # Never hedge: a slow run must not trigger additional reads
+    backend.blockstore._latencies = NodesLatencyTracker(
+        len(backend.blockstore.blockstores), default_hedge_delay=math.inf
+    )
+
+    rep = await block_read(alice_backend_sock, block)
+    assert rep == {"status": "ok", "block": BLOCK_DATA}
+
+    assert sorted(reads) == read_blockstores
+    for failing_blockstore in set(failing_blockstores) & set(read_blockstores):
+        caplog.assert_occured(
+            f"[warning  ] Cannot reach erasure coding blockstore #{failing_blockstore} to "
+            f"read block {block} [parsec.backend.erasure_coding_blockstore]"
+        )
+
+
+@pytest.mark.trio
+@pytest.mark.erasure_coding_blockstore
+async def test_erasure_coding_block_read_slow_blockstore(
+    autojump_clock, alice_backend_sock, backend, block
+):
+    reads = []
+    unblock_slow_read = trio.Event()
+
+    def _mock_read(blockstore_index, read):
+        async def mock_read(organization_id, id):
+            reads.append(blockstore_index)
+            if blockstore_index == 1:
+                # Only the hedged read of a parity shard can complete the read
+                await unblock_slow_read.wait()
+            return await read(organization_id, id)
+
+        return mock_read
+
+    for i, blockstore in enumerate(backend.blockstore.blockstores):
+        blockstore.read = _mock_read(i, blockstore.read)
+
+    rep = await block_read(alice_backend_sock, block)
+    assert rep == {"status": "ok", "block": BLOCK_DATA}
+
+    assert sorted(reads) == [0, 1, 2, 3]
+
+
+@pytest.mark.trio
+@pytest.mark.erasure_coding_blockstore
+async def test_erasure_coding_block_read_multiple_failure(
+    caplog, alice_backend_sock, alice, backend, block
+):
+    async def mock_read(organization_id, id):
+        await trio.sleep(0)
+        raise BlockTimeoutError()
+
+    for i in (0, 2, 3):
+        backend.blockstore.blockstores[i].read = mock_read
+
+    rep = await block_read(alice_backend_sock, block)
+    assert rep == {"status": "timeout"}
+
+    caplog.assert_occured(
+        f"[error    ] Block {block} cannot be read: Too many failing "
+        "blockstores in the erasure coding cluster [parsec.backend.erasure_coding_blockstore]"
+    )
+
+
+@pytest.mark.trio
+@pytest.mark.erasure_coding_blockstore
+@pytest.mark.parametrize("failing_blockstores", [(0, 4), (0, 1, 2)])
+async def test_erasure_coding_block_create_failure(
+    caplog, alice_backend_sock, backend, realm, failing_blockstores
+):
+    async def mock_create(organization_id, id, block):
+        await trio.sleep(0)
+        raise BlockTimeoutError()
+
+    for i in failing_blockstores:
+        backend.blockstore.blockstores[i].create = mock_create
+
+    rep = await block_create(alice_backend_sock, BLOCK_ID, realm, BLOCK_DATA, check_rep=False)
+    if len(failing_blockstores) <= 2:
+        assert rep == {"status": "ok"}
+        rep = await block_read(alice_backend_sock, BLOCK_ID)
+        assert rep == {"status": "ok", "block": BLOCK_DATA}
+    else:
+        assert rep == {"status": "timeout"}
+        caplog.assert_occured(
+            f"[error    ] Block {BLOCK_ID} cannot be created: Too many failing blockstores "
+            "in the erasure coding cluster [parsec.backend.erasure_coding_blockstore]"
+        )
+
+
 @pytest.mark.parametrize(
     "bad_msg",
     [
@@ -408,3 +630,28 @@ def test_split_block(block, nb_blockstores):
         partial_chunks[missing] = None
         rebuilt = rebuild_block_from_chunks(partial_chunks, checksum_chunk)
         assert rebuilt == block
+
+
+@given(
+    block=st.binary(max_size=2 ** 8),
+    nb_data_shards=st.integers(min_value=1, max_value=8),
+    nb_parity_shards=st.integers(min_value=1, max_value=4),
+    data=st.data(),
+)
+def test_erasure_coding_shards(block, nb_data_shards, nb_parity_shards, data):
+    shards = split_block_in_shards(block, nb_data_shards)
+    assert len(shards) == nb_data_shards
+    shards += generate_parity_shards(shards, nb_parity_shards)
+    assert len({len(shard) for shard in shards}) == 1
+
+    # Any `nb_data_shards` shards are enough to rebuild the block
+    indexes = data.draw(
+        st.lists(
+            st.integers(min_value=0, max_value=len(shards) - 1),
+            min_size=nb_data_shards,
+            max_size=nb_data_shards,
+            unique=True,
+        )
+    )
+    available = {i: shards[i] for i in indexes}
+    assert rebuild_block_from_shards(available, nb_data_shards, nb_parity_shards) == block
@@ -15,7 +15,13 @@ from parsec.api.protocol import (
 from parsec.backend.realm import RealmGrantedRole
 
 from tests.common import freeze_time
-from tests.backend.conftest import vlob_create, vlob_update, vlob_read, vlob_list_versions
+from tests.backend.conftest import (
+    vlob_create,
+    vlob_update,
+    vlob_read,
+    vlob_read_batch,
+    vlob_list_versions,
+)
 
 
 VLOB_ID = UUID("00000000000000000000000000000001")
@@ -260,6 +266,72 @@ async def test_read_bad_version(alice_backend_sock, vlobs):
     assert rep == {"status": "bad_version"}
 
 
+@pytest.mark.trio
+async def test_read_batch(alice, alice_backend_sock, vlobs):
+    rep = await vlob_read_batch(
+        alice_backend_sock,
+        [
+            (vlobs[0], None, None),
+            (vlobs[1], None, None),
+            (VLOB_ID, None, None),
+            (vlobs[0], 1, None),
+            (vlobs[0], 3, None),
+            (vlobs[0], None, Pendulum(2000, 1, 2, 10)),
+            (vlobs[1], None, Pendulum(2000, 1, 3)),
+        ],
+    )
+    assert rep["status"] == "ok"
+    assert [item["status"] for item in rep["items"]] == [
+        "ok",
+        "ok",
+        "not_found",
+        "ok",
+        "bad_version",
+        "ok",
+        "bad_version",
+    ]
+    assert [(item["blob"], item["version"]) for item in rep["items"]] == [
+        (b"r:A b:1 v:2", 2),
+        (b"r:A b:2 v:1", 1),
+        (None, None),
+        (b"r:A b:1 v:1", 1),
+        (None, None),
+        (b"r:A b:1 v:1", 1),
+        (None, None),
+    ]
+    assert rep["items"][0]["author"] == alice.device_id
+    assert rep["items"][0]["timestamp"] == Pendulum(2000, 1, 3)
+
+
+@pytest.mark.trio
+async def test_read_batch_check_access_rights(backend, alice, bob, bob_backend_sock, realm, vlobs):
+    # Not part of the realm
+    rep = await vlob_read_batch(bob_backend_sock, [(vlobs[0], None, None)])
+    assert rep["items"][0]["status"] == "not_allowed"
+
+    await backend.realm.update_roles(
+        alice.organization_id,
+        RealmGrantedRole(
+            certificate=b"dummy",
+            realm_id=realm,
+            user_id=bob.user_id,
+            role=RealmRole.READER,
+            granted_by=alice.device_id,
+        ),
+    )
+    rep = await vlob_read_batch(bob_backend_sock, [(vlobs[0], None, None)])
+    assert rep["items"][0]["status"] == "ok"
+
+    rep = await vlob_read_batch(bob_backend_sock, [(vlobs[0], None, None)], encryption_revision=2)
+    assert rep["items"][0]["status"] == "bad_encryption_revision"
+
+
+@pytest.mark.trio
+async def test_read_batch_too_many_items(alice_backend_sock, vlobs):
+    rep = await vlob_read_batch(alice_backend_sock, [(vlobs[0], None, None)] * 1001)
+    assert rep["status"] == "bad_message"
+
+
 @pytest.mark.trio
 async def test_update_ok(alice_backend_sock, vlobs):
     await vlob_update(alice_backend_sock, vlobs[0], version=3, blob=b"Next version.")
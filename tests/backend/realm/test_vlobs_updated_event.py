@@ -7,7 +7,7 @@ from pendulum import Pendulum
 from parsec.api.protocol import RealmRole
 from parsec.backend.realm import RealmGrantedRole
 
-from tests.backend.test_events import events_subscribe, events_listen_nowait
+from tests.backend.test_events import events_subscribe, events_listen_nowait, events_listen_batch
 
 
 NOW = Pendulum(2000, 1, 1)
@@ -146,6 +146,72 @@ async def test_vlobs_updated_event_ok(
     ]
 
 
+@pytest.mark.trio
+async def test_vlobs_updated_event_coalesced_in_batch(
+    backend, alice_backend_sock, alice, alice2, realm
+):
+    await events_subscribe(alice_backend_sock)
+    # Coalescing is only enabled once the client use the batch command
+    rep = await events_listen_batch(alice_backend_sock)
+    assert rep == {"status": "ok", "events": [], "overflow": False}
+
+    with backend.event_bus.listen() as spy:
+        await backend.vlob.create(
+            organization_id=alice.organization_id,
+            author=alice2.device_id,
+            realm_id=realm,
+            encryption_revision=1,
+            vlob_id=VLOB_ID,
+            timestamp=NOW,
+            blob=b"v1",
+        )
+        await backend.vlob.create(
+            organization_id=alice.organization_id,
+            author=alice2.device_id,
+            realm_id=realm,
+            encryption_revision=1,
+            vlob_id=OTHER_VLOB_ID,
+            timestamp=NOW,
+            blob=b"v1",
+        )
+        for version in (2, 3):
+            await backend.vlob.update(
+                organization_id=alice.organization_id,
+                author=alice2.device_id,
+                encryption_revision=1,
+                vlob_id=VLOB_ID,
+                version=version,
+                timestamp=NOW,
+                blob=b"v%d" % version,
+            )
+        await spy.wait_with_timeout(
+            "realm.vlobs_updated", spy.partial_dict(realm_id=realm, src_id=VLOB_ID, src_version=3)
+        )
+
+    # Successive updates of the same vlob are merged into a single event
+    rep = await events_listen_batch(alice_backend_sock)
+    assert rep == {
+        "status": "ok",
+        "events": [
+            {
+                "event": "realm.vlobs_updated",
+                "realm_id": realm,
+                "checkpoint": 4,
+                "src_id": VLOB_ID,
+                "src_version": 3,
+            },
+            {
+                "event": "realm.vlobs_updated",
+                "realm_id": realm,
+                "checkpoint": 2,
+                "src_id": OTHER_VLOB_ID,
+                "src_version": 1,
+            },
+        ],
+        "overflow": False,
+    }
+
+
 @pytest.mark.trio
 async def test_vlobs_updated_event_handle_self_events(backend, alice_backend_sock, alice, realm):
     await events_subscribe(alice_backend_sock)
@@ -8,6 +8,7 @@ from async_generator import asynccontextmanager
 from parsec.api.protocol import (
     events_subscribe_serializer,
     events_listen_serializer,
+    events_listen_batch_serializer,
     ping_serializer,
 )
 
@@ -28,6 +29,16 @@ async def events_listen_nowait(sock):
     return events_listen_serializer.rep_loads(raw_rep)
 
 
+async def events_listen_batch(sock, wait=False, max_events=100):
+    await sock.send(
+        events_listen_batch_serializer.req_dumps(
+            {"cmd": "events_listen_batch", "wait": wait, "max_events": max_events}
+        )
+    )
+    raw_rep = await sock.recv()
+    return events_listen_batch_serializer.rep_loads(raw_rep)
+
+
 class Listen:
     def __init__(self):
         self.rep = None
@@ -101,6 +112,73 @@ async def test_event_resubscribe(backend, alice_backend_sock, alice2_backend_soc
     assert rep == {"status": "no_events"}
 
 
+@pytest.mark.trio
+async def test_events_listen_batch(backend, alice_backend_sock, alice2_backend_sock):
+    await events_subscribe(alice_backend_sock)
+
+    with backend.event_bus.listen() as spy:
+        await ping(alice2_backend_sock, "foo")
+        await ping(alice2_backend_sock, "bar")
+        await ping(alice2_backend_sock, "spam")
+
+        # No guarantees those events occur before the commands' return
+        await spy.wait_multiple_with_timeout(["pinged", "pinged", "pinged"])
+
+    rep = await events_listen_batch(alice_backend_sock, max_events=2)
+    assert rep == {
+        "status": "ok",
+        "events": [{"event": "pinged", "ping": "foo"}, {"event": "pinged", "ping": "bar"}],
+        "overflow": False,
+    }
+    rep = await events_listen_batch(alice_backend_sock, wait=True)
+    assert rep == {
+        "status": "ok",
+        "events": [{"event": "pinged", "ping": "spam"}],
+        "overflow": False,
+    }
+    rep = await events_listen_batch(alice_backend_sock)
+    assert rep == {"status": "ok", "events": [], "overflow": False}
+
+
+@pytest.mark.trio
+async def test_events_listen_batch_overflow(backend, alice_backend_sock, alice, alice2):
+    await events_subscribe(alice_backend_sock)
+    # Events are dropped once the client's queue (100 events) is full
+    with backend.event_bus.listen() as spy:
+        for i in range(150):
+            await backend.ping.ping(alice.organization_id, alice2.device_id, str(i))
+        await spy.wait_with_timeout("pinged", spy.partial_dict(ping="149"))
+
+    rep = await events_listen_batch(alice_backend_sock, max_events=1000)
+    assert rep["status"] == "ok"
+    assert rep["events"] == [{"event": "pinged", "ping": str(i)} for i in range(100)]
+    assert rep["overflow"] is True
+
+    # Overflow is only notified once
+    rep = await events_listen_batch(alice_backend_sock)
+    assert rep == {"status": "ok", "events": [], "overflow": False}
+
+
+@pytest.mark.trio
+async def test_events_unsubscribe_on_disconnection(backend, backend_sock_factory, alice, bob):
+    async with backend_sock_factory(backend, alice) as alice_sock:
+        async with backend_sock_factory(backend, bob) as bob_sock:
+            await events_subscribe(alice_sock)
+            await events_subscribe(bob_sock)
+            # Resubscribing should not register the client twice
+            await events_subscribe(bob_sock)
+            assert len(backend.events._organization_clients[alice.organization_id]) == 2
+
+        assert len(backend.events._organization_clients[alice.organization_id]) == 1
+        assert (alice.organization_id, bob.user_id) not in backend.events._user_clients
+        for clients in backend.events._realm_clients.values():
+            assert [client_ctx.device_id for client_ctx in clients.values()] == [alice.device_id]
+
+    assert not backend.events._organization_clients
+    assert not backend.events._user_clients
+    assert not backend.events._realm_clients
+
+
 @pytest.mark.trio
 @pytest.mark.postgresql
 async def test_cross_backend_event(backend_factory, backend_sock_factory, alice, bob):
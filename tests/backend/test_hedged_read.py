@@ -0,0 +1,134 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) AGPLv3 2019 Scille SAS
+
+import trio
+import pytest
+from uuid import uuid4
+
+from parsec.backend.block import BlockTimeoutError
+from parsec.backend.blockstore import NodesLatencyTracker
+from parsec.backend.memory import MemoryBlockStoreComponent
+from parsec.backend.raid1_blockstore import RAID1BlockStoreComponent
+from parsec.backend.erasure_coding_blockstore import ErasureCodingBlockStoreComponent
+
+
+BLOCK_DATA = b"Hodi ho !"
+
+
+class SlowBlockStore(MemoryBlockStoreComponent):
+    def __init__(self, latency):
+        super().__init__()
+        self.latency = latency
+        self.reads = 0
+        self.cancelled_reads = 0
+
+    async def read(self, organization_id, id):
+        self.reads += 1
+        try:
+            await trio.sleep(self.latency)
+        except trio.Cancelled:
+            self.cancelled_reads += 1
+            raise
+        return await super().read(organization_id, id)
+
+
+def test_latency_tracker():
+    tracker = NodesLatencyTracker(3, default_hedge_delay=0.05)
+    assert tracker.nodes_by_latency() == [0, 1, 2]
+    assert tracker.hedge_delay() == 0.05
+
+    for _ in range(20):
+        tracker.record(0, 0.1)
+        tracker.record(1, 0.01)
+        tracker.record(2, 0.02)
+    assert tracker.nodes_by_latency() == [1, 2, 0]
+    # Hedge delay is the 95th percentile of the cluster latencies
+    assert tracker.hedge_delay() == 0.1
+
+    # Failing node is pushed back
+    tracker.record_failure(1)
+    assert tracker.nodes_by_latency() == [2, 0, 1]
+
+    # Cancelled read only gives a lower bound of the latency
+    tracker.record_cancelled(2, 0.001)
+    assert tracker.latency(2) == pytest.approx(0.02)
+    tracker.record_cancelled(2, 1)
+    assert tracker.latency(2) > 0.02
+
+
+@pytest.mark.trio
+async def test_raid1_hedged_read(autojump_clock):
+    slow = SlowBlockStore(latency=10)
+    fast = SlowBlockStore(latency=0.01)
+    blockstore = RAID1BlockStoreComponent([slow, fast])
+    block_id = uuid4()
+    await blockstore.create("org", block_id, BLOCK_DATA)
+
+    # Both nodes of the pair are read at once, the slow one is never waited for
+    for _ in range(10):
+        start = trio.current_time()
+        assert await blockstore.read("org", block_id) == BLOCK_DATA
+        assert trio.current_time() - start < 0.1
+    assert fast.reads == 10
+    assert slow.reads == slow.cancelled_reads == 10
+
+
+@pytest.mark.trio
+async def test_raid1_hedged_read_more_nodes(autojump_clock):
+    blockstores = [SlowBlockStore(latency=10), SlowBlockStore(0.01), SlowBlockStore(0.02)]
+    blockstore = RAID1BlockStoreComponent(blockstores)
+    block_id = uuid4()
+    await blockstore.create("org", block_id, BLOCK_DATA)
+
+    # Latencies are unknown at first, so the slow node is read along with another one
+    assert await blockstore.read("org", block_id) == BLOCK_DATA
+    assert [b.reads for b in blockstores] == [1, 1, 0]
+    assert blockstores[0].cancelled_reads == 1
+
+    # Only two nodes are read each time, the slow one is never waited for
+    for _ in range(10):
+        start = trio.current_time()
+        assert await blockstore.read("org", block_id) == BLOCK_DATA
+        assert trio.current_time() - start < 0.1
+    assert sum(b.reads for b in blockstores) == 22
+    assert blockstores[0].reads == blockstores[0].cancelled_reads
+
+
+@pytest.mark.trio
+async def test_raid1_hedged_read_failure(autojump_clock):
+    failing = SlowBlockStore(latency=0.01)
+    ok = SlowBlockStore(latency=0.01)
+
+    async def failing_read(organization_id, id):
+        raise BlockTimeoutError()
+
+    failing.read = failing_read
+    blockstore = RAID1BlockStoreComponent([failing, ok])
+    block_id = uuid4()
+    await blockstore.create("org", block_id, BLOCK_DATA)
+
+    # Failure triggers an immediate read on the next node
+    start = trio.current_time()
+    assert await blockstore.read("org", block_id) == BLOCK_DATA
+    assert trio.current_time() - start == pytest.approx(0.01)
+
+
+@pytest.mark.trio
+async def test_erasure_coding_hedged_read(autojump_clock):
+    blockstores = [SlowBlockStore(latency=0.01) for _ in range(5)]
+    blockstores[1].latency = 10
+    blockstore = ErasureCodingBlockStoreComponent(blockstores, nb_parity_shards=2)
+    block_id = uuid4()
+    await blockstore.create("org", block_id, BLOCK_DATA)
+
+    start = trio.current_time()
+    assert await blockstore.read("org", block_id) == BLOCK_DATA
+    assert trio.current_time() - start < 0.1
+    assert [b.reads for b in blockstores] == [1, 1, 1, 1, 0]
+    assert blockstores[1].cancelled_reads == 1
+
+    # The slow node is avoided from now on
+    for _ in range(10):
+        start = trio.current_time()
+        assert await blockstore.read("org", block_id) == BLOCK_DATA
+        assert trio.current_time() - start < 0.1
+    assert blockstores[1].reads == 1
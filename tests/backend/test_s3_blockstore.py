@@ -1,5 +1,7 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) AGPLv3 2019 Scille SAS
 
+import time
+import threading
 from unittest.mock import Mock
 from unittest import mock
 
@@ -8,6 +10,7 @@ from botocore.exceptions import (
     EndpointConnectionError as S3EndpointConnectionError,
 )
 import pytest
+import trio
 
 from parsec.backend.s3_blockstore import S3BlockStoreComponent
 from parsec.backend.block import BlockAlreadyExistsError, BlockNotFoundError, BlockTimeoutError
@@ -28,6 +31,11 @@ async def test_s3_read():
         client_mock().get_object.side_effect = S3ClientError(
             error_response={"Error": {"Code": "404"}}, operation_name="GET"
         )
+        with pytest.raises(BlockNotFoundError):
+            assert await blockstore.read("org42", 123)
+        client_mock().get_object.side_effect = S3ClientError(
+            error_response={"Error": {"Code": "NoSuchKey"}}, operation_name="GET"
+        )
         with pytest.raises(BlockNotFoundError):
             assert await blockstore.read("org42", 123)
         # Connection error
@@ -86,3 +94,43 @@ async def test_s3_create():
         )
         with pytest.raises(BlockTimeoutError):
             await blockstore.create("org42", 123, "content")
+
+
+@pytest.mark.trio
+async def test_s3_timeout():
+    with mock.patch("boto3.client") as client_mock:
+        client_mock.return_value = Mock()
+        client_mock().head_bucket.return_value = True
+        blockstore = S3BlockStoreComponent("europe", "parsec", "john", "secret", timeout=0.01)
+        client_mock().get_object.side_effect = lambda **kwargs: time.sleep(0.5)
+        with pytest.raises(BlockTimeoutError):
+            await blockstore.read("org42", 123)
+
+
+@pytest.mark.trio
+async def test_s3_concurrency_limit():
+    with mock.patch("boto3.client") as client_mock:
+        client_mock.return_value = Mock()
+        client_mock().head_bucket.return_value = True
+        blockstore = S3BlockStoreComponent("europe", "parsec", "john", "secret", max_concurrency=2)
+        lock = threading.Lock()
+        running = 0
+        max_running = 0
+
+        def _get_object(**kwargs):
+            nonlocal running, max_running
+            with lock:
+                running += 1
+                max_running = max(running, max_running)
+            time.sleep(0.01)
+            with lock:
+                running -= 1
+            response_mock = Mock()
+            response_mock.read.return_value = "content"
+            return {"Body": response_mock}
+
+        client_mock().get_object.side_effect = _get_object
+        async with trio.open_nursery() as nursery:
+            for i in range(6):
+                nursery.start_soon(blockstore.read, "org42", i)
+        assert max_running == 2
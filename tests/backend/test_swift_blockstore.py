@@ -1,5 +1,6 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) AGPLv3 2019 Scille SAS
 
+import time
 from unittest.mock import Mock
 from unittest import mock
 import swiftclient
@@ -39,15 +40,36 @@ async def test_swift_post():
         connection_mock().head_container.return_value = True
         blockstore = SwiftBlockStoreComponent("http://url", "scille", "parsec", "john", "secret")
         # Ok
-        connection_mock().get_object.side_effect = ClientException(http_status=404, msg="")
+        connection_mock().head_object.side_effect = ClientException(http_status=404, msg="")
         await blockstore.create("org42", 123, "content")
         connection_mock().put_object.assert_called_with("parsec", "org42/123", "content")
+        connection_mock().get_object.assert_not_called()
+        connection_mock().put_object.reset_mock()
         # Already exists
-        connection_mock().get_object.side_effect = None
-        connection_mock().get_object.return_value = True, "content"
+        connection_mock().head_object.side_effect = None
+        connection_mock().head_object.return_value = {}
         with pytest.raises(BlockAlreadyExistsError):
             await blockstore.create("org42", 123, "content")
+        connection_mock().put_object.assert_not_called()
         # Other exception
-        connection_mock().get_object.side_effect = ClientException(http_status=500, msg="")
+        connection_mock().head_object.side_effect = ClientException(http_status=500, msg="")
         with pytest.raises(BlockTimeoutError):
             await blockstore.create("org42", 123, "content")
+        # Connection error at PUT
+        connection_mock().head_object.side_effect = ClientException(http_status=404, msg="")
+        connection_mock().put_object.side_effect = ConnectionError()
+        with pytest.raises(BlockTimeoutError):
+            await blockstore.create("org42", 123, "content")
+
+
+@pytest.mark.trio
+async def test_swift_timeout():
+    with mock.patch("swiftclient.Connection") as connection_mock:
+        connection_mock.return_value = Mock()
+        connection_mock().head_container.return_value = True
+        blockstore = SwiftBlockStoreComponent(
+            "http://url", "scille", "parsec", "john", "secret", timeout=0.01
+        )
+        connection_mock().get_object.side_effect = lambda *args: time.sleep(0.5)
+        with pytest.raises(BlockTimeoutError):
+            await blockstore.read("org42", 123)
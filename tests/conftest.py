@@ -40,6 +40,7 @@ from parsec.backend.config import (
     RAID0BlockStoreConfig,
     RAID1BlockStoreConfig,
     RAID5BlockStoreConfig,
+    ErasureCodingBlockStoreConfig,
 )
 
 
@@ -378,14 +379,20 @@ def persistent_mockup(monkeypatch):
         storage_set.add(storage)
         return mockup_context.get(storage.path)
 
+    async def _create_reader_connection(storage):
+        # Everything runs in the trio thread, so the readers
+        # can simply share the writer connection
+        return mockup_context.get(storage.path)
+
     async def _close(storage):
         # Idempotent operation
         storage_set.discard(storage)
         storage._conn = None
+        storage._reader_conns.clear()
 
     @asynccontextmanager
     async def thread_pool_runner(max_workers):
-        assert max_workers == 1
+        assert max_workers >= 1
 
         async def run_in_thread(fn, *args):
             return fn(*args)
@@ -394,6 +401,7 @@ def persistent_mockup(monkeypatch):
 
     monkeypatch.setattr(local_database, "thread_pool_runner", thread_pool_runner)
     monkeypatch.setattr(LocalDatabase, "_create_connection", _create_connection)
+    monkeypatch.setattr(LocalDatabase, "_create_reader_connection", _create_reader_connection)
     monkeypatch.setattr(LocalDatabase, "_close", _close)
 
     yield mockup_context
@@ -444,6 +452,10 @@ def blockstore(request, backend_store):
         config = RAID5BlockStoreConfig(
             blockstores=[config, MockedBlockStoreConfig(), MockedBlockStoreConfig()]
         )
+    if request.node.get_closest_marker("erasure_coding_blockstore"):
+        config = ErasureCodingBlockStoreConfig(
+            blockstores=[config, *[MockedBlockStoreConfig() for _ in range(4)]], nb_parity_shards=2
+        )
 
     return config
 
@@ -12,7 +12,9 @@ from parsec.core.backend_connection import (
     BackendNotAvailable,
     BackendConnectionRefused,
     backend_authenticated_cmds_factory,
+    cmds,
 )
+from parsec.core.backend_connection.transport import connect, TransportPipeline, TransportPool
 from parsec.api.protocol import ADMINISTRATION_CMDS, AUTHENTICATED_CMDS, ANONYMOUS_CMDS
 
 
@@ -237,6 +239,73 @@ async def test_events_listen_wait_has_watchdog(monkeypatch, mock_clock, running_
     assert events_listen_rep == {"status": "ok", "event": "pinged", "ping": "foo"}
 
 
+@pytest.mark.trio
+async def test_pipelined_requests(running_backend, alice, alice2):
+    transport = await connect(
+        alice.organization_addr, alice.device_id, alice.signing_key, pipelining=8
+    )
+    assert isinstance(transport, TransportPipeline)
+    try:
+        rep = await cmds.events_subscribe(transport)
+        assert rep == {"status": "ok"}
+
+        events_listen_rep = None
+
+        async def _events_listen(task_status=trio.TASK_STATUS_IGNORED):
+            nonlocal events_listen_rep
+            task_status.started()
+            events_listen_rep = await cmds.events_listen(transport, wait=True)
+
+        async with trio.open_nursery() as nursery:
+            await nursery.start(_events_listen)
+
+            # Requests are processed while `events_listen` is still pending
+            rep = await cmds.ping(transport, "foo")
+            assert rep == {"status": "ok", "pong": "foo"}
+            assert events_listen_rep is None
+
+            async with backend_authenticated_cmds_factory(
+                alice2.organization_addr, alice2.device_id, alice2.signing_key
+            ) as alice2_cmds:
+                await alice2_cmds.ping("bar")
+
+        assert events_listen_rep == {"status": "ok", "event": "pinged", "ping": "bar"}
+
+    finally:
+        await transport.aclose()
+
+
+@pytest.mark.trio
+async def test_pipelined_transport_shared_in_pool(running_backend, alice):
+    connections = 0
+
+    async def _connect():
+        nonlocal connections
+        connections += 1
+        return await connect(
+            alice.organization_addr, alice.device_id, alice.signing_key, pipelining=8
+        )
+
+    pool = TransportPool(_connect, max_pool=2)
+
+    async def _ping(ping):
+        async with pool.acquire() as transport:
+            rep = await cmds.ping(transport, ping)
+            assert rep == {"status": "ok", "pong": ping}
+
+    async with trio.open_nursery() as nursery:
+        for i in range(20):
+            nursery.start_soon(_ping, str(i))
+
+    # At most one connection per pool slot has been made before sharing one
+    assert connections <= 2
+    async with pool.acquire() as transport:
+        assert transport is pool._shared
+
+    async with pool.acquire(force_fresh=True) as fresh_transport:
+        assert fresh_transport is not pool._shared
+
+
 @pytest.mark.trio
 async def test_authenticated_cmds_has_right_methods(running_backend, alice):
     async with backend_authenticated_cmds_factory(
@@ -0,0 +1,111 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) AGPLv3 2019 Scille SAS
+
+import threading
+from pathlib import Path
+from functools import partial
+
+import trio
+import pytest
+
+from parsec.core.fs.storage import LocalDatabase
+
+
+def _create_table(cursor):
+    cursor.execute("CREATE TABLE items (value INTEGER)")
+
+
+def _insert(cursor, value):
+    cursor.execute("INSERT INTO items VALUES (?)", (value,))
+
+
+def _count(cursor):
+    cursor.execute("SELECT COUNT(*) FROM items")
+    result, = cursor.fetchone()
+    return result
+
+
+@pytest.fixture
+async def localdb(tmpdir):
+    async with LocalDatabase.run(Path(tmpdir) / "test.sqlite") as localdb:
+        await localdb.run_write(_create_table)
+        yield localdb
+
+
+@pytest.mark.trio
+async def test_read_uncommitted_changes(localdb):
+    await localdb.run_write(_insert, 1)
+    assert await localdb.run_read(_count) == 1
+
+    # Uncommitted changes are still visible
+    await localdb.run_write(_insert, 2, commit=False)
+    assert await localdb.run_read(_count) == 2
+
+    await localdb.commit()
+    assert await localdb.run_read(_count) == 2
+
+
+@pytest.mark.trio
+async def test_read_concurrently_with_write(localdb):
+    await localdb.run_write(_insert, 1)
+    write_started = threading.Event()
+    write_released = threading.Event()
+
+    def _blocking_insert(cursor):
+        _insert(cursor, 2)
+        write_started.set()
+        write_released.wait()
+
+    async with trio.open_nursery() as nursery:
+        nursery.start_soon(partial(localdb.run_write, _blocking_insert))
+        await trio.to_thread.run_sync(write_started.wait)
+
+        # Readers are not blocked by the ongoing write
+        with trio.fail_after(1):
+            assert await localdb.run_read(_count) == 1
+            assert localdb._lock.locked()
+        write_released.set()
+
+    assert await localdb.run_read(_count) == 2
+
+
+@pytest.mark.trio
+async def test_read_concurrently_with_uncommitted_write(localdb):
+    await localdb.run_write(_insert, 1, commit=False)
+    write_started = threading.Event()
+    write_released = threading.Event()
+
+    def _blocking_insert(cursor):
+        _insert(cursor, 3)
+        write_started.set()
+        write_released.wait()
+
+    # Pending changes are committed so the read is served by a reader connection
+    assert await localdb.run_read(_count) == 1
+    assert not localdb._pending_commit
+    assert len(localdb._reader_conns) == 1
+
+    await localdb.run_write(_insert, 2, commit=False)
+    assert await localdb.run_read(_count) == 2
+
+    async with trio.open_nursery() as nursery:
+        nursery.start_soon(partial(localdb.run_write, _blocking_insert, commit=False))
+        await trio.to_thread.run_sync(write_started.wait)
+
+        # Readers are not blocked by the ongoing write
+        with trio.fail_after(1):
+            assert await localdb.run_read(_count) == 2
+            assert localdb._lock.locked()
+        write_released.set()
+
+    assert localdb._pending_commit
+    assert await localdb.run_read(_count) == 3
+    assert not localdb._pending_commit
+
+
+@pytest.mark.trio
+async def test_no_reader(tmpdir):
+    async with LocalDatabase.run(Path(tmpdir) / "test.sqlite", max_readers=0) as localdb:
+        await localdb.run_write(_create_table)
+        await localdb.run_write(_insert, 1)
+        assert await localdb.run_read(_count) == 1
+        assert not localdb._reader_conns
@@ -2,10 +2,12 @@
 
 from pathlib import Path
 
+import trio
+import trio.testing
 import pytest
 from pendulum import now
 
-from parsec.core.fs.storage import WorkspaceStorage
+from parsec.core.fs.storage import WorkspaceStorage, BlockCacheManager
 from parsec.core.fs import FSError, FSInvalidFileDescriptor
 from parsec.core.fs.exceptions import FSLocalMissError
 from parsec.core.types import (
@@ -16,6 +18,8 @@ from parsec.core.types import (
     LocalFileManifest,
     EntryID,
     Chunk,
+    ChunkID,
+    BlockID,
 )
 
 
@@ -298,6 +302,43 @@ async def test_lock_manifest(tmpdir, alice, workspace_id):
             assert await aws.get_manifest(manifest.id) == m2
 
 
+@pytest.mark.trio
+async def test_shared_and_exclusive_locks(alice_workspace_storage):
+    aws = alice_workspace_storage
+    manifest = create_manifest(aws.device, LocalFileManifest)
+    await aws.set_manifest(manifest.id, manifest, check_lock_status=False)
+    events = []
+
+    async def _lock(name, shared, task_status=trio.TASK_STATUS_IGNORED):
+        async with aws.lock_manifest(manifest.id, shared=shared):
+            events.append(f"{name} acquired")
+            task_status.started()
+            await trio.sleep(0.01)
+            # Only the exclusive side allows to modify the entry
+            if not shared:
+                await aws.set_manifest(manifest.id, manifest)
+            else:
+                with pytest.raises(RuntimeError):
+                    await aws.set_manifest(manifest.id, manifest)
+        events.append(f"{name} released")
+
+    async with trio.open_nursery() as nursery:
+        # Shared locks are held concurrently
+        await nursery.start(_lock, "r1", True)
+        await nursery.start(_lock, "r2", True)
+        # The exclusive lock waits for the readers, and the next reader waits for it
+        nursery.start_soon(_lock, "w", False)
+        await trio.testing.wait_all_tasks_blocked()
+        nursery.start_soon(_lock, "r3", True)
+
+    assert events[:2] == ["r1 acquired", "r2 acquired"]
+    assert events.index("w acquired") > events.index("r2 released")
+    assert events.index("r3 acquired") > events.index("w released")
+
+    # Unused locks are reclaimed
+    assert aws.entry_locks == {}
+
+
 @pytest.mark.trio
 async def test_block_interface(alice_workspace_storage):
     data = b"0123456"
@@ -508,3 +549,200 @@ async def test_storage_file_tree(alice, tmpdir, workspace_id):
         assert aws.block_storage.path == block_sqlite_db
 
     assert set(path.iterdir()) == {manifest_sqlite_db, chunk_sqlite_db, block_sqlite_db}
+
+
+@pytest.mark.trio
+async def test_manifest_cache_eviction(tmpdir, alice, workspace_id):
+    manifests = [create_manifest(alice) for _ in range(4)]
+    async with WorkspaceStorage.run(
+        alice, tmpdir, workspace_id, manifest_cache_max_entries=2
+    ) as aws:
+
+        # Dirty manifests are never evicted
+        for manifest in manifests[:3]:
+            await aws.set_manifest(manifest.id, manifest, cache_only=True, check_lock_status=False)
+        stats = aws.get_manifest_cache_statistics()
+        assert stats.entries == 3
+        assert stats.evictions == 0
+
+        # Once flushed, the least recently used clean manifests get evicted
+        await aws.manifest_storage.get_manifest(manifests[0].id)
+        for manifest in manifests[:3]:
+            await aws.manifest_storage.ensure_manifest_persistent(manifest.id)
+        stats = aws.get_manifest_cache_statistics()
+        assert stats.entries == 2
+        assert stats.evictions == 1
+        assert manifests[0].id not in aws.manifest_storage._cache
+
+        # Evicted manifests are still available from the localdb
+        assert await aws.get_manifest(manifests[0].id) == manifests[0]
+        assert manifests[1].id not in aws.manifest_storage._cache
+        stats = aws.get_manifest_cache_statistics()
+        assert stats.hits == 1
+        assert stats.misses == 1
+        assert stats.evictions == 2
+        assert stats.entries == 2
+        assert stats.size > 0
+
+        # Byte budget
+        aws.manifest_storage.cache_max_bytes = 0
+        await aws.set_manifest(manifests[3].id, manifests[3], check_lock_status=False)
+        assert aws.get_manifest_cache_statistics().entries == 0
+        assert await aws.get_manifest(manifests[3].id) == manifests[3]
+
+
+@pytest.mark.trio
+async def test_manifest_cache_dirty_size(tmpdir, alice, workspace_id):
+    manifests = [create_manifest(alice) for _ in range(2)]
+    async with WorkspaceStorage.run(alice, tmpdir, workspace_id) as aws:
+        manifest_storage = aws.manifest_storage
+
+        # Dirty manifests are accounted for in the byte budget...
+        await aws.set_manifest(manifests[0].id, manifests[0], check_lock_status=False)
+        flushed_size = aws.get_manifest_cache_statistics().size
+        await aws.set_manifest(
+            manifests[1].id, manifests[1], cache_only=True, check_lock_status=False
+        )
+        dirty_size = aws.get_manifest_cache_statistics().size - flushed_size
+        assert dirty_size > 0
+
+        # ...so they cause the eviction of the clean ones
+        manifest_storage.cache_max_bytes = dirty_size
+        await aws.set_manifest(
+            manifests[1].id, manifests[1], cache_only=True, check_lock_status=False
+        )
+        stats = aws.get_manifest_cache_statistics()
+        assert stats.entries == 1
+        assert stats.size == dirty_size
+        assert manifests[0].id not in manifest_storage._cache
+
+
+@pytest.mark.trio
+async def test_block_cache_accounting(tmpdir, alice, workspace_id):
+    block_size = DEFAULT_BLOCK_SIZE
+    data = b"\x00" * block_size
+    chunks = [Chunk.new(0, block_size).evolve_as_block(data) for _ in range(3)]
+
+    async with WorkspaceStorage.run(alice, tmpdir, workspace_id, cache_size=2 * block_size) as aws:
+        block_storage = aws.block_storage
+        await aws.set_clean_block(chunks[0].access.id, data)
+        await aws.set_clean_block(chunks[1].access.id, data)
+        assert await block_storage.get_nb_blocks() == 2
+        total_size = await block_storage.get_total_size()
+        assert total_size > 2 * block_size
+
+        # Overwriting a block doesn't change the count
+        await aws.set_clean_block(chunks[1].access.id, data)
+        assert await block_storage.get_nb_blocks() == 2
+        assert await block_storage.get_total_size() == total_size
+
+        # Reads are buffered in memory...
+        assert await aws.get_chunk(chunks[0].id) == data
+        assert list(block_storage._pending_accesses) == [chunks[0].id]
+
+        # ...but taken into account by the eviction
+        await aws.set_clean_block(chunks[2].access.id, data)
+        assert not block_storage._pending_accesses
+        assert await block_storage.is_chunk(chunks[0].id)
+        assert not await block_storage.is_chunk(chunks[1].id)
+        assert await block_storage.is_chunk(chunks[2].id)
+        assert await block_storage.get_nb_blocks() == 2
+
+        await aws.clear_clean_block(chunks[2].access.id)
+        assert await block_storage.get_nb_blocks() == 1
+        assert await block_storage.get_total_size() == total_size // 2
+
+    # Counters are restored on startup
+    async with WorkspaceStorage.run(alice, tmpdir, workspace_id) as aws:
+        assert await aws.block_storage.get_nb_blocks() == 1
+        assert await aws.block_storage.get_total_size() == total_size // 2
+
+
+@pytest.mark.trio
+async def test_block_cache_manager(tmpdir, alice):
+    block_size = DEFAULT_BLOCK_SIZE
+    data = b"\x00" * block_size
+    chunks = [Chunk.new(0, block_size).evolve_as_block(data) for _ in range(4)]
+    cache_size = 3 * block_size + 1024
+    manager = BlockCacheManager(cache_size=cache_size)
+    tmpdir = Path(tmpdir)
+
+    async with WorkspaceStorage.run(
+        alice, tmpdir / "w1", EntryID(), block_cache_manager=manager
+    ) as aws1:
+        async with WorkspaceStorage.run(
+            alice, tmpdir / "w2", EntryID(), block_cache_manager=manager
+        ) as aws2:
+            await aws1.set_clean_block(chunks[0].access.id, data)
+            await aws2.set_clean_block(chunks[1].access.id, data)
+            await aws1.set_clean_block(chunks[2].access.id, data)
+            assert manager.get_total_size() > 3 * block_size
+            assert manager.get_total_size() <= cache_size
+
+            # The least recently used blocks are evicted, whatever their workspace
+            assert await aws1.get_chunk(chunks[0].id) == data
+            await aws2.set_clean_block(chunks[3].access.id, data)
+            assert manager.get_total_size() <= cache_size - cache_size // 10
+            assert await aws1.block_storage.is_chunk(chunks[0].id)
+            assert not await aws2.block_storage.is_chunk(chunks[1].id)
+            assert not await aws1.block_storage.is_chunk(chunks[2].id)
+            assert await aws2.block_storage.is_chunk(chunks[3].id)
+
+        # Closed storages no longer count
+        assert manager.get_total_size() == await aws1.block_storage.get_total_size()
+
+
+@pytest.mark.trio
+async def test_offline_blocks(alice_workspace_storage):
+    aws = alice_workspace_storage
+    block_size = DEFAULT_BLOCK_SIZE
+    data = b"\x00" * block_size
+    chunks = [Chunk.new(0, block_size).evolve_as_block(data) for _ in range(4)]
+    aws.block_storage.cache_size = 2 * block_size + 1024
+
+    # Offline blocks must be downloaded first
+    missing = await aws.set_clean_blocks_offline([chunks[0].access.id], True)
+    assert missing == [chunks[0].access.id]
+
+    await aws.set_clean_block(chunks[0].access.id, data)
+    assert await aws.set_clean_blocks_offline([chunks[0].access.id], True) == []
+    assert await aws.block_storage.get_nb_blocks() == 0
+    assert await aws.block_storage.get_total_size() == 0
+
+    # Offline blocks are never evicted
+    for chunk in chunks[1:]:
+        await aws.set_clean_block(chunk.access.id, data)
+    assert await aws.block_storage.is_chunk(chunks[0].id)
+    assert not await aws.block_storage.is_chunk(chunks[1].id)
+    assert await aws.block_storage.get_nb_blocks() == 2
+
+    # Until they get back to the cache, as the least recently used block
+    await aws.set_clean_blocks_offline([chunks[0].access.id], False)
+    assert await aws.block_storage.get_nb_blocks() == 2
+    assert not await aws.block_storage.is_chunk(chunks[0].id)
+
+
+@pytest.mark.trio
+async def test_get_chunks(alice_workspace_storage, monkeypatch):
+    aws = alice_workspace_storage
+    monkeypatch.setattr("parsec.core.fs.storage.chunk_storage.SQLITE_MAX_VARIABLE_NUMBER", 2)
+    dirty_ids = [ChunkID() for _ in range(3)]
+    clean_ids = [ChunkID() for _ in range(3)]
+    missing_ids = [ChunkID() for _ in range(2)]
+    for i, chunk_id in enumerate(dirty_ids):
+        await aws.set_chunk(chunk_id, b"dirty %d" % i)
+    for i, chunk_id in enumerate(clean_ids):
+        await aws.set_clean_block(BlockID(chunk_id), b"clean %d" % i)
+    await aws.block_storage.flush_access_times()
+
+    chunk_ids = [missing_ids[0], *dirty_ids, *clean_ids, dirty_ids[0], missing_ids[1]]
+    chunks, missing = await aws.get_chunks(chunk_ids)
+    assert chunks == {
+        **{chunk_id: b"dirty %d" % i for i, chunk_id in enumerate(dirty_ids)},
+        **{chunk_id: b"clean %d" % i for i, chunk_id in enumerate(clean_ids)},
+    }
+    assert missing == missing_ids
+
+    # Accessing the blocks is registered for the garbage collection
+    assert set(aws.block_storage._pending_accesses) == set(clean_ids)
+    assert await aws.get_chunks([]) == ({}, [])
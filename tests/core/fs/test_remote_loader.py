@@ -0,0 +1,204 @@
+# Parsec Cloud (https://parsec.cloud) Copyright (c) AGPLv3 2019 Scille SAS
+
+import trio
+import pytest
+
+from parsec.crypto import SecretKey, HashDigest
+from parsec.api.data import BlockAccess
+from parsec.core.types import BlockID, ChunkID
+from parsec.core.fs.exceptions import FSRemoteBlockNotFound
+from parsec.core.fs.remote_loader import RemoteLoader, BLOCK_BATCH_ITEM_MAX_SIZE
+
+
+class BlockReadCmds:
+    def __init__(self):
+        self.blocks = {}
+        self.requests = []
+        self.batch_requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        # Older backends don't know about the batch commands
+        self.batch_supported = True
+
+    def add_block(self, data):
+        access = BlockAccess(
+            id=BlockID(),
+            key=SecretKey.generate(),
+            offset=0,
+            size=len(data),
+            digest=HashDigest.from_data(data),
+        )
+        self.blocks[access.id] = access.key.encrypt(data)
+        return access
+
+    async def block_read(self, block_id):
+        self.requests.append(block_id)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await trio.sleep(1)
+        finally:
+            self.in_flight -= 1
+        if block_id not in self.blocks:
+            return {"status": "not_found"}
+        return {"status": "ok", "block": self.blocks[block_id]}
+
+    async def block_read_batch(self, block_ids):
+        if not self.batch_supported:
+            return {"status": "unknown_command", "reason": "Unknown command"}
+        self.batch_requests.append(block_ids)
+        await trio.sleep(1)
+        items = []
+        for block_id in block_ids:
+            if block_id not in self.blocks:
+                items.append({"status": "not_found", "block": None})
+            else:
+                items.append({"status": "ok", "block": self.blocks[block_id]})
+        return {"status": "ok", "items": items}
+
+    async def block_create(self, block_id, realm_id, block):
+        self.requests.append(block_id)
+        if block_id in self.blocks:
+            return {"status": "already_exists"}
+        self.blocks[block_id] = block
+        return {"status": "ok"}
+
+    async def block_create_batch(self, realm_id, blocks):
+        if not self.batch_supported:
+            return {"status": "unknown_command", "reason": "Unknown command"}
+        self.batch_requests.append([block_id for block_id, _ in blocks])
+        items = []
+        for block_id, block in blocks:
+            if block_id in self.blocks:
+                items.append({"status": "already_exists"})
+            else:
+                self.blocks[block_id] = block
+                items.append({"status": "ok"})
+        return {"status": "ok", "items": items}
+
+
+@pytest.fixture
+def block_read_cmds():
+    return BlockReadCmds()
+
+
+@pytest.fixture
+def remote_loader_factory(alice, alice_transaction_local_storage, block_read_cmds):
+    def _remote_loader_factory(**kwargs):
+        return RemoteLoader(
+            alice,
+            alice_transaction_local_storage.workspace_id,
+            None,
+            block_read_cmds,
+            None,
+            alice_transaction_local_storage,
+            **kwargs,
+        )
+
+    return _remote_loader_factory
+
+
+@pytest.mark.trio
+async def test_load_blocks_concurrently(
+    autojump_clock, remote_loader_factory, block_read_cmds, alice_transaction_local_storage
+):
+    remote_loader = remote_loader_factory(max_concurrent_downloads=3)
+    # Big enough for the blocks not to be downloaded in batches
+    blocks = [f"block {i}".encode().ljust(BLOCK_BATCH_ITEM_MAX_SIZE + 1) for i in range(10)]
+    accesses = [block_read_cmds.add_block(block) for block in blocks]
+
+    await remote_loader.load_blocks(accesses)
+    assert block_read_cmds.max_in_flight == 3
+    assert sorted(block_read_cmds.requests) == sorted(access.id for access in accesses)
+    assert not block_read_cmds.batch_requests
+    for block, access in zip(blocks, accesses):
+        data = await alice_transaction_local_storage.get_chunk(ChunkID(access.id))
+        assert data == block
+
+
+@pytest.mark.trio
+async def test_load_small_blocks_in_batch(
+    autojump_clock, remote_loader_factory, block_read_cmds, alice_transaction_local_storage
+):
+    remote_loader = remote_loader_factory()
+    big_access = block_read_cmds.add_block(b"big".ljust(BLOCK_BATCH_ITEM_MAX_SIZE + 1))
+    accesses = [block_read_cmds.add_block(f"block {i}".encode()) for i in range(10)]
+
+    await remote_loader.load_blocks([*accesses[:5], big_access, *accesses[5:]])
+    assert block_read_cmds.requests == [big_access.id]
+    assert block_read_cmds.batch_requests == [[access.id for access in accesses]]
+    for i, access in enumerate(accesses):
+        data = await alice_transaction_local_storage.get_chunk(ChunkID(access.id))
+        assert data == f"block {i}".encode()
+
+
+@pytest.mark.trio
+async def test_load_small_blocks_older_backend(
+    autojump_clock, remote_loader_factory, block_read_cmds, alice_transaction_local_storage
+):
+    remote_loader = remote_loader_factory()
+    block_read_cmds.batch_supported = False
+    accesses = [block_read_cmds.add_block(f"block {i}".encode()) for i in range(10)]
+
+    # The blocks are downloaded one by one instead
+    await remote_loader.load_blocks(accesses)
+    assert block_read_cmds.requests == [access.id for access in accesses]
+    for i, access in enumerate(accesses):
+        data = await alice_transaction_local_storage.get_chunk(ChunkID(access.id))
+        assert data == f"block {i}".encode()
+
+
+@pytest.mark.trio
+@pytest.mark.parametrize("batch_supported", [True, False])
+async def test_upload_small_blocks(
+    remote_loader_factory, block_read_cmds, alice_transaction_local_storage, batch_supported
+):
+    remote_loader = remote_loader_factory()
+    block_read_cmds.batch_supported = batch_supported
+    blocks = []
+    for i in range(10):
+        data = f"block {i}".encode()
+        access = BlockAccess(
+            id=BlockID(),
+            key=SecretKey.generate(),
+            offset=0,
+            size=len(data),
+            digest=HashDigest.from_data(data),
+        )
+        blocks.append((access, data))
+
+    await remote_loader.upload_blocks(blocks)
+    block_ids = [access.id for access, _ in blocks]
+    if batch_supported:
+        assert block_read_cmds.batch_requests == [block_ids]
+        assert not block_read_cmds.requests
+    else:
+        # The blocks are uploaded one by one instead
+        assert block_read_cmds.requests == block_ids
+    for access, data in blocks:
+        assert access.key.decrypt(block_read_cmds.blocks[access.id]) == data
+        assert await alice_transaction_local_storage.get_chunk(ChunkID(access.id)) == data
+
+
+@pytest.mark.trio
+async def test_load_blocks_deduplicate_in_flight_downloads(
+    autojump_clock, remote_loader_factory, block_read_cmds
+):
+    remote_loader = remote_loader_factory()
+    access = block_read_cmds.add_block(b"data")
+
+    async with trio.open_service_nursery() as nursery:
+        nursery.start_soon(remote_loader.load_blocks, [access])
+        nursery.start_soon(remote_loader.load_blocks, [access, access])
+    assert block_read_cmds.requests == [access.id]
+
+
+@pytest.mark.trio
+async def test_load_blocks_error(autojump_clock, remote_loader_factory, block_read_cmds):
+    remote_loader = remote_loader_factory()
+    accesses = [block_read_cmds.add_block(b"data") for _ in range(3)]
+    del block_read_cmds.blocks[accesses[1].id]
+
+    with pytest.raises(FSRemoteBlockNotFound):
+        await remote_loader.load_blocks(accesses)
+    assert not remote_loader._blocks_in_flight
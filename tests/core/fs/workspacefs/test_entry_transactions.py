@@ -125,6 +125,26 @@ async def test_file_create_delete(alice_entry_transactions, alice_sync_transacti
     assert not manifest.need_sync
 
 
+@pytest.mark.trio
+async def test_file_delete_with_buffered_write(alice_entry_transactions):
+    entry_transactions = alice_entry_transactions
+    local_storage = entry_transactions.local_storage
+
+    foo_id, fd = await entry_transactions.file_create(FsPath("/foo"))
+    await entry_transactions.fd_write(fd, b"hello", 0)
+    assert local_storage.chunk_buffers
+
+    # The buffered data of the unlinked file is dropped
+    await entry_transactions.file_delete(FsPath("/foo"))
+    assert not local_storage.chunk_buffers
+
+    # The file descriptor remains usable
+    assert await entry_transactions.fd_read(fd, -1, 0) == b"\x00" * 5
+    await entry_transactions.fd_write(fd, b"!", 5)
+    assert await entry_transactions.fd_read(fd, -1, 0) == b"\x00" * 5 + b"!"
+    await entry_transactions.fd_close(fd)
+
+
 @pytest.mark.trio
 async def test_rename_non_empty_folder(alice_entry_transactions):
     entry_transactions = alice_entry_transactions
@@ -172,6 +192,70 @@ async def test_cannot_replace_root(alice_entry_transactions):
         await entry_transactions.entry_rename(FsPath("/foo"), FsPath("/"))
 
 
+@pytest.mark.trio
+async def test_path_resolution_cache(alice_entry_transactions, monkeypatch):
+    entry_transactions = alice_entry_transactions
+    loaded = []
+    load_manifest = entry_transactions._load_manifest
+
+    async def _load_manifest(entry_id):
+        loaded.append(entry_id)
+        return await load_manifest(entry_id)
+
+    monkeypatch.setattr(entry_transactions, "_load_manifest", _load_manifest)
+    await entry_transactions.folder_create(FsPath("/a"))
+    b_id = await entry_transactions.folder_create(FsPath("/a/b"))
+    c_id = await entry_transactions.folder_create(FsPath("/a/b/c"))
+
+    # The ancestors are only loaded once
+    await entry_transactions.entry_info(FsPath("/a/b/c"))
+    loaded.clear()
+    await entry_transactions.entry_info(FsPath("/a/b/c"))
+    assert loaded == []
+
+    # Renaming invalidates the parent
+    await entry_transactions.entry_rename(FsPath("/a/b"), FsPath("/a/d"))
+    with pytest.raises(FileNotFoundError):
+        await entry_transactions.entry_info(FsPath("/a/b/c"))
+    assert (await entry_transactions.entry_info(FsPath("/a/d/c")))["id"] == c_id
+
+    # So do creating and deleting
+    loaded.clear()
+    await entry_transactions.folder_delete(FsPath("/a/d/c"))
+    with pytest.raises(FileNotFoundError):
+        await entry_transactions.entry_info(FsPath("/a/d/c"))
+    await entry_transactions.file_create(FsPath("/a/d/c"), open=False)
+    assert (await entry_transactions.entry_info(FsPath("/a/d/c")))["type"] == "file"
+    assert loaded.count(b_id) == 2
+
+
+@pytest.mark.trio
+async def test_entry_scandir(alice_entry_transactions):
+    entry_transactions = alice_entry_transactions
+    await entry_transactions.folder_create(FsPath("/a"))
+    await entry_transactions.file_create(FsPath("/c"), open=False)
+    b_id = await entry_transactions.folder_create(FsPath("/b"))
+
+    # Children are sorted and provided with the same stats as entry_info
+    stats = await entry_transactions.entry_scandir(FsPath("/"))
+    assert list(stats) == ["a", "b", "c"]
+    for name, stat in stats.items():
+        assert stat == await entry_transactions.entry_info(FsPath("/") / name)
+
+    with pytest.raises(NotADirectoryError):
+        await entry_transactions.entry_scandir(FsPath("/c"))
+    with pytest.raises(FileNotFoundError):
+        await entry_transactions.entry_scandir(FsPath("/dummy"))
+
+    # A child missing both locally and remotely is reported as such
+    async with entry_transactions.local_storage.lock_entry_id(b_id):
+        await entry_transactions.local_storage.clear_manifest(b_id)
+    stats = await entry_transactions.entry_scandir(FsPath("/"))
+    assert stats["b"] == {"type": "inconsistency", "id": b_id}
+    assert stats["a"]["type"] == "folder"
+    assert stats["c"]["type"] == "file"
+
+
 @pytest.mark.trio
 async def test_access_not_loaded_entry(alice, bob, alice_entry_transactions):
     entry_transactions = alice_entry_transactions
@@ -216,15 +300,6 @@ def expect_raises(expected, *args, **kwargs):
         yield
 
 
-def oracle_rename(src, dst):
-    """The oracle must behave differently than `src.rename`, as the
-    workspace file system does not support cross-directory renaming.
-    """
-    if src.parent != dst.parent:
-        raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
-    return src.rename(str(dst))
-
-
 @attr.s
 class PathElement:
     absolute_path = attr.ib()
@@ -366,7 +441,10 @@ def test_entry_transactions(
 
             expected_exc = None
             try:
-                oracle_rename(src.to_oracle(), dst.to_oracle())
+                # The root cannot be renamed, whatever the destination
+                if src.absolute_path == "/":
+                    raise PermissionError(errno.EACCES, os.strerror(errno.EACCES))
+                src.to_oracle().rename(str(dst.to_oracle()))
             except OSError as exc:
                 expected_exc = exc
 
@@ -5,6 +5,7 @@ from typing import Tuple
 from hypothesis import strategies
 from hypothesis.stateful import RuleBasedStateMachine, rule, invariant, run_state_machine_as_test
 
+from parsec.api.protocol import DeviceID
 from parsec.core.types import EntryID, ChunkID, Chunk, LocalFileManifest
 from parsec.core.fs.workspacefs.file_transactions import padded_data
 from parsec.core.fs.workspacefs.file_operations import (
@@ -33,6 +34,8 @@ class Storage(dict):
         self.pop(chunk_id)
 
     def read_chunk(self, chunk: Chunk) -> bytes:
+        if chunk.is_hole:
+            return b"\x00" * (chunk.stop - chunk.start)
         data = self.read_chunk_data(chunk.id)
         return data[chunk.start - chunk.raw_offset : chunk.stop - chunk.raw_offset]
 
@@ -87,6 +90,9 @@ class Storage(dict):
     def reshape(self, manifest: LocalFileManifest) -> LocalFileManifest:
 
         for source, destination, update, removed_ids in prepare_reshape(manifest):
+            if destination.is_hole:
+                manifest = update(manifest, destination)
+                continue
             data = self.build_data(source)
             new_chunk = destination.evolve_as_block(data)
             if source != (destination,):
@@ -151,8 +157,10 @@ def test_complete_scenario():
         assert storage.read(manifest, 40, 0) == expected
 
     (_, _, _, chunk7), (chunk8,) = manifest.blocks[1:]
-    assert storage[chunk7.id] == b"\x00" * 5
-    assert storage[chunk8.id] == b"\x00" * 8
+    assert chunk7 == Chunk.new_hole(27, 32).evolve(id=chunk7.id)
+    assert chunk8 == Chunk.new_hole(32, 40).evolve(id=chunk8.id)
+    assert chunk7.id not in storage
+    assert chunk8.id not in storage
     assert manifest == base.evolve(
         size=40,
         blocks=((chunk0, chunk1, chunk2), (chunk4, chunk5, chunk6, chunk7), (chunk8,)),
@@ -183,6 +191,36 @@ def test_complete_scenario():
     assert manifest == base.evolve(size=25, blocks=((chunk10,), (chunk11,)), updated=t7)
 
 
+def test_sparse_file():
+    storage = Storage()
+    manifest = LocalFileManifest.new_placeholder(parent=EntryID(), blocksize=16)
+
+    # Writing after the end of the file creates holes
+    manifest = storage.write(manifest, b"Hello", 40)
+    assert storage.read(manifest, 45, 0) == b"\x00" * 40 + b"Hello"
+    (hole0,), (hole1,), (hole2, chunk0) = manifest.blocks
+    assert all(hole.is_hole for hole in (hole0, hole1, hole2))
+    assert (hole2.start, hole2.stop) == (32, 40)
+    assert set(storage) == {chunk0.id}
+
+    # Only the block containing data is stored
+    manifest = storage.reshape(manifest)
+    assert manifest.is_reshaped()
+    (chunk1,), = manifest.blocks[2:]
+    assert storage[chunk1.id] == b"\x00" * 8 + b"Hello"
+
+    # Holes are not part of the remote manifest
+    remote = manifest.to_remote(author=DeviceID("a@b"))
+    assert remote.blocks == (chunk1.access,)
+    new_manifest = LocalFileManifest.from_remote(remote)
+    assert new_manifest.is_reshaped()
+    assert new_manifest.match_remote(remote)
+    assert storage.read(new_manifest, 45, 0) == b"\x00" * 40 + b"Hello"
+
+    # Local serialization
+    assert LocalFileManifest.load(manifest.dump()) == manifest
+
+
 @pytest.mark.slow
 def test_file_operations(hypothesis_settings, tmpdir):
     class FileOperations(RuleBasedStateMachine):
@@ -202,7 +240,9 @@ def test_file_operations(hypothesis_settings, tmpdir):
 
         @invariant()
         def leaks(self) -> None:
-            all_ids = {chunk.id for chunks in self.manifest.blocks for chunk in chunks}
+            all_ids = {
+                chunk.id for chunks in self.manifest.blocks for chunk in chunks if not chunk.is_hole
+            }
             assert set(self.storage) == all_ids
 
         @rule(size=size, offset=size)
@@ -15,7 +15,7 @@ from hypothesis import strategies as st
 from parsec.core.types import EntryID, LocalFileManifest, Chunk
 from parsec.core.fs.storage import WorkspaceStorage
 from parsec.core.fs.workspacefs.file_transactions import FSInvalidFileDescriptor
-from parsec.core.fs.exceptions import FSRemoteBlockNotFound
+from parsec.core.fs.exceptions import FSRemoteBlockNotFound, FSLocalMissError
 
 from tests.common import freeze_time, call_with_control
 
@@ -161,6 +161,100 @@ async def test_flush_file(alice_file_transactions, foo_txt):
     )
 
 
+@pytest.mark.trio
+async def test_coalesce_writes(alice_file_transactions, foo_txt):
+    file_transactions = alice_file_transactions
+    local_storage = file_transactions.local_storage
+    blocksize = foo_txt.fresh_manifest.blocksize
+
+    fd = foo_txt.open()
+    for i in range(8):
+        await file_transactions.fd_write(fd, bytes([i]) * 1024, i * 1024)
+
+    # A single chunk is kept in memory
+    manifest = await foo_txt.get_manifest()
+    assert manifest.size == 8 * 1024
+    (chunk,), = manifest.blocks
+    assert (chunk.start, chunk.stop) == (0, 8 * 1024)
+    with pytest.raises(FSLocalMissError):
+        await local_storage.get_dirty_chunk(chunk.id)
+
+    # The buffered data is readable from any file descriptor
+    fd2 = foo_txt.open()
+    data = await file_transactions.fd_read(fd2, 2048, 1024 * 3 + 512)
+    assert data == b"\x03" * 512 + b"\x04" * 1024 + b"\x05" * 512
+
+    # A non-contiguous write flushes the buffer
+    await file_transactions.fd_write(fd2, b"x", 0)
+    assert await local_storage.get_dirty_chunk(chunk.id)
+
+    # Completing the block flushes the buffer
+    await file_transactions.fd_write(fd, b"y" * 1024, 8 * 1024)
+    assert file_transactions._write_buffers
+    await file_transactions.fd_write(fd, b"z" * (blocksize - 9 * 1024), 9 * 1024)
+    assert not file_transactions._write_buffers
+
+    # Closing the file descriptor flushes the buffer
+    await file_transactions.fd_write(fd, b"end", blocksize)
+    manifest = await foo_txt.get_manifest()
+    (chunk,), = manifest.blocks[1:]
+    await file_transactions.fd_close(fd)
+    assert await local_storage.get_dirty_chunk(chunk.id) == b"end"
+
+    data = await file_transactions.fd_read(fd2, -1, 0)
+    expected = b"x" + b"\x00" * 1023 + b"".join(bytes([i]) * 1024 for i in range(1, 8))
+    expected += b"y" * 1024 + b"z" * (blocksize - 9 * 1024) + b"end"
+    assert data == expected
+    await file_transactions.fd_close(fd2)
+
+
+@pytest.mark.trio
+async def test_buffered_write_persisted_on_teardown(
+    alice, alice_backend_cmds, file_transactions_factory, persistent_mockup
+):
+    path = Path("/dummy")
+    workspace_id = EntryID()
+    manifest = LocalFileManifest.new_placeholder(parent=EntryID())
+
+    async with WorkspaceStorage.run(alice, path, workspace_id) as local_storage:
+        file_transactions = await file_transactions_factory(
+            alice, alice_backend_cmds, local_storage=local_storage
+        )
+        async with local_storage.lock_entry_id(manifest.id):
+            await local_storage.set_manifest(manifest.id, manifest)
+        fd = local_storage.create_file_descriptor(manifest)
+        await file_transactions.fd_write(fd, b"hello", 0)
+        await file_transactions.fd_write(fd, b" world", 5)
+        assert local_storage.chunk_buffers
+        # The file descriptor is never closed
+
+    # The manifest is persisted along with its buffered chunk
+    async with WorkspaceStorage.run(alice, path, workspace_id) as local_storage:
+        file_transactions = await file_transactions_factory(
+            alice, alice_backend_cmds, local_storage=local_storage
+        )
+        fd = local_storage.create_file_descriptor(await local_storage.get_manifest(manifest.id))
+        assert await file_transactions.fd_read(fd, -1, 0) == b"hello world"
+        await file_transactions.fd_close(fd)
+
+
+@pytest.mark.trio
+async def test_buffered_write_and_clear_memory_cache(alice_file_transactions, foo_txt):
+    file_transactions = alice_file_transactions
+    local_storage = file_transactions.local_storage
+
+    fd = foo_txt.open()
+    await file_transactions.fd_write(fd, b"hello", 0)
+    await local_storage.clear_memory_cache()
+    assert not local_storage.chunk_buffers
+
+    # The following write is not lost in a buffer no longer tracked
+    await file_transactions.fd_write(fd, b" world", 5)
+    await local_storage.clear_memory_cache()
+    assert await file_transactions.fd_read(fd, -1, 0) == b"hello world"
+    await file_transactions.fd_close(fd)
+
+
 @pytest.mark.trio
 async def test_block_not_loaded_entry(alice_file_transactions, foo_txt):
     file_transactions = alice_file_transactions
@@ -1,9 +1,12 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) AGPLv3 2019 Scille SAS
 
 from functools import partial
+import trio
 import pytest
 
-from parsec.core.types import FsPath
+from parsec.api.data import Manifest
+from parsec.core.types import FsPath, DEFAULT_BLOCK_SIZE
+from parsec.core.fs.workspacefs import workspacefs as workspacefs_module
 
 from tests.common import create_shared_workspace
 
@@ -93,3 +96,337 @@ async def test_sync_by_id_couple(alice_workspace, bob_workspace):
     expected = [FsPath("/a"), FsPath("/b")]
     assert await bob_workspace.listdir("/") == expected
     assert await alice_workspace.listdir("/") == expected
+
+
+@pytest.mark.trio
+async def test_upload_blocks_pipeline(alice_workspace, monkeypatch):
+    alice_workspace.upload_max_in_flight_bytes = 2 * DEFAULT_BLOCK_SIZE
+    data = b"".join(bytes([i]) * DEFAULT_BLOCK_SIZE for i in range(5)) + b"tail"
+    await alice_workspace.touch("/foo.txt")
+    await alice_workspace.write_bytes("/foo.txt", data)
+    foo_id = await alice_workspace.path_id("/foo.txt")
+
+    # Keep track of the concurrent uploads
+    vanilla_upload_block = alice_workspace.remote_loader.upload_block
+    in_flight = 0
+    max_in_flight = 0
+
+    async def _upload_block(access, data):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        try:
+            await trio.sleep(0.01)
+            await vanilla_upload_block(access, data)
+        finally:
+            in_flight -= 1
+
+    monkeypatch.setattr(alice_workspace.remote_loader, "upload_block", _upload_block)
+
+    with alice_workspace.event_bus.listen() as spy:
+        await alice_workspace.sync_by_id(foo_id)
+
+    # The amount of data in flight is bounded
+    assert max_in_flight == 2
+
+    # Progress is reported for each uploaded block
+    events = [event for event in spy.events if event.event == "fs.entry.upload_progress"]
+    assert len(events) == 6
+    assert [event.kwargs["id"] for event in events] == [foo_id] * 6
+    assert [event.kwargs["total_bytes"] for event in events] == [len(data)] * 6
+    uploaded = [event.kwargs["uploaded_bytes"] for event in events]
+    assert uploaded == sorted(uploaded)
+    assert uploaded[-1] == len(data)
+
+    # The file has been synchronized
+    assert await alice_workspace.read_bytes("/foo.txt") == data
+    info = await alice_workspace.path_info("/foo.txt")
+    assert not info["need_sync"]
+
+
+@pytest.mark.trio
+async def test_upload_blocks_batches(alice_workspace, monkeypatch):
+    # Full blocks are small enough to be batched, but only two at a time
+    monkeypatch.setattr(workspacefs_module, "BLOCK_BATCH_ITEM_MAX_SIZE", DEFAULT_BLOCK_SIZE)
+    monkeypatch.setattr(workspacefs_module, "BLOCK_BATCH_MAX_BYTES", 2 * DEFAULT_BLOCK_SIZE + 2)
+    alice_workspace.max_concurrent_uploads = 1
+    data = b"".join(bytes([i]) * DEFAULT_BLOCK_SIZE for i in range(5)) + b"tail"
+    await alice_workspace.touch("/foo.txt")
+    await alice_workspace.write_bytes("/foo.txt", data)
+    foo_id = await alice_workspace.path_id("/foo.txt")
+
+    # Keep track of the batches
+    vanilla_upload_blocks = alice_workspace.remote_loader.upload_blocks
+    batches = []
+
+    async def _upload_blocks(blocks):
+        batches.append([len(data) for _, data in blocks])
+        await trio.sleep(0.01)
+        await vanilla_upload_blocks(blocks)
+
+    monkeypatch.setattr(alice_workspace.remote_loader, "upload_blocks", _upload_blocks)
+    await alice_workspace.sync_by_id(foo_id)
+
+    # The blocks queued during an upload are batched, the ones that don't fit
+    # in a batch being left for the next one
+    assert [size for batch in batches for size in batch] == [DEFAULT_BLOCK_SIZE] * 5 + [4]
+    assert [DEFAULT_BLOCK_SIZE, DEFAULT_BLOCK_SIZE] in batches
+    assert all(sum(batch) <= 2 * DEFAULT_BLOCK_SIZE + 2 for batch in batches)
+    assert await alice_workspace.read_bytes("/foo.txt") == data
+
+
+@pytest.mark.trio
+async def test_sequential_read_readahead(alice_workspace, bob_workspace, monkeypatch):
+    data = b"".join(bytes([i]) * DEFAULT_BLOCK_SIZE for i in range(8))
+    await alice_workspace.touch("/foo.txt")
+    await alice_workspace.write_bytes("/foo.txt", data)
+    await alice_workspace.sync()
+    await bob_workspace.sync()
+
+    # Keep track of the downloads
+    remote_loader = bob_workspace.remote_loader
+    vanilla_load_block = remote_loader._load_block
+    downloaded = []
+
+    async def _load_block(access):
+        downloaded.append(access.offset // DEFAULT_BLOCK_SIZE)
+        await vanilla_load_block(access)
+
+    async def _wait_for_prefetch():
+        await trio.testing.wait_all_tasks_blocked()
+        while remote_loader._blocks_in_flight:
+            await trio.sleep(0.01)
+
+    monkeypatch.setattr(remote_loader, "_load_block", _load_block)
+    transactions = bob_workspace.transactions
+    step = DEFAULT_BLOCK_SIZE // 4
+
+    # Random reads do not trigger any prefetch
+    _, fd = await transactions.file_open(FsPath("/foo.txt"), "r")
+    for block in (5, 2):
+        offset = block * DEFAULT_BLOCK_SIZE + step
+        assert await transactions.fd_read(fd, step, offset) == data[offset : offset + step]
+        await _wait_for_prefetch()
+    assert downloaded == [5, 2]
+    await transactions.fd_close(fd)
+
+    # Sequential reads prefetch the following blocks with a growing window
+    _, fd = await transactions.file_open(FsPath("/foo.txt"), "r")
+    for offset in range(0, DEFAULT_BLOCK_SIZE, step):
+        assert await transactions.fd_read(fd, step, offset) == data[offset : offset + step]
+    await _wait_for_prefetch()
+    assert sorted(downloaded) == list(range(8))
+    await transactions.fd_close(fd)
+
+
+@pytest.mark.trio
+async def test_pin_folder(alice_workspace, bob_workspace, monkeypatch):
+    data = b"".join(bytes([i]) * DEFAULT_BLOCK_SIZE for i in range(3))
+    await alice_workspace.mkdir("/foo/bar", parents=True)
+    await alice_workspace.touch("/foo/a.txt")
+    await alice_workspace.touch("/foo/bar/b.txt")
+    await alice_workspace.write_bytes("/foo/a.txt", data)
+    await alice_workspace.write_bytes("/foo/bar/b.txt", data)
+    await alice_workspace.sync()
+    await bob_workspace.sync()
+
+    await bob_workspace.pin("/foo")
+    assert await bob_workspace.is_pinned("/foo/bar/b.txt")
+    assert not await bob_workspace.is_pinned("/")
+
+    # Reads in a pinned folder never hit the network
+    vanilla_load_blocks = bob_workspace.remote_loader.load_blocks
+    offline = True
+
+    async def load_blocks(accesses):
+        assert not (offline and accesses), "Unexpected download"
+        await vanilla_load_blocks(accesses)
+
+    monkeypatch.setattr(bob_workspace.remote_loader, "load_blocks", load_blocks)
+    assert await bob_workspace.read_bytes("/foo/a.txt") == data
+    assert await bob_workspace.read_bytes("/foo/bar/b.txt") == data
+
+    # New remote content is downloaded on sync
+    await alice_workspace.touch("/foo/bar/c.txt")
+    await alice_workspace.write_bytes("/foo/bar/c.txt", data)
+    await alice_workspace.sync()
+    offline = False
+    await bob_workspace.sync()
+    offline = True
+    assert await bob_workspace.read_bytes("/foo/bar/c.txt") == data
+
+    # Unpinned blocks go back to the cache
+    block_storage = bob_workspace.local_storage.block_storage
+    assert await block_storage.get_nb_blocks() == 0
+    await bob_workspace.unpin("/foo")
+    assert not await bob_workspace.is_pinned("/foo/bar/b.txt")
+    assert await block_storage.get_nb_blocks() == 9
+
+
+@pytest.mark.trio
+async def test_sync_cross_directory_rename(alice_workspace, bob_workspace):
+    await alice_workspace.mkdir("/foo/bar", parents=True)
+    await alice_workspace.touch("/foo/bar/a.txt")
+    await alice_workspace.write_bytes("/foo/bar/a.txt", b"abcde")
+    await alice_workspace.mkdir("/baz")
+    await alice_workspace.sync()
+    await bob_workspace.sync()
+    bar_id = await alice_workspace.path_id("/foo/bar")
+
+    await bob_workspace.rename("/foo/bar", "/baz/bar")
+    await bob_workspace.sync()
+    await alice_workspace.sync()
+
+    assert await alice_workspace.listdir("/foo") == []
+    assert await alice_workspace.path_id("/baz/bar") == bar_id
+    assert await alice_workspace.read_bytes("/baz/bar/a.txt") == b"abcde"
+    bar_manifest = await alice_workspace.local_storage.get_manifest(bar_id)
+    assert bar_manifest.parent == await alice_workspace.path_id("/baz")
+    assert not bar_manifest.need_sync
+
+
+@pytest.mark.trio
+async def test_copyfile_shares_blocks(alice_workspace, bob_workspace, monkeypatch):
+    data = b"".join(bytes([i]) * DEFAULT_BLOCK_SIZE for i in range(4))
+    await alice_workspace.touch("/foo.txt")
+    await alice_workspace.write_bytes("/foo.txt", data)
+    await alice_workspace.sync()
+    await bob_workspace.sync()
+
+    # Copying and synchronizing the copy does not transfer any block
+    async def fail(*args, **kwargs):
+        assert False, "Unexpected block transfer"
+
+    monkeypatch.setattr(bob_workspace.remote_loader, "_load_block", fail)
+    monkeypatch.setattr(bob_workspace.remote_loader, "upload_block", fail)
+    await bob_workspace.copyfile("/foo.txt", "/bar.txt")
+    await bob_workspace.sync()
+
+    await alice_workspace.sync()
+    assert await alice_workspace.read_bytes("/bar.txt") == data
+    foo_manifest = await alice_workspace.local_storage.get_manifest(
+        await alice_workspace.path_id("/foo.txt")
+    )
+    bar_manifest = await alice_workspace.local_storage.get_manifest(
+        await alice_workspace.path_id("/bar.txt")
+    )
+    assert bar_manifest.blocks == foo_manifest.blocks
+
+
+@pytest.mark.trio
+async def test_sync_sparse_file(alice_workspace, bob_workspace, monkeypatch):
+    uploaded = []
+    upload_block = alice_workspace.remote_loader.upload_block
+
+    async def _upload_block(access, data):
+        uploaded.append(access.offset)
+        await upload_block(access, data)
+
+    monkeypatch.setattr(alice_workspace.remote_loader, "upload_block", _upload_block)
+
+    # Only the blocks containing data are uploaded
+    await alice_workspace.touch("/foo.txt")
+    await alice_workspace.truncate("/foo.txt", 10 * DEFAULT_BLOCK_SIZE)
+    await alice_workspace.write_bytes("/foo.txt", b"a", 5 * DEFAULT_BLOCK_SIZE + 1, truncate=False)
+    await alice_workspace.sync()
+    assert uploaded == [5 * DEFAULT_BLOCK_SIZE]
+    manifest = await alice_workspace.local_storage.get_manifest(
+        await alice_workspace.path_id("/foo.txt")
+    )
+    assert manifest.is_reshaped()
+    assert len(manifest.base.blocks) == 1
+
+    # The sparse manifest has its own type, so the clients expecting an access
+    # for each block reject it instead of misplacing the blocks
+    assert manifest.base.SERIALIZER.dump(manifest.base)["type"] == "sparse_file_manifest"
+    raw = manifest.base.SERIALIZER.dumps(manifest.base)
+    assert Manifest.SERIALIZER.loads(raw) == manifest.base
+
+    # The holes are restored from the remote manifest
+    await bob_workspace.sync()
+    data = await bob_workspace.read_bytes("/foo.txt")
+    expected = bytearray(10 * DEFAULT_BLOCK_SIZE)
+    expected[5 * DEFAULT_BLOCK_SIZE + 1] = ord("a")
+    assert data == expected
+
+
+@pytest.mark.trio
+async def test_path_resolution_after_downsync(alice_workspace, bob_workspace):
+    await alice_workspace.mkdir("/foo")
+    await alice_workspace.touch("/foo/bar.txt")
+    await alice_workspace.sync()
+    await bob_workspace.sync()
+    assert await bob_workspace.exists("/foo/bar.txt")
+
+    # The remote changes are visible through the cached paths
+    await alice_workspace.rename("/foo/bar.txt", "/foo/baz.txt")
+    await alice_workspace.sync()
+    await bob_workspace.sync()
+    assert not await bob_workspace.exists("/foo/bar.txt")
+    assert await bob_workspace.exists("/foo/baz.txt")
+
+
+@pytest.mark.trio
+async def test_scandir_downloads_missing_children(alice_workspace, bob_workspace, monkeypatch):
+    await alice_workspace.mkdir("/foo")
+    for name in ("a", "b", "c"):
+        await alice_workspace.touch(f"/foo/{name}.txt")
+    await alice_workspace.sync()
+    await bob_workspace.sync()
+
+    remote_loader = bob_workspace.remote_loader
+    batches = []
+    load_manifests = remote_loader.load_manifests
+
+    async def _load_manifests(entry_ids):
+        batches.append(entry_ids)
+        return await load_manifests(entry_ids)
+
+    monkeypatch.setattr(remote_loader, "load_manifests", _load_manifests)
+
+    # The children are fetched together, then served from the local storage
+    stats = await bob_workspace.scandir("/foo")
+    assert list(stats) == ["a.txt", "b.txt", "c.txt"]
+    assert all(stat["type"] == "file" for stat in stats.values())
+    assert len(batches) == 1
+    assert sorted(batches[0]) == sorted(stat["id"] for stat in stats.values())
+    assert await bob_workspace.scandir("/foo") == stats
+    assert len(batches) == 1
+
+
+@pytest.mark.trio
+async def test_sync_small_files_in_batch(alice_workspace, bob_workspace, monkeypatch):
+    requests = []
+    backend_cmds = alice_workspace.remote_loader.backend_cmds
+
+    def _record(cmd, fn):
+        async def _recorded(*args, **kwargs):
+            requests.append(cmd)
+            return await fn(*args, **kwargs)
+
+        return _recorded
+
+    for cmd in ("block_create", "block_create_batch"):
+        monkeypatch.setattr(backend_cmds, cmd, _record(cmd, getattr(backend_cmds, cmd)))
+
+    # The one-block files share the same request
+    for i in range(10):
+        await alice_workspace.touch(f"/foo{i}.txt")
+        await alice_workspace.write_bytes(f"/foo{i}.txt", f"data {i}".encode())
+    await alice_workspace.sync()
+    assert requests == ["block_create_batch"]
+
+    # Same thing when the files are synchronized one by one (i.e. by the sync monitor)
+    requests.clear()
+    entry_ids = []
+    for i in range(10):
+        await alice_workspace.write_bytes(f"/foo{i}.txt", f"new data {i}".encode())
+        entry_ids.append(await alice_workspace.path_id(f"/foo{i}.txt"))
+    await alice_workspace.upload_dirty_blocks(entry_ids)
+    for entry_id in entry_ids:
+        await alice_workspace.sync_by_id(entry_id, recursive=False)
+    assert requests == ["block_create_batch"]
+
+    await bob_workspace.sync()
+    for i in range(10):
+        assert await bob_workspace.read_bytes(f"/foo{i}.txt") == f"new data {i}".encode()
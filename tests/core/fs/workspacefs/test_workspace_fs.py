@@ -141,13 +141,55 @@ async def test_rename(alice_workspace):
     await alice_workspace.rename("/foz/bar", "/foz/bal")
     assert await alice_workspace.is_file("/foz/bal")
 
-    with pytest.raises(OSError) as context:
-        await alice_workspace.rename("/foz/baz", "/baz")
-    assert context.value.errno == errno.EXDEV
     with pytest.raises(FileNotFoundError):
         await alice_workspace.rename("/foo", "/fob")
 
 
+@pytest.mark.trio
+async def test_rename_cross_directory(alice_workspace):
+    await alice_workspace.write_bytes("/foo/bar", b"abcde")
+    await alice_workspace.mkdir("/foo/qux/quux", parents=True)
+    foo_id = await alice_workspace.path_id("/foo")
+    bar_id = await alice_workspace.path_id("/foo/bar")
+    qux_id = await alice_workspace.path_id("/foo/qux")
+    quux_id = await alice_workspace.path_id("/foo/qux/quux")
+
+    # Only the parents and the moved entry are modified
+    await alice_workspace.rename("/foo/qux", "/qux")
+    await alice_workspace.rename("/foo/bar", "/qux/quux/bar")
+    assert await alice_workspace.path_id("/qux") == qux_id
+    assert await alice_workspace.path_id("/qux/quux/bar") == bar_id
+    assert await alice_workspace.read_bytes("/qux/quux/bar") == b"abcde"
+    assert await alice_workspace.listdir("/foo") == [FsPath("/foo/baz")]
+    qux_manifest = await alice_workspace.local_storage.get_manifest(qux_id)
+    assert qux_manifest.parent == alice_workspace.workspace_id
+    assert qux_manifest.need_sync
+    bar_manifest = await alice_workspace.local_storage.get_manifest(bar_id)
+    assert bar_manifest.parent == quux_id
+
+    with pytest.raises(OSError) as context:
+        await alice_workspace.rename("/qux", "/qux/quux/qux")
+    assert context.value.errno == errno.EINVAL
+    with pytest.raises(FileExistsError):
+        await alice_workspace.rename("/foo/baz", "/qux/quux/bar", overwrite=False)
+    with pytest.raises(IsADirectoryError):
+        await alice_workspace.rename("/foo/baz", "/qux/quux")
+    with pytest.raises(OSError) as context:
+        await alice_workspace.rename("/qux/quux", "/foo")
+    assert context.value.errno == errno.ENOTEMPTY
+
+    # Overwrite a file
+    await alice_workspace.rename("/foo/baz", "/qux/quux/bar")
+    assert await alice_workspace.read_bytes("/qux/quux/bar") == b""
+    assert await alice_workspace.listdir("/foo") == []
+
+    # Overwrite an empty folder
+    await alice_workspace.rename("/qux/quux", "/foo")
+    assert await alice_workspace.path_id("/foo") == quux_id
+    assert await alice_workspace.path_id("/foo/bar") != bar_id
+    assert foo_id not in (await alice_workspace.path_info("/"))["children"]
+
+
 @pytest.mark.trio
 async def test_mkdir(alice_workspace):
     await alice_workspace.mkdir("/foz")
@@ -338,6 +380,20 @@ async def test_copyfile(alice_workspace):
     await alice_workspace.copyfile("/foo/bar", "/copied")
     assert await alice_workspace.read_bytes("/copied") == b"a" * 9000 + b"b" * 40000
 
+    # The dirty data is duplicated and the copy is independent from its source
+    await alice_workspace.write_bytes("/foo/bar", b"c" * 10)
+    assert await alice_workspace.read_bytes("/copied", size=10) == b"a" * 10
+    await alice_workspace.copyfile("/foo/bar", "/copied", exist_ok=True)
+    await alice_workspace.truncate("/foo/bar", 0)
+    assert await alice_workspace.read_bytes("/copied") == b"c" * 10
+
+    with pytest.raises(FileExistsError):
+        await alice_workspace.copyfile("/foo/bar", "/copied")
+    with pytest.raises(IsADirectoryError):
+        await alice_workspace.copyfile("/foo", "/copied2")
+    with pytest.raises(IsADirectoryError):
+        await alice_workspace.copyfile("/copied", "/foo", exist_ok=True)
+
 
 @pytest.mark.trio
 async def test_rmtree(alice_workspace):
@@ -1,6 +1,7 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) AGPLv3 2019 Scille SAS
 
 import pytest
+from pendulum import Pendulum
 from unittest.mock import ANY
 
 from parsec.core.types import FsPath
@@ -221,3 +222,48 @@ async def test_copyfile(alice_workspace_t3):
 async def test_rmtree(alice_workspace_t3):
     with pytest.raises(PermissionError):
         await alice_workspace_t3.rmtree("/foo")
+
+
+@pytest.mark.trio
+async def test_scandir(alice_workspace):
+    # The children are downloaded as they were at the given timestamp
+    workspace_t8 = await alice_workspace.to_timestamped(Pendulum(2000, 1, 8))
+    stats = await workspace_t8.scandir("/files")
+    assert list(stats) == ["renamed", "renamed_again"]
+    assert stats["renamed"]["size"] == 6
+    assert stats["renamed_again"]["size"] == 5
+
+    workspace_t10 = await alice_workspace.to_timestamped(Pendulum(2000, 1, 10))
+    stats = await workspace_t10.scandir("/moved")
+    assert list(stats) == ["content2", "renamed", "renamed_again"]
+    assert stats["content2"]["size"] == 5
+
+    # The current workspace is not affected
+    stats = await alice_workspace.scandir("/files")
+    assert list(stats) == ["content2", "renamed", "renamed_again"]
+    assert stats["renamed"]["size"] == 5
+
+
+@pytest.mark.trio
+async def test_scandir_older_backend(alice_workspace, monkeypatch):
+    backend_cmds = alice_workspace.remote_loader.backend_cmds
+    vlob_read_requests = []
+    vlob_read = backend_cmds.vlob_read
+
+    async def _vlob_read_batch(*args, **kwargs):
+        return {"status": "unknown_command", "reason": "Unknown command"}
+
+    async def _vlob_read(encryption_revision, vlob_id, *args, **kwargs):
+        vlob_read_requests.append(vlob_id)
+        return await vlob_read(encryption_revision, vlob_id, *args, **kwargs)
+
+    monkeypatch.setattr(backend_cmds, "vlob_read_batch", _vlob_read_batch)
+    monkeypatch.setattr(backend_cmds, "vlob_read", _vlob_read)
+
+    # The children are downloaded one by one instead
+    workspace_t8 = await alice_workspace.to_timestamped(Pendulum(2000, 1, 8))
+    stats = await workspace_t8.scandir("/files")
+    assert list(stats) == ["renamed", "renamed_again"]
+    assert stats["renamed"]["size"] == 6
+    assert stats["renamed_again"]["size"] == 5
+    assert {stats[name]["id"] for name in stats} <= set(vlob_read_requests)
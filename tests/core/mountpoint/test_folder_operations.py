@@ -1,7 +1,6 @@
 # Parsec Cloud (https://parsec.cloud) Copyright (c) AGPLv3 2019 Scille SAS
 
 import os
-import errno
 from pathlib import Path
 from string import ascii_lowercase
 
@@ -54,15 +53,6 @@ class expect_raises:
         return True
 
 
-def oracle_rename(src, dst):
-    """The oracle must behave differently than `src.rename`, as the
-    workspace file system does not support cross-directory renaming.
-    """
-    if src.parent != dst.parent:
-        raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
-    return src.rename(str(dst))
-
-
 @attr.s
 class PathElement:
     absolute_path = attr.ib()
@@ -190,7 +180,7 @@ def test_folder_operations(tmpdir, caplog, hypothesis_settings, mountpoint_servi
 
             expected_exc = None
             try:
-                oracle_rename(src.to_oracle(), dst.to_oracle())
+                src.to_oracle().rename(str(dst.to_oracle()))
             except OSError as exc:
                 expected_exc = exc
 
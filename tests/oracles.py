@@ -182,7 +182,8 @@ def oracle_fs_factory(tmpdir):
             if self._is_workspace(src) or self._is_workspace(dst):
                 return "invalid_path"
 
-            if src.parent != dst.parent:
+            # Entries cannot be moved to another workspace
+            if src.relative_to(self.root).parts[:1] != dst.relative_to(self.root).parts[:1]:
                 return "invalid_path"
 
             try:
@@ -201,8 +202,12 @@ def oracle_fs_factory(tmpdir):
                     entry = self.entries_stats.pop(child_src)
                     self.entries_stats[child_dst] = entry
 
-                # The parent is the only modified entry
+                # The parents are modified, as well as the entry itself if it
+                # has been moved to another folder
                 self.entries_stats[src.parent]["need_sync"] = True
+                if src.parent != dst.parent:
+                    self.entries_stats[dst.parent]["need_sync"] = True
+                    self.entries_stats[dst]["need_sync"] = True
 
             return "ok"
 
@@ -0,0 +1,76 @@
+#! /usr/bin/env python3
+# Parsec Cloud (https://parsec.cloud) Copyright (c) AGPLv3 2019 Scille SAS
+
+"""Micro-benchmark for the CPU offload pool.
+
+Encrypt, decrypt and hash blocks from several concurrent tasks, either inline
+(i.e. in the trio thread) or through `run_cpu_bound`, and report the throughput
+along with the latency of the trio event loop.
+"""
+
+import argparse
+from time import perf_counter
+
+import trio
+
+from parsec.crypto import SecretKey, HashDigest
+from parsec.utils import run_cpu_bound
+
+
+async def monitor_loop_latency(latencies, period=0.001):
+    while True:
+        start = perf_counter()
+        await trio.sleep(period)
+        latencies.append(perf_counter() - start - period)
+
+
+def process_block(key, data):
+    ciphered = key.encrypt(data)
+    block = key.decrypt(ciphered)
+    return HashDigest.from_data(block)
+
+
+async def bench(offload, block_size, nb_blocks, concurrency):
+    key = SecretKey.generate()
+    data = b"\x00" * block_size
+    latencies = []
+
+    async def worker(count):
+        for _ in range(count):
+            if offload:
+                await run_cpu_bound(process_block, key, data, size=len(data))
+            else:
+                process_block(key, data)
+            await trio.sleep(0)
+
+    async with trio.open_nursery() as monitor_nursery:
+        monitor_nursery.start_soon(monitor_loop_latency, latencies)
+        start = perf_counter()
+        async with trio.open_nursery() as nursery:
+            for _ in range(concurrency):
+                nursery.start_soon(worker, nb_blocks // concurrency)
+        duration = perf_counter() - start
+        monitor_nursery.cancel_scope.cancel()
+
+    latencies.sort()
+    throughput = block_size * nb_blocks / duration / 1024 / 1024
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+    max_latency = latencies[-1] * 1000 if latencies else 0
+    print(
+        f"{'offload' if offload else 'inline':<8} {throughput:8.1f} MB/s  "
+        f"loop latency p99={p99:6.2f}ms max={max_latency:6.2f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--block-size", type=int, default=512 * 1024)
+    parser.add_argument("--nb-blocks", type=int, default=512)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    for offload in (False, True):
+        trio.run(bench, offload, args.block_size, args.nb_blocks, args.concurrency)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#! /usr/bin/env python3
+# Parsec Cloud (https://parsec.cloud) Copyright (c) AGPLv3 2019 Scille SAS
+
+"""Micro-benchmark for the backend events routing.
+
+Subscribe a growing number of fake clients to the backend's `EventsComponent`
+(each one being part of a handful of realms of its organization), then report
+how many `realm.vlobs_updated` events per second can be dispatched to them.
+"""
+
+import argparse
+import random
+from uuid import uuid4
+from time import perf_counter
+
+import trio
+from structlog import get_logger
+
+from parsec.logging import configure_logging
+from parsec.event_bus import EventBus
+from parsec.api.protocol import OrganizationID, DeviceID
+from parsec.backend.events import EventsComponent
+
+
+class FakeRealmComponent:
+    def __init__(self):
+        self.realms_for_user = {}
+
+    async def get_realms_for_user(self, organization_id, user_id):
+        return self.realms_for_user[(organization_id, user_id)]
+
+
+class CountingSendChannel:
+    def __init__(self):
+        self.count = 0
+
+    def send_nowait(self, event_data):
+        self.count += 1
+
+
+class FakeClientContext:
+    def __init__(self, organization_id, device_id):
+        self.conn_id = uuid4().hex
+        self.logger = get_logger()
+        self.organization_id = organization_id
+        self.device_id = device_id
+        self.user_id = device_id.user_id
+        self.realms = set()
+        self.send_events_channel = CountingSendChannel()
+
+
+async def bench(nb_clients, nb_organizations, nb_realms, realms_per_client, nb_events):
+    event_bus = EventBus()
+    realm_component = FakeRealmComponent()
+    events = EventsComponent(realm_component, event_bus)
+
+    organizations = [OrganizationID(f"org{i}") for i in range(nb_organizations)]
+    realms = {org: [uuid4() for _ in range(nb_realms)] for org in organizations}
+    clients = []
+    for i in range(nb_clients):
+        organization_id = organizations[i % nb_organizations]
+        client_ctx = FakeClientContext(organization_id, DeviceID(f"user{i}@dev"))
+        realm_component.realms_for_user[(organization_id, client_ctx.user_id)] = {
+            realm_id: "OWNER"
+            for realm_id in random.sample(realms[organization_id], realms_per_client)
+        }
+        await events.api_events_subscribe(client_ctx, {"cmd": "events_subscribe"})
+        clients.append(client_ctx)
+
+    targets = [
+        (org, random.choice(realms[org])) for org in random.choices(organizations, k=nb_events)
+    ]
+    start = perf_counter()
+    for organization_id, realm_id in targets:
+        event_bus.send(
+            "realm.vlobs_updated",
+            organization_id=organization_id,
+            author=DeviceID("someone@dev"),
+            realm_id=realm_id,
+            checkpoint=1,
+            src_id=realm_id,
+            src_version=1,
+        )
+    duration = perf_counter() - start
+
+    delivered = sum(client_ctx.send_events_channel.count for client_ctx in clients)
+    print(
+        f"{nb_clients:>7} clients  {nb_events / duration:10.0f} events/s  "
+        f"{delivered / nb_events:6.1f} deliveries/event"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--nb-clients", type=int, nargs="+", default=[100, 1000, 5000, 10000, 20000]
+    )
+    parser.add_argument("--nb-organizations", type=int, default=10)
+    parser.add_argument("--nb-realms", type=int, default=200, help="per organization")
+    parser.add_argument("--realms-per-client", type=int, default=5)
+    parser.add_argument("--nb-events", type=int, default=10000)
+    args = parser.parse_args()
+    configure_logging("WARNING")
+    for nb_clients in args.nb_clients:
+        trio.run(
+            bench,
+            nb_clients,
+            args.nb_organizations,
+            args.nb_realms,
+            args.realms_per_client,
+            args.nb_events,
+        )
+
+
+if __name__ == "__main__":
+    main()
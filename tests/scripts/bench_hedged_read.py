@@ -0,0 +1,112 @@
+#! /usr/bin/env python3
+# Parsec Cloud (https://parsec.cloud) Copyright (c) AGPLv3 2019 Scille SAS
+
+"""Micro-benchmark for the hedged reads of the RAID1/erasure coding block stores.
+
+Simulate (in virtual time) a cluster of in-memory blockstores with random
+latencies, one of them being degraded, then compare the block read latency
+and the number of sub-reads per block read of the hedged strategy with the
+former ones (RAID1 querying all the nodes at once, erasure coding waiting for
+the data shards).
+"""
+
+import argparse
+import random
+from math import inf
+from uuid import uuid4
+
+import trio
+import trio.testing
+
+from parsec.backend.blockstore import NodesLatencyTracker
+from parsec.backend.memory import MemoryBlockStoreComponent
+from parsec.backend.raid1_blockstore import RAID1BlockStoreComponent
+from parsec.backend.erasure_coding_blockstore import ErasureCodingBlockStoreComponent
+
+
+class SimulatedBlockStore(MemoryBlockStoreComponent):
+    def __init__(self, median_latency, slow_ratio, slow_latency, seed):
+        super().__init__()
+        # One generator per node, so the latencies don't depend on the order
+        # in which trio schedules the concurrent reads
+        self.random = random.Random(seed)
+        self.median_latency = median_latency
+        self.slow_ratio = slow_ratio
+        self.slow_latency = slow_latency
+        self.reads = 0
+
+    async def read(self, organization_id, id):
+        self.reads += 1
+        latency = self.random.lognormvariate(0, 0.3) * self.median_latency
+        if self.random.random() < self.slow_ratio:
+            latency += self.slow_latency
+        await trio.sleep(latency)
+        return await super().read(organization_id, id)
+
+
+class FormerRAID1Tracker(NodesLatencyTracker):
+    # Query all the nodes at once
+    def hedge_delay(self):
+        return 0
+
+
+class FormerErasureCodingTracker(NodesLatencyTracker):
+    # Wait for the data shards, in order
+    def nodes_by_latency(self):
+        return list(range(len(self)))
+
+    def hedge_delay(self):
+        return inf
+
+
+async def bench(name, blockstore_cls, args, tracker_cls, nb_nodes, nb_reads):
+    nodes = [SimulatedBlockStore(0.010, 0.01, 0.2, seed=i) for i in range(nb_nodes)]
+    # Degraded node
+    nodes[0].median_latency = 0.050
+    nodes[0].slow_ratio = 0.2
+    blockstore = blockstore_cls(nodes, *args)
+    if tracker_cls:
+        blockstore._latencies = tracker_cls(nb_nodes)
+
+    block_id = uuid4()
+    await blockstore.create("org", block_id, b"\x00" * 1024)
+    durations = []
+    for _ in range(nb_reads):
+        start = trio.current_time()
+        await blockstore.read("org", block_id)
+        durations.append(trio.current_time() - start)
+
+    durations.sort()
+    p50 = durations[len(durations) // 2] * 1000
+    p99 = durations[int(len(durations) * 0.99)] * 1000
+    sub_reads = sum(node.reads for node in nodes) / nb_reads
+    print(f"{name:<24} p50={p50:6.1f}ms p99={p99:6.1f}ms  sub-reads/read={sub_reads:4.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--nb-reads", type=int, default=2000)
+    args = parser.parse_args()
+
+    for name, blockstore_cls, cls_args, tracker_cls, nb_nodes in (
+        ("raid1 (former)", RAID1BlockStoreComponent, (), FormerRAID1Tracker, 2),
+        ("raid1 (hedged)", RAID1BlockStoreComponent, (), None, 2),
+        ("raid1 x3 (former)", RAID1BlockStoreComponent, (), FormerRAID1Tracker, 3),
+        ("raid1 x3 (hedged)", RAID1BlockStoreComponent, (), None, 3),
+        ("ec 4+2 (former)", ErasureCodingBlockStoreComponent, (2,), FormerErasureCodingTracker, 6),
+        ("ec 4+2 (hedged)", ErasureCodingBlockStoreComponent, (2,), None, 6),
+    ):
+        trio.run(
+            bench,
+            name,
+            blockstore_cls,
+            cls_args,
+            tracker_cls,
+            nb_nodes,
+            args.nb_reads,
+            clock=trio.testing.MockClock(autojump_threshold=0),
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#! /usr/bin/env python3
+# Parsec Cloud (https://parsec.cloud) Copyright (c) AGPLv3 2019 Scille SAS
+
+"""Micro-benchmark for the local database.
+
+Measure the latency of the trio event loop while a large file is written
+to (then read from) the workspace storage, concurrently with many small reads.
+"""
+
+import argparse
+from time import perf_counter
+from tempfile import mkdtemp
+from pathlib import Path
+
+import trio
+
+from parsec.crypto import SigningKey
+from parsec.api.protocol import DeviceID, OrganizationID
+from parsec.core.types import EntryID, ChunkID, BackendAddr, BackendOrganizationAddr
+from parsec.core.local_device import generate_new_device
+from parsec.core.fs.storage import WorkspaceStorage
+
+
+def build_device():
+    organization_addr = BackendOrganizationAddr.build(
+        BackendAddr(hostname="example.com", port=9999, use_ssl=False),
+        OrganizationID("BenchOrg"),
+        SigningKey.generate().verify_key,
+    )
+    return generate_new_device(DeviceID("alice@dev1"), organization_addr)
+
+
+async def monitor_loop_latency(latencies, period=0.001):
+    while True:
+        start = perf_counter()
+        await trio.sleep(period)
+        latencies.append(perf_counter() - start - period)
+
+
+def report(name, latencies, duration):
+    latencies = sorted(latencies)
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    print(
+        f"{name:<8} {duration:7.2f}s  loop latency p50={p50:6.2f}ms "
+        f"p99={p99:6.2f}ms max={latencies[-1] * 1000:6.2f}ms"
+    )
+
+
+async def bench(path, file_size, chunk_size):
+    device = build_device()
+    chunk_ids = [ChunkID() for _ in range(file_size // chunk_size)]
+    data = b"\x00" * chunk_size
+
+    async with WorkspaceStorage.run(device, path, EntryID()) as aws:
+        for name, operation in (
+            ("write", lambda chunk_id: aws.set_chunk(chunk_id, data)),
+            ("commit", None),
+            ("read", aws.get_chunk),
+        ):
+            latencies = []
+            async with trio.open_nursery() as nursery:
+                nursery.start_soon(monitor_loop_latency, latencies)
+                start = perf_counter()
+                if operation is None:
+                    await aws.data_localdb.commit()
+                else:
+                    for chunk_id in chunk_ids:
+                        await operation(chunk_id)
+                duration = perf_counter() - start
+                nursery.cancel_scope.cancel()
+            if latencies:
+                report(name, latencies, duration)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--file-size", type=int, default=256 * 1024 * 1024)
+    parser.add_argument("--chunk-size", type=int, default=128 * 1024)
+    args = parser.parse_args()
+
+    workdir = Path(mkdtemp(prefix="parsec-bench-"))
+    print(f"Workdir: {workdir}")
+    trio.run(bench, workdir, args.file_size, args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()
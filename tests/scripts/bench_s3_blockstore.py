@@ -0,0 +1,129 @@
+#! /usr/bin/env python3
+# Parsec Cloud (https://parsec.cloud) Copyright (c) AGPLv3 2019 Scille SAS
+
+"""Micro-benchmark for the S3 block store.
+
+Start a minimal stand-in S3 server (in-memory objects, configurable latency)
+then create and read blocks from several concurrent tasks, either by calling
+boto3 directly in the trio thread (i.e. the former behavior) or through
+`S3BlockStoreComponent`, and report the throughput along with the latency of
+the trio event loop.
+"""
+
+import argparse
+import multiprocessing
+from time import perf_counter, sleep
+from uuid import uuid4
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import trio
+
+from parsec.backend.s3_blockstore import S3BlockStoreComponent
+
+
+class StandInS3Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    objects = {}
+    latency = 0
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body=b"", send_body=True):
+        sleep(self.latency)
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        path = self.path.split("?")[0]
+        if path.count("/") == 1 or path in self.objects:
+            self._reply(200, self.objects.get(path, b""), send_body=False)
+        else:
+            self._reply(404, send_body=False)
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path in self.objects:
+            self._reply(200, self.objects[path])
+        else:
+            self._reply(404, b"<Error><Code>NoSuchKey</Code></Error>")
+
+    def do_PUT(self):
+        path = self.path.split("?")[0]
+        self.objects[path] = self.rfile.read(int(self.headers["Content-Length"]))
+        self._reply(200)
+
+
+async def monitor_loop_latency(latencies, period=0.001):
+    while True:
+        start = perf_counter()
+        await trio.sleep(period)
+        latencies.append(perf_counter() - start - period)
+
+
+async def bench(inline, endpoint_url, block_size, nb_blocks, concurrency):
+    blockstore = S3BlockStoreComponent(
+        "region", "parsec", "key", "secret", endpoint_url, max_concurrency=concurrency
+    )
+    s3 = blockstore._s3
+    data = b"\x00" * block_size
+    ids = [uuid4() for _ in range(nb_blocks)]
+    latencies = []
+
+    async def worker(ids):
+        for id in ids:
+            if inline:
+                # Former behavior: synchronous calls in the trio thread
+                s3.put_object(Bucket="parsec", Key=f"org/{id}", Body=data)
+                s3.get_object(Bucket="parsec", Key=f"org/{id}")["Body"].read()
+            else:
+                await blockstore.create("org", id, data)
+                await blockstore.read("org", id)
+            await trio.sleep(0)
+
+    async with trio.open_nursery() as monitor_nursery:
+        monitor_nursery.start_soon(monitor_loop_latency, latencies)
+        start = perf_counter()
+        async with trio.open_nursery() as nursery:
+            for i in range(concurrency):
+                nursery.start_soon(worker, ids[i::concurrency])
+        duration = perf_counter() - start
+        monitor_nursery.cancel_scope.cancel()
+
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+    max_latency = latencies[-1] * 1000 if latencies else 0
+    print(
+        f"{'inline' if inline else 'worker':<8} {nb_blocks / duration:8.1f} blocks/s  "
+        f"loop latency p99={p99:7.2f}ms max={max_latency:7.2f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--block-size", type=int, default=64 * 1024)
+    parser.add_argument("--nb-blocks", type=int, default=256)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.005, help="Server latency (s)")
+    args = parser.parse_args()
+
+    # Serve from another process so the server doesn't compete for the GIL
+    StandInS3Handler.latency = args.latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInS3Handler)
+    server.daemon_threads = True
+    server_process = multiprocessing.Process(target=server.serve_forever, daemon=True)
+    server_process.start()
+    endpoint_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    try:
+        for inline in (True, False):
+            trio.run(bench, inline, endpoint_url, args.block_size, args.nb_blocks, args.concurrency)
+    finally:
+        server_process.terminate()
+
+
+if __name__ == "__main__":
+    main()
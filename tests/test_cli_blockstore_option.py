@@ -10,6 +10,7 @@ from parsec.backend.config import (
     S3BlockStoreConfig,
     SWIFTBlockStoreConfig,
     RAID0BlockStoreConfig,
+    ErasureCodingBlockStoreConfig,
 )
 
 
@@ -113,6 +114,21 @@ def test_parse_simple_raid():
     )
 
 
+def test_parse_erasure_coding():
+    config = _parse_blockstore_params(
+        ["ec2:0:MOCKED", "ec2:1:POSTGRESQL", "ec2:2:MOCKED", "ec2:3:MOCKED"]
+    )
+    assert config == ErasureCodingBlockStoreConfig(
+        blockstores=[
+            MockedBlockStoreConfig(),
+            PostgreSQLBlockStoreConfig(),
+            MockedBlockStoreConfig(),
+            MockedBlockStoreConfig(),
+        ],
+        nb_parity_shards=2,
+    )
+
+
 @pytest.mark.parametrize(
     "param",
     [
@@ -148,6 +164,8 @@ def test_invalid_mix_raid_params(param):
         ["raid0:1:MOCKED", "raid0:2:MOCKED"],  # Hole in the nodes
         ["raid0:0:MOCKED", "raid0:2:MOCKED"],  # Hole in the nodes
         ["raid0:0:MOCKED", "raid0:0:MOCKED"],  # Same node multiple times
+        ["ec0:0:MOCKED", "ec0:1:MOCKED"],  # No parity node
+        ["ec2:0:MOCKED", "ec2:1:MOCKED"],  # No data node
     ],
 )
 def test_bad_raid_params(params):
@@ -2,8 +2,9 @@
 
 import trio
 import pytest
+import threading
 
-from parsec.utils import start_task
+from parsec.utils import start_task, run_cpu_bound, CPU_OFFLOAD_THRESHOLD
 
 
 async def job(fail=0, task_status=trio.TASK_STATUS_IGNORED):
@@ -60,3 +61,30 @@ async def test_start_task_with_exception_after_started(autojump_clock):
             assert not status.finished
             await status.join()
             assert False  # pragma: no cover - gets cancelled
+
+
+@pytest.mark.trio
+async def test_run_cpu_bound():
+    main_thread = threading.get_ident()
+
+    # Small workloads stay in the trio thread
+    assert await run_cpu_bound(threading.get_ident, size=CPU_OFFLOAD_THRESHOLD - 1) == main_thread
+
+    # Large or unknown workloads go to a worker thread
+    assert await run_cpu_bound(threading.get_ident, size=CPU_OFFLOAD_THRESHOLD) != main_thread
+    assert await run_cpu_bound(threading.get_ident) != main_thread
+
+    # Exceptions are propagated
+    with pytest.raises(ZeroDivisionError):
+        await run_cpu_bound(lambda x: 1 / x, 0)
+
+    # Concurrent calls
+    async with trio.open_service_nursery() as nursery:
+        results = []
+
+        async def run(x):
+            results.append(await run_cpu_bound(pow, x, 2))
+
+        for x in range(10):
+            nursery.start_soon(run, x)
+    assert sorted(results) == [x ** 2 for x in range(10)]